@@ -0,0 +1,101 @@
+"""
+Benchmark of the HTML-to-text conversion used by EmailProcessor.
+
+Builds a corpus shaped like real mailbox HTML (table-based marketing mail with
+inline styles, receipts, reply chains with quoted blocks, plain notifications)
+and times the original BeautifulSoup get_text() conversion against html_to_text
+with each available engine:
+
+    cd smart-email-assistant/backend
+    python benchmarks/html_benchmark.py --copies 20
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import Settings
+from src.email import html_text
+
+STYLE = "<style>" + "".join(f".c{i}{{font-family:Arial;color:#{i:06x};padding:{i % 20}px}}" for i in range(400)) + "</style>"
+WORDS = "offer exclusive members today only free shipping new arrivals sale ends tonight shop now".split()
+
+def marketing_email(rng, products=360):
+    """~300 KB of nested layout tables, inline styles, spacer cells and tracking pixels."""
+    rows = []
+    for i in range(products):
+        text = ' '.join(rng.choice(WORDS) for _ in range(12))
+        rows.append(
+            f'<tr><td class="c{i % 400}" style="padding:0;margin:0"><table width="100%" cellpadding="0" cellspacing="0" border="0">'
+            f'<tr><td width="20" style="font-size:1px">&nbsp;</td><td><table><tr><td><a href="https://example.com/p/{i}?utm_source=mail">'
+            f'<img src="https://img.example.com/{i}.png" width="200" alt="Product {i}"></a></td></tr>'
+            f'<tr><td style="font-family:Arial,sans-serif;font-size:14px;line-height:20px;color:#333333">{text}</td></tr>'
+            f'<tr><td><span style="font-weight:bold">${rng.randint(5, 500)}.99</span>&nbsp;&zwnj;&nbsp;&zwnj;</td></tr></table></td>'
+            f'<td width="20">&nbsp;</td></tr></table></td></tr>'
+        )
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Sale</title>{STYLE}</head><body>'
+            f'<div style="display:none">{"&zwnj;&nbsp;" * 150}</div><center><table width="600">{"".join(rows)}</table></center>'
+            f'<img src="https://t.example.com/open.gif" width="1" height="1"><script>track()</script></body></html>')
+
+def receipt_email(rng):
+    items = ''.join(f'<tr><td>Item {i}</td><td>{rng.randint(1, 5)}</td><td>${rng.randint(1, 90)}.00</td></tr>' for i in range(25))
+    return f'<html><body><h2>Your receipt</h2><table border="1"><tr><th>Item</th><th>Qty</th><th>Price</th></tr>{items}</table><p>Thanks for your order.</p></body></html>'
+
+def reply_chain_email(rng, depth=6):
+    html = '<div>Sounds good, see you then.</div>'
+    for level in range(depth):
+        quoted = ' '.join(rng.choice(WORDS) for _ in range(40))
+        html += f'<div class="gmail_quote">On Mon, someone{level}@example.com wrote:<blockquote style="margin:0 0 0 .8ex;border-left:1px #ccc solid">{quoted}<br><br>'
+    return f'<html><body>{html}{"</blockquote></div>" * depth}</body></html>'
+
+def notification_email(rng):
+    return '<p>Hi,</p><p>Your build <b>#1234</b> passed.</p><p>-- <br>CI Bot</p>'
+
+def build_corpus(copies, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(copies):
+        corpus += [marketing_email(rng), receipt_email(rng), reply_chain_email(rng), notification_email(rng)]
+    return corpus
+
+def legacy(html):
+    """The conversion EmailProcessor used before html_to_text."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser').get_text(separator='\n')
+
+def time_engine(name, convert, corpus):
+    convert(corpus[0]) # Warm imports
+    started = time.perf_counter()
+    outputs = [convert(html) for html in corpus]
+    elapsed = time.perf_counter() - started
+    megabytes = sum(len(html) for html in corpus) / 1e6
+    chars = sum(len(text) for text in outputs) / len(outputs)
+    print(f"{name:<22} {elapsed * 1000 / len(corpus):8.2f} ms/doc {megabytes / elapsed:8.1f} MB/s {chars:9.0f} chars/doc")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=10, help="Copies of each corpus message")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.copies, args.seed)
+    print(f"Corpus: {len(corpus)} documents, {sum(len(h) for h in corpus) / 1e6:.1f} MB, "
+          f"largest {max(len(h) for h in corpus) / 1e3:.0f} KB\n")
+    if importlib.util.find_spec("bs4") is not None:
+        time_engine("bs4 get_text (legacy)", legacy, corpus)
+    else:
+        print("beautifulsoup4 is not installed; pip install .[benchmarks] to time the legacy conversion.")
+    Settings.HTML_TEXT_ENGINE = "html.parser"
+    time_engine("html_to_text html.parser", html_text.html_to_text, corpus)
+    Settings.HTML_TEXT_ENGINE = "auto"
+    if html_text.load_html_engine() == "lxml":
+        time_engine("html_to_text lxml", html_text.html_to_text, corpus)
+    else:
+        print("lxml is not installed; pip install lxml to benchmark the C-backed engine.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the keyword priority classification used by ThreadAnalyzer.
+
+Times the original per-keyword substring scans against the compiled
+KeywordMatcher on long email bodies, with the default keyword tiers and with
+large generated tiers (hundreds of keywords each):
+
+    cd smart-email-assistant/backend
+    python benchmarks/priority_benchmark.py --bodies 200 --body-words 5000 --keywords 300
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import Settings
+from src.email.keyword_matcher import KeywordMatcher
+
+WORDS = ("the project team update schedule review please see attached notes for details about next week "
+         "budget report draft plan call agenda client feedback status thanks regards").split()
+
+def legacy(subject, body, tiers):
+    """The per-keyword substring classification ThreadAnalyzer used before KeywordMatcher."""
+    subject_lower = subject.lower()
+    body_lower = body.lower()
+    for tier, keywords in tiers.items():
+        if any(keyword in subject_lower for keyword in keywords) or any(keyword in body_lower for keyword in keywords):
+            return tier
+    return "Low"
+
+def build_corpus(count, body_words, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        body = ' '.join(rng.choice(WORDS) for _ in range(body_words))
+        if i % 4 == 0: # A quarter of the bodies mention a keyword near the end
+            body += ' please follow up on this request'
+        elif i % 4 == 1: # ...and a quarter contain a word that only contains one
+            body += ' this part is unimportant'
+        corpus.append((f"Weekly update {i}", body))
+    return corpus
+
+def generated_tiers(per_tier, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    tiers = {}
+    for tier, known in Settings.PRIORITY_KEYWORDS.items():
+        generated = {''.join(rng.choice(letters) for _ in range(rng.randint(5, 12))) for _ in range(per_tier)}
+        tiers[tier] = list(known) + sorted(generated)
+    return tiers
+
+def check_scan(matcher, corpus):
+    """Fails if the prefiltered scan finds other matches than the regex alone on any email."""
+    for subject, body in corpus:
+        for text in (subject.lower(), body.lower()):
+            scanned = [(match.start(), match.group()) for match in matcher._scan(text)]
+            expected = [(match.start(), match.group()) for match in matcher._pattern.finditer(text)]
+            assert scanned == expected, f"prefiltered scan found {scanned[:5]}, the regex {expected[:5]}"
+
+def nested_tiers():
+    """Default tiers plus keywords that occur inside others ("port" in "report")."""
+    tiers = {tier: list(keywords) for tier, keywords in Settings.PRIORITY_KEYWORDS.items()}
+    tiers["High"] += ['port', 'view', 'date']
+    tiers["Medium"] += ['report', 'review', 'update']
+    return tiers
+
+def time_case(name, classify, corpus):
+    started = time.perf_counter()
+    tiers = [classify(subject, body) for subject, body in corpus]
+    elapsed = time.perf_counter() - started
+    megabytes = sum(len(subject) + len(body) for subject, body in corpus) / 1e6
+    print(f"{name:<34} {elapsed * 1000 / len(corpus):8.3f} ms/email {megabytes / elapsed:8.1f} MB/s "
+          f"{sum(tier != 'Low' for tier in tiers):6d} prioritized")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bodies', type=int, default=200, help="Emails in the corpus")
+    parser.add_argument('--body-words', type=int, default=5000, help="Words per email body")
+    parser.add_argument('--keywords', type=int, default=300, help="Generated keywords per tier for the large configuration")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.bodies, args.body_words, args.seed)
+    print(f"Corpus: {len(corpus)} emails, {sum(len(body) for _, body in corpus) / 1e6:.1f} MB of body text\n")
+    for label, tiers in (("default keywords", Settings.PRIORITY_KEYWORDS),
+                         ("nested keywords", nested_tiers()),
+                         (f"{args.keywords} keywords/tier", generated_tiers(args.keywords, args.seed))):
+        started = time.perf_counter()
+        matcher = KeywordMatcher(tiers)
+        print(f"{label}: compiled in {(time.perf_counter() - started) * 1000:.1f} ms")
+        check_scan(matcher, corpus)
+        time_case("  substring scans (legacy)", lambda subject, body: legacy(subject, body, tiers), corpus)
+        time_case("  KeywordMatcher", lambda subject, body: matcher.match(subject, body).tier, corpus)
+        print()
+
+if __name__ == '__main__':
+    main()
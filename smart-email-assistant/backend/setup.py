@@ -13,17 +13,22 @@ setup(
     package_dir={'': 'src'},
     install_requires=[
         'google-auth',
-        'google-api-python-client',
+        'google-api-python-client>=2.0', # 2.x bundles the static Gmail discovery document
         'google-generativeai',
         'fastapi',
         'pandas',
-        'beautifulsoup4',
         'python-dotenv',
         'pydantic',
         'uvicorn',
         'google-auth-oauthlib',
+        'httpx', # Async Gmail client with pooled connections
         'python-dateutil' # Added for date parsing in ThreadAnalyzer and DataProcessor
     ],
+    extras_require={
+        'fast': ['lxml'], # C-backed HTML-to-text conversion
+        'ml': ['numpy'], # Local priority classifier
+        'benchmarks': ['beautifulsoup4'], # Baseline conversion in benchmarks/html_benchmark.py
+    },
     entry_points={
         'console_scripts': [
             'smart-email-assistant-backend=smart_email_assistant.backend.src.main:main',
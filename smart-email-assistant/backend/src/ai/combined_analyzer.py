@@ -0,0 +1,93 @@
+import json
+from .gemini_client import GeminiClient
+from .prompt_builder import format_email_thread
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+PRIORITY_TIERS = ("High", "Medium", "Low")
+
+# Response schema of the combined prompt (the OpenAPI subset accepted by Gemini)
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "priority": {"type": "string", "description": "One of High, Medium or Low"},
+        "reply": {"type": "string"}
+    },
+    "required": ["summary", "reply"]
+}
+
+class CombinedAnalyzer:
+    """
+    Summarizes a thread, suggests its priority and drafts a reply with a single Gemini
+    call, so the thread text is sent once instead of once per prompt. The model is asked
+    for JSON matching RESPONSE_SCHEMA; a response that does not parse or validate is
+    reported as None and the caller falls back to Summarizer and ReplyGenerator.
+    """
+    def __init__(self, response_cache=None):
+        self.gemini_client = GeminiClient()
+        self.prompt_template = Settings.COMBINED_ANALYSIS_PROMPT
+        self.response_cache = response_cache # Optional ResponseCache shared with the summarizer and reply generator
+
+    async def analyze(self, email_thread: list, recipient: str, instructions: str = "Generate a professional and concise reply.", use_cache: bool = True):
+        """
+        Returns {"summary", "priority", "reply"} for a thread that needs a reply, or None
+        if Gemini gave no usable answer. "priority" is None unless the model suggested one
+        of PRIORITY_TIERS. With use_cache=False the response cache is not read.
+        """
+        thread_content, _ = format_email_thread(email_thread, "Combined prompt")
+
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key("combined", thread_content, self.prompt_template, instructions)
+            cached = await self.response_cache.get(cache_key, bypass=not use_cache)
+            if cached is not None:
+                logger.debug("Combined analysis served from the response cache (key %.12s)", cache_key)
+                analysis = self.parse_response(cached)
+                if analysis is not None:
+                    self._log_reply(email_thread, analysis, recipient)
+                    return analysis
+
+        prompt = self.prompt_template.format(email_thread=thread_content, instructions=instructions)
+        text = await self.gemini_client.generate_content(prompt, generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": RESPONSE_SCHEMA
+        })
+        analysis = self.parse_response(text)
+        if analysis is None:
+            thread_id = email_thread[-1].get('threadId', 'N/A') if email_thread else 'N/A'
+            logger.warning("Unusable combined analysis for thread %s: %.200r", thread_id, text)
+            return None
+        if cache_key is not None:
+            await self.response_cache.put(cache_key, "combined", text)
+        self._log_reply(email_thread, analysis, recipient)
+        return analysis
+
+    @staticmethod
+    def parse_response(text):
+        """Parses and validates a combined response; returns None if it is malformed."""
+        if not text:
+            return None
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        summary, reply = data.get('summary'), data.get('reply')
+        if not isinstance(summary, str) or not summary.strip() or not isinstance(reply, str) or not reply.strip():
+            return None
+        priority = data.get('priority')
+        if isinstance(priority, str):
+            priority = priority.strip().capitalize()
+        return {
+            "summary": summary.strip(),
+            "priority": priority if priority in PRIORITY_TIERS else None,
+            "reply": reply.strip()
+        }
+
+    @staticmethod
+    def _log_reply(email_thread, analysis, recipient):
+        # Assuming the last email in the thread is the one being replied to
+        original_email_id = email_thread[-1]['id'] if email_thread else 'N/A'
+        logger.log_response(original_email_id, analysis['reply'], recipient)
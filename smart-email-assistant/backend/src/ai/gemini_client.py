@@ -1,35 +1,81 @@
-import google.generativeai as genai
 from ..config.settings import Settings
 from ..auth.credentials_manager import CredentialsManager
 from ..utils.rate_limiter import RateLimiter
+from ..utils.latency_recorder import gemini_latency
 from ..utils.logger import logger
+from concurrent.futures import ThreadPoolExecutor
 import time
 import asyncio
 import random
 import re
 
+_executor = None # Threads that run the blocking Gemini SDK calls, shared by every GeminiClient
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=Settings.GEMINI_MAX_WORKERS, thread_name_prefix="gemini")
+    return _executor
+
+def shutdown_executor():
+    """Stops the Gemini worker threads; calls still queued are cancelled."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
 class GeminiClient:
     """
     Handles interactions with the Google Gemini API.
+    The SDK call blocks for the whole model latency, so it runs on a dedicated thread
+    pool (Settings.GEMINI_MAX_WORKERS threads) and the event loop keeps serving other
+    requests in the meantime.
     """
     def __init__(self):
         self.api_key = CredentialsManager().get_gemini_api_key()
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(Settings.GEMINI_MODEL)
+        self.model = None # Built on first use; importing google.generativeai is slow
         self.rate_limiter = RateLimiter(rate_limit=5, interval=60) # 5 calls per minute
 
-    async def generate_content(self, prompt: str, max_retries: int = 5):
+    def get_model(self):
+        """Imports the Gemini SDK and builds the configured model on first use."""
+        if self.model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self.model = genai.GenerativeModel(Settings.GEMINI_MODEL)
+        return self.model
+
+    async def generate_content(self, prompt: str, max_retries: int = 5, timeout: float = None, generation_config: dict = None):
         """
         Generates content using the configured Gemini model with retry logic.
+        Each attempt is abandoned after `timeout` seconds (Settings.GEMINI_TIMEOUT by
+        default); a timed-out call is not retried. Cancelling the awaiting task cancels
+        the call as well: a call still queued for a worker thread never starts, and one
+        already sent is bounded by the same timeout on the SDK side.
+        The latency of every attempt is recorded in gemini_latency. `generation_config`
+        is passed to the SDK as is, e.g. to ask for JSON matching a response schema.
         """
+        timeout = timeout or Settings.GEMINI_TIMEOUT
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(_get_executor(), self.get_model)
         for attempt in range(max_retries):
             await self.rate_limiter.wait_for_permission()
+            started = time.perf_counter()
             try:
-                response = self.model.generate_content(prompt)
-                return response.text
+                call = loop.run_in_executor(_get_executor(), self._generate, model, prompt, timeout, generation_config)
+                text = await asyncio.wait_for(call, timeout)
+                self._record(started, "ok")
+                return text
+            except asyncio.TimeoutError:
+                self._record(started, "timeout")
+                logger.warning("Gemini call timed out after %.0f seconds (Attempt %d/%d)", timeout, attempt + 1, max_retries)
+                return None
+            except asyncio.CancelledError:
+                self._record(started, "cancelled")
+                raise
             except Exception as e:
+                self._record(started, "error")
                 error_message = str(e)
-                print(f"Error generating content with Gemini API (Attempt {attempt + 1}/{max_retries}): {error_message}")
+                logger.warning("Error generating content with Gemini API (Attempt %d/%d): %s", attempt + 1, max_retries, error_message)
                 if "429" in error_message and attempt < max_retries - 1:
                     # Extract retry delay from error message if available, otherwise use exponential backoff
                     retry_delay_match = re.search(r"retry_delay \{\s*seconds: (\d+)", error_message)
@@ -37,8 +83,20 @@ class GeminiClient:
                         delay = int(retry_delay_match.group(1))
                     else:
                         delay = 2 ** attempt + random.uniform(0, 1)
-                    print(f"Retrying in {delay:.2f} seconds...")
+                    logger.info("Retrying in %.2f seconds...", delay)
                     await asyncio.sleep(delay)
                 else:
                     return None
         return None # All retries failed
+
+    @staticmethod
+    def _generate(model, prompt: str, timeout: float, generation_config: dict = None) -> str:
+        """The blocking SDK call, run on a worker thread."""
+        response = model.generate_content(prompt, generation_config=generation_config, request_options={'timeout': timeout})
+        return response.text
+
+    @staticmethod
+    def _record(started: float, outcome: str):
+        milliseconds = (time.perf_counter() - started) * 1000
+        gemini_latency.record(milliseconds, outcome)
+        logger.debug("Gemini call finished in %.0f ms (%s)", milliseconds, outcome)
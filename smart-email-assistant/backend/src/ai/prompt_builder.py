@@ -0,0 +1,37 @@
+from ..config.settings import Settings
+from ..email.body_cleaner import estimate_tokens
+from ..email.email_processor import EmailProcessor
+from ..utils.logger import logger
+
+def format_email_thread(email_thread: list, purpose: str = "Prompt"):
+    """
+    Formats an email thread for the summary and reply prompts.
+    With Settings.CLEAN_PROMPT_BODIES, each body is replaced by its cleaned form
+    (EmailProcessor.clean_body), so replies that quote the whole conversation
+    do not make the prompt grow quadratically with the thread length. Logs how
+    many characters and estimated tokens the cleaning saved for the thread and
+    returns (thread_content, report).
+    """
+    thread_content = ""
+    chars_saved = 0
+    for email in email_thread:
+        body = email['body']
+        if Settings.CLEAN_PROMPT_BODIES:
+            cleaned = EmailProcessor.clean_body(email)
+            chars_saved += len(body) - len(cleaned)
+            body = cleaned
+        thread_content += f"From: {email['sender']}\n"
+        thread_content += f"Subject: {email['subject']}\n"
+        thread_content += f"Date: {email['date']}\n"
+        thread_content += f"Body: {body}\n\n"
+
+    report = {
+        'chars': len(thread_content),
+        'tokens': estimate_tokens(len(thread_content)),
+        'chars_saved': chars_saved,
+        'tokens_saved': estimate_tokens(chars_saved)
+    }
+    thread_id = email_thread[-1].get('threadId', 'N/A') if email_thread else 'N/A'
+    logger.info("%s for thread %s: %d chars (~%d tokens); cleaning saved %d chars (~%d tokens).", purpose, thread_id,
+                report['chars'], report['tokens'], report['chars_saved'], report['tokens_saved'])
+    return thread_content, report
@@ -1,4 +1,5 @@
 from .gemini_client import GeminiClient
+from .prompt_builder import format_email_thread
 from ..config.settings import Settings
 from ..utils.logger import logger
 
@@ -6,23 +7,32 @@ class ReplyGenerator:
     """
     Generates professional email reply drafts using Gemini API.
     """
-    def __init__(self):
+    FAILURE_MESSAGE = "Could not generate reply draft." # Returned when Gemini gave no draft
+    def __init__(self, response_cache=None):
         self.gemini_client = GeminiClient()
         self.reply_prompt_template = Settings.REPLY_PROMPT
+        self.response_cache = response_cache # Optional ResponseCache shared with the summarizer
 
-    async def generate_reply(self, email_thread: list, recipient: str, instructions: str = "Generate a professional and concise reply.") -> str:
+    async def generate_reply(self, email_thread: list, recipient: str, instructions: str = "Generate a professional and concise reply.", use_cache: bool = True) -> str:
         """
         Generates a reply draft for a given email thread.
+        A draft generated before for the same thread content, prompt and instructions is
+        answered from the response cache without calling Gemini, unless use_cache is False.
         """
-        thread_content = ""
-        for email in email_thread:
-            thread_content += f"From: {email['sender']}\n"
-            thread_content += f"Subject: {email['subject']}\n"
-            thread_content += f"Date: {email['date']}\n"
-            thread_content += f"Body: {email['body']}\n\n"
+        thread_content, _ = format_email_thread(email_thread, "Reply prompt")
 
-        prompt = self.reply_prompt_template.format(email_thread=thread_content, instructions=instructions)
-        reply_draft = await self.gemini_client.generate_content(prompt)
+        cache_key = reply_draft = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key("reply", thread_content, self.reply_prompt_template, instructions)
+            reply_draft = await self.response_cache.get(cache_key, bypass=not use_cache)
+            if reply_draft is not None:
+                logger.debug("Reply draft served from the response cache (key %.12s)", cache_key)
+
+        if reply_draft is None:
+            prompt = self.reply_prompt_template.format(email_thread=thread_content, instructions=instructions)
+            reply_draft = await self.gemini_client.generate_content(prompt)
+            if reply_draft and cache_key is not None:
+                await self.response_cache.put(cache_key, "reply", reply_draft)
         
         if reply_draft:
             # Assuming the last email in the thread is the one being replied to
@@ -30,4 +40,4 @@ class ReplyGenerator:
             logger.log_response(original_email_id, reply_draft, recipient)
             return reply_draft
         else:
-            return "Could not generate reply draft."
+            return self.FAILURE_MESSAGE
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+class ResponseCache:
+    """
+    Two-tier cache of Gemini responses (summaries and reply drafts) keyed by a hash of
+    everything that determines the output: the normalized thread content, the prompt
+    template, the model name and the instructions. A thread whose content did not
+    change is therefore never sent to Gemini twice, whichever window or request it is
+    seen in.
+    Lookups go to an in-memory LRU first and then to an SQLite file, which keeps entries
+    across restarts. Entries older than the TTL are ignored and removed; above its size
+    cap the file evicts its least recently used entries. The size of the file's entries is
+    kept as a running total, so writes only scan the table when the total crosses the cap
+    or a periodic sweep for expired entries is due. Disk access runs in a worker thread so
+    the event loop is never blocked on it.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            kind TEXT,
+            value TEXT,
+            size INTEGER,
+            created REAL,
+            last_access REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+    """
+
+    def __init__(self, db_path: str = None, memory_entries: int = None, max_bytes: int = None, ttl: float = None):
+        self.db_path = db_path or Settings.RESPONSE_CACHE_PATH
+        self.memory_entries = memory_entries or Settings.RESPONSE_CACHE_MEMORY_ENTRIES
+        self.max_bytes = max_bytes or Settings.RESPONSE_CACHE_MAX_BYTES
+        self.ttl = ttl or Settings.RESPONSE_CACHE_TTL
+        self._memory = OrderedDict() # key -> (value, created)
+        self._lock = threading.Lock()
+        self._conn = None # Opened on first disk access
+        self._disk_bytes = 0 # Running total of the `size` column, loaded when the file is opened
+        self._next_purge = 0.0 # When the next sweep for expired entries is due
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'expired': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(kind: str, thread_content: str, template: str, instructions: str = "") -> str:
+        """Content address of a response: whitespace differences in the thread do not change it."""
+        normalized = ' '.join(thread_content.split())
+        material = '\x1f'.join((kind, Settings.GEMINI_MODEL, template, instructions or "", normalized))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str, bypass: bool = False):
+        """Returns the cached response for `key`, or None on a miss or when the caller asks to `bypass` the cache."""
+        if bypass:
+            self.stats['bypassed'] += 1
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, created = entry
+            if now - created <= self.ttl:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return value
+            del self._memory[key]
+        entry = await asyncio.to_thread(self._disk_get, key, now)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['disk_hits'] += 1
+        self._remember(key, *entry)
+        return entry[0]
+
+    async def put(self, key: str, kind: str, value: str):
+        """Stores a freshly generated response in both tiers."""
+        now = time.time()
+        self._remember(key, value, now)
+        self.stats['stores'] += 1
+        await asyncio.to_thread(self._disk_put, key, kind, value, now)
+
+    def report(self) -> dict:
+        """Hit/miss counters, the hit rate and the number of entries held in memory and on disk."""
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        report = dict(self.stats)
+        report['hit_rate'] = round((lookups - self.stats['misses']) / lookups, 3) if lookups else None
+        report['memory_entries'] = len(self._memory)
+        with self._lock:
+            report['disk_entries'] = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return report
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        """The SQLite connection, opened on first use. Caller must hold the lock."""
+        if self._conn is None:
+            if self.db_path != ':memory:':
+                os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(self.SCHEMA)
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._conn
+
+    def _disk_get(self, key, now):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self._disk_bytes -= row[2] or 0
+                self.stats['expired'] += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return row[:2]
+
+    def _disk_put(self, key, kind, value, now):
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            conn = self._connection()
+            replaced = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, kind, value, size, now, now))
+            conn.commit()
+            self._disk_bytes += size - ((replaced[0] or 0) if replaced else 0)
+            due = self._disk_bytes > self.max_bytes or now >= self._next_purge
+        if due:
+            self.enforce_limits(now)
+
+    def enforce_limits(self, now: float = None):
+        """
+        Removes expired entries and, once the file holds more than max_bytes of responses,
+        evicts the least recently used ones down to RESPONSE_CACHE_LOW_WATERMARK of the cap.
+        """
+        now = now or time.time()
+        with self._lock:
+            conn = self._connection()
+            expired = conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            victims = []
+            if total > self.max_bytes:
+                target = int(self.max_bytes * Settings.RESPONSE_CACHE_LOW_WATERMARK)
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+                    if total <= target:
+                        break
+                    victims.append((key,))
+                    total -= size or 0
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            conn.commit()
+            self._disk_bytes = total
+            self._next_purge = now + Settings.RESPONSE_CACHE_PURGE_INTERVAL
+        self.stats['expired'] += expired
+        self.stats['evictions'] += len(victims)
+        if victims:
+            logger.info("Response cache over %d bytes: evicted %d entries.", self.max_bytes, len(victims))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
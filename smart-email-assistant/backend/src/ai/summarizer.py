@@ -1,4 +1,5 @@
 from .gemini_client import GeminiClient
+from .prompt_builder import format_email_thread
 from ..config.settings import Settings
 from ..utils.logger import logger
 
@@ -6,21 +7,90 @@ class Summarizer:
     """
     Generates bullet-point summaries of emails using Gemini API.
     """
-    def __init__(self):
+    FAILURE_MESSAGE = "Could not generate summary." # Returned when Gemini gave no summary
+    def __init__(self, response_cache=None):
         self.gemini_client = GeminiClient()
         self.summary_prompt_template = Settings.SUMMARY_PROMPT
+        self.incremental_prompt_template = Settings.INCREMENTAL_SUMMARY_PROMPT
+        self.response_cache = response_cache # Optional ResponseCache shared with the reply generator
 
     async def summarize_email(self, email_thread: list) -> str:
         """
         Generates a summary for a given email thread.
+        A thread summarized before with the same content and prompt is answered from
+        the response cache without calling Gemini.
         """
-        thread_content = ""
-        for email in email_thread:
-            thread_content += f"From: {email['sender']}\n"
-            thread_content += f"Subject: {email['subject']}\n"
-            thread_content += f"Date: {email['date']}\n"
-            thread_content += f"Body: {email['body']}\n\n"
+        summary, _ = await self.summarize_thread(email_thread)
+        return summary
 
-        prompt = self.summary_prompt_template.format(email_thread=thread_content)
-        summary = await self.gemini_client.generate_content(prompt)
-        return summary if summary else "Could not generate summary."
+    async def summarize_thread(self, email_thread: list, previous: dict = None, use_cache: bool = True):
+        """
+        Summarizes a thread, updating its previous summary instead when possible.
+        `previous` is the state returned by an earlier call for the same thread. If the
+        thread only gained messages since then, the prompt holds the previous summary and
+        the new messages, so it stays about the same size however long the thread grows.
+        The whole thread is summarized again after Settings.SUMMARY_DRIFT_LIMIT updates in
+        a row, so errors do not accumulate, and whenever the previous summary does not
+        cover a prefix of the thread.
+        With use_cache=False the response cache is not read (new summaries are still stored).
+        Returns (summary, state); state is None when no summary could be generated.
+        """
+        start = self._resume_index(email_thread, previous)
+        if start and start == len(email_thread):
+            return previous['summary'], previous # No new messages
+        if start:
+            new_content, _ = format_email_thread(email_thread[start:], "Incremental summary prompt")
+            summary = await self._generate("summary_update", self.incremental_prompt_template, new_content,
+                                           previous['summary'], use_cache, previous_summary=previous['summary'], new_messages=new_content)
+            updates = previous['updates'] + 1
+        else:
+            thread_content, _ = format_email_thread(email_thread, "Summary prompt")
+            summary = await self._generate("summary", self.summary_prompt_template, thread_content, "",
+                                           use_cache, email_thread=thread_content)
+            updates = 0
+        if not summary:
+            return self.FAILURE_MESSAGE, None
+        return summary, self.summary_state(email_thread, summary, updates)
+
+    @staticmethod
+    def summary_state(email_thread: list, summary: str, updates: int = 0) -> dict:
+        """The state summarize_thread resumes from: a summary and the messages it covers."""
+        return {
+            'summary': summary,
+            'last_message_id': email_thread[-1]['id'],
+            'message_count': len(email_thread),
+            'updates': updates
+        }
+
+    def _resume_index(self, email_thread: list, previous: dict) -> int:
+        """
+        Number of leading messages covered by the previous summary, or 0 if the thread has
+        to be summarized in full.
+        """
+        if not Settings.ENABLE_INCREMENTAL_SUMMARY or not previous or not previous.get('summary'):
+            return 0
+        count = previous.get('message_count') or 0
+        if not count or len(email_thread) < count or email_thread[count - 1]['id'] != previous.get('last_message_id'):
+            return 0
+        if count < len(email_thread):
+            if len(email_thread) < Settings.INCREMENTAL_SUMMARY_MIN_MESSAGES:
+                return 0 # Short threads are cheap to summarize in full
+            if previous.get('updates', 0) >= Settings.SUMMARY_DRIFT_LIMIT:
+                logger.debug("Thread summary updated %d times in a row; summarizing the whole thread again.", previous['updates'])
+                return 0
+        return count
+
+    async def _generate(self, kind: str, template: str, content: str, instructions: str = "", use_cache: bool = True, **fields):
+        """Fills `template` with `fields` and asks Gemini, going through the response cache when there is one."""
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key(kind, content, template, instructions)
+            text = await self.response_cache.get(cache_key, bypass=not use_cache)
+            if text is not None:
+                logger.debug("Summary served from the response cache (key %.12s)", cache_key)
+                return text
+
+        text = await self.gemini_client.generate_content(template.format(**fields))
+        if text and cache_key is not None:
+            await self.response_cache.put(cache_key, kind, text)
+        return text
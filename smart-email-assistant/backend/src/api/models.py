@@ -4,6 +4,9 @@ from typing import List, Optional
 class EmailProcessRequest(BaseModel):
     days_to_process: int = 7
     enable_reply_generation: bool = True
+    cursor: Optional[str] = None # Continuation cursor from a truncated previous response
+    message_format: Optional[str] = None # "full" or "raw"; defaults to Settings.MESSAGE_FORMAT
+    bypass_cache: bool = False # Regenerate summaries and replies instead of reusing cached ones
 
 class EmailSummaryResponse(BaseModel):
     id: str # Add id field
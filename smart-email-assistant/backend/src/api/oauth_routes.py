@@ -1,7 +1,4 @@
 from fastapi import APIRouter, HTTPException, status, Request, Response
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleAuthRequest
 import os
 import pickle
 import json
@@ -31,6 +28,7 @@ async def auth_status():
                 creds = pickle.load(token)
             if creds and creds.valid:
                 if creds.expired and creds.refresh_token:
+                    from google.auth.transport.requests import Request as GoogleAuthRequest
                     creds.refresh(GoogleAuthRequest())
                     with open(TOKEN_FILE, 'wb') as token:
                         pickle.dump(creds, token)
@@ -55,6 +53,7 @@ async def google_login():
         )
     
     try:
+        from google_auth_oauthlib.flow import Flow # Imported on use to keep startup fast
         flow = Flow.from_client_secrets_file(
             CREDENTIALS_FILE,
             scopes=SCOPES,
@@ -97,6 +96,7 @@ async def google_callback(request: Request):
         )
 
     try:
+        from google_auth_oauthlib.flow import Flow # Imported on use to keep startup fast
         flow = Flow.from_client_secrets_file(
             CREDENTIALS_FILE,
             scopes=SCOPES,
@@ -129,6 +129,7 @@ async def logout():
                 creds = pickle.load(token)
             if creds and creds.token:
                 # Revoke the token
+                from google.auth.transport.requests import Request as GoogleAuthRequest
                 creds.revoke(GoogleAuthRequest())
                 logging.info("Google token revoked.")
             
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from .models import EmailProcessRequest, EmailSummaryResponse, ExportRequest, HealthCheckResponse, ErrorResponse
 from ..main import SmartEmailAssistant
 from ..config.settings import Settings
+from ..email.gmail_client import start_of_day
+from ..email.fetch_planner import FetchBudget
 import os
 import logging
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta
+import json
+import asyncio
 from ..utils.rate_limiter import RateLimiter
 from ..utils.logger import logger as app_logger
+from ..utils.startup_timer import startup_timer
+from ..utils.latency_recorder import gemini_latency
 
 router = APIRouter()
 rate_limiter = RateLimiter(rate_limit=10, interval=60) # Example: 10 calls per minute
@@ -18,6 +24,12 @@ smart_assistant = SmartEmailAssistant() # Initialize smart_assistant after rate_
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def _set_truncation_headers(response: Response, budget: FetchBudget):
+    """Tells the client whether the fetch budget cut the results short and how to continue."""
+    response.headers["X-Results-Truncated"] = "true" if budget.truncated else "false"
+    if budget.cursor:
+        response.headers["X-Continuation-Cursor"] = budget.cursor
+
 @router.get("/health", response_model=HealthCheckResponse, summary="Health Check")
 async def health_check():
     """
@@ -25,52 +37,124 @@ async def health_check():
     """
     return HealthCheckResponse(status="ok", message="API is running")
 
+@router.get("/health/startup", summary="Startup Timing Report")
+async def startup_report():
+    """
+    Returns how long the API took to import, start up and serve its first response,
+    in milliseconds since the import started.
+    """
+    return startup_timer.report()
+
+@router.get("/health/gemini", summary="Gemini Latency Report")
+async def gemini_latency_report():
+    """
+    Returns the number of Gemini calls by outcome and the p50/p95/max latency of the
+    most recent ones, in milliseconds.
+    """
+    return gemini_latency.report()
+
+@router.get("/health/response_cache", summary="Response Cache Report")
+async def response_cache_report():
+    """
+    Returns the hit/miss counters of the summary and reply cache and how many responses
+    it holds in memory and on disk.
+    """
+    if smart_assistant.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(smart_assistant.response_cache.report)}
+
 @router.post("/process_emails", response_model=List[EmailSummaryResponse], summary="Process Emails")
-async def process_emails_endpoint(request: EmailProcessRequest):
+async def process_emails_endpoint(request: EmailProcessRequest, response: Response):
     """
     Fetches, processes, summarizes, and generates reply drafts for emails.
+    At most Settings.MAX_EMAILS_PER_BATCH messages are fetched per request, newest first;
+    if more are available the X-Results-Truncated and X-Continuation-Cursor headers say
+    so, and passing the cursor back in `cursor` returns the next slice.
     """
+    # Temporarily override settings for this request if different from defaults
+    original_days_to_process = Settings.DAYS_TO_PROCESS
+    original_enable_reply_generation = Settings.ENABLE_REPLY_GENERATION
     try:
-        # Temporarily override settings for this request if different from defaults
-        original_days_to_process = Settings.DAYS_TO_PROCESS
-        original_enable_reply_generation = Settings.ENABLE_REPLY_GENERATION
-        
         Settings.DAYS_TO_PROCESS = request.days_to_process
         Settings.ENABLE_REPLY_GENERATION = request.enable_reply_generation
 
         # Apply rate limiting before processing emails
         await rate_limiter.wait_for_permission()
         
-        processed_data = await smart_assistant.process_emails()
+        budget = FetchBudget.from_settings()
+        processed_data = await smart_assistant.process_emails(budget, request.cursor, request.message_format, request.bypass_cache)
         smart_assistant.processed_data = processed_data # Store for export
-
-        # Restore original settings
-        Settings.DAYS_TO_PROCESS = original_days_to_process
-        Settings.ENABLE_REPLY_GENERATION = original_enable_reply_generation
+        _set_truncation_headers(response, budget)
 
         # Convert list of dicts to list of Pydantic models
         return [EmailSummaryResponse(**item) for item in processed_data]
+    except HTTPException as e:
+        if e.status_code >= 500:
+            logging.error(f"Error processing emails: {e.detail}", exc_info=True)
+        raise
     except Exception as e:
         logging.error(f"Error processing emails: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process emails: {e}"
         )
+    finally:
+        # Restore original settings, also when the request failed
+        Settings.DAYS_TO_PROCESS = original_days_to_process
+        Settings.ENABLE_REPLY_GENERATION = original_enable_reply_generation
+
+@router.post("/process_emails/stream", summary="Process Emails (streamed)")
+async def process_emails_stream_endpoint(request: EmailProcessRequest):
+    """
+    Same as /process_emails, but streams one JSON line per thread (NDJSON) as soon as
+    it has been processed instead of waiting for the whole window. The last line is
+    {"truncated": ..., "cursor": ...} describing whether the fetch budget cut the
+    window short.
+    """
+    await rate_limiter.wait_for_permission()
+    after = start_of_day(datetime.now() - timedelta(days=request.days_to_process))
+    budget = FetchBudget.from_settings()
+
+    async def result_lines():
+        original_enable_reply_generation = Settings.ENABLE_REPLY_GENERATION
+        Settings.ENABLE_REPLY_GENERATION = request.enable_reply_generation
+        try:
+            async for item in smart_assistant.stream_emails(after, budget=budget, cursor=request.cursor, message_format=request.message_format,
+                                                            bypass_cache=request.bypass_cache):
+                yield json.dumps(jsonable_encoder(EmailSummaryResponse(**item))) + "\n"
+            yield json.dumps({"truncated": budget.truncated, "cursor": budget.cursor}) + "\n"
+        except Exception as e:
+            logging.error(f"Error streaming processed emails: {e}", exc_info=True)
+            yield json.dumps({"error": f"Failed to process emails: {getattr(e, 'detail', e)}"}) + "\n"
+        finally:
+            Settings.ENABLE_REPLY_GENERATION = original_enable_reply_generation
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
 
 @router.get("/emails/today", response_model=List[EmailSummaryResponse], summary="Get Emails for Today")
-async def get_emails_for_today_endpoint():
+async def get_emails_for_today_endpoint(response: Response, cursor: Optional[str] = None, message_format: Optional[str] = None,
+                                        bypass_cache: bool = False):
     """
     Fetches, processes, summarizes, and generates reply drafts for emails received on the current date.
+    Results are limited like /process_emails; pass X-Continuation-Cursor back as `cursor` for the rest.
+    `message_format` ("full" or "raw") overrides Settings.MESSAGE_FORMAT for this request;
+    `bypass_cache` regenerates summaries and replies instead of reusing cached ones.
     """
     try:
         # Apply rate limiting before processing emails
         await rate_limiter.wait_for_permission()
         
-        processed_data = await smart_assistant.process_emails_for_today()
+        budget = FetchBudget.from_settings()
+        processed_data = await smart_assistant.process_emails_for_today(budget, cursor, message_format, bypass_cache)
         smart_assistant.processed_data = processed_data # Store for export
+        _set_truncation_headers(response, budget)
 
         # Convert list of dicts to list of Pydantic models
         return [EmailSummaryResponse(**item) for item in processed_data]
+    except HTTPException as e:
+        if e.status_code >= 500:
+            logging.error(f"Error fetching emails for today: {e.detail}", exc_info=True)
+        raise
     except Exception as e:
         logging.error(f"Error fetching emails for today: {e}", exc_info=True)
         raise HTTPException(
@@ -118,6 +202,27 @@ async def export_data_endpoint(request: ExportRequest):
             detail=f"Failed to export data: {e}"
         )
 
+@router.post("/priority_model/train", summary="Train the Local Priority Model")
+async def train_priority_model_endpoint(days: Optional[int] = None):
+    """
+    Trains the local priority classifier on the user's own replied and unanswered mail
+    of the last `days` days (Settings.PRIORITY_MODEL_TRAINING_DAYS by default).
+    Later requests score thread priorities with it, falling back to the keyword rules
+    for threads it cannot score. Returns the training stats.
+    """
+    try:
+        return await smart_assistant.train_priority_model(days)
+    except HTTPException as e:
+        if e.status_code >= 500:
+            logging.error(f"Error training priority model: {e.detail}", exc_info=True)
+        raise
+    except Exception as e:
+        logging.error(f"Error training priority model: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to train priority model: {e}"
+        )
+
 # Add a route for authentication initiation (for frontend)
 @router.get("/auth/google", summary="Initiate Google OAuth2 Flow")
 async def auth_google():
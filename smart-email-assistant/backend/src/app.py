@@ -1,8 +1,14 @@
-from fastapi import FastAPI
+import time
+_IMPORT_STARTED = time.perf_counter() # Taken before the imports below so the startup report covers them
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .api.routes import router as api_router
+from .api.routes import router as api_router, smart_assistant
 from .api.oauth_routes import router as oauth_router
 from .config.settings import Settings
+from .utils.startup_timer import startup_timer
+
+startup_timer.start(_IMPORT_STARTED)
 
 app = FastAPI(
     title="Smart Email Assistant API",
@@ -19,18 +25,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Results-Truncated", "X-Continuation-Cursor"], # Let browsers read the fetch budget headers
 )
 
 app.include_router(api_router, prefix="/api")
 app.include_router(oauth_router, prefix="/api") # Include the new OAuth router
+startup_timer.mark("imported")
+
+@app.middleware("http")
+async def record_first_response(request: Request, call_next):
+    """Adds the time to first response to the startup timing report."""
+    response = await call_next(request)
+    if "first_response" not in startup_timer.marks:
+        startup_timer.mark("first_response")
+        startup_timer.log_report()
+    return response
 
 @app.on_event("startup")
 async def startup_event():
     print("Starting up Smart Email Assistant API...")
+    if Settings.WARMUP_ON_STARTUP:
+        await smart_assistant.warm_up()
+        startup_timer.mark("warmed_up")
+    startup_timer.mark("ready")
+    startup_timer.log_report()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("Shutting down Smart Email Assistant API...")
+    await smart_assistant.aclose()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,6 @@
 import os
 import pickle
 from fastapi import HTTPException, status # Import HTTPException and status
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from ..config.settings import Settings
 import pickle
 import os
@@ -30,6 +28,7 @@ class GmailAuth:
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 try:
+                    from google.auth.transport.requests import Request
                     self.creds.refresh(Request())
                 except Exception as e:
                     raise HTTPException(
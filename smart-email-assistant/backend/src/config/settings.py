@@ -1,9 +1,10 @@
 import os
 from dotenv import load_dotenv
-from ..utils.logger import logger
 
 load_dotenv()
 
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
 class Settings:
     # Gmail API
     GMAIL_SCOPES = [
@@ -16,11 +17,106 @@ class Settings:
     # Gemini API
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL = "gemini-2.0-flash"
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60")) # Seconds a generation call may take
+    GEMINI_MAX_WORKERS = 4 # Threads that run blocking Gemini SDK calls off the event loop
+    LATENCY_WINDOW = 500 # Recent calls the latency percentiles are computed over
+
+    # Gmail fetching
+    USE_BATCH_FETCH = True # Group message fetches into Gmail HTTP batch requests
+    GMAIL_BATCH_SIZE = 100 # Calls per batch request (Gmail allows at most 100)
+    GMAIL_MAX_RETRIES = 2 # Retries for throttled (429/5xx) requests and batch items
+    GMAIL_RETRY_DELAY = 1.0 # Seconds, doubled on every retry
+    USE_ASYNC_GMAIL_CLIENT = False # Fetch through AsyncGmailClient instead of running GmailClient in a worker thread
+    GMAIL_API_BASE_URL = "https://gmail.googleapis.com/gmail/v1"
+    GMAIL_MAX_CONCURRENCY = 10 # Max in-flight Gmail requests / pooled connections
+    GMAIL_KEEPALIVE_EXPIRY = 30.0 # Seconds an idle pooled connection is kept open
+    GMAIL_HTTP_TIMEOUT = 30.0 # Seconds
+    FETCH_MODE = "threads" # "threads": fetch whole conversations; "messages": fetch messages and regroup by threadId
+    GMAIL_THREAD_BATCH_SIZE = 25 # Thread fetches per batch request (threads are much larger than messages)
+    TWO_PHASE_FETCH = True # Fetch thread metadata first and full bodies only for threads that are summarized or replied to
+    METADATA_HEADERS = ["From", "Subject", "Date"] # Headers requested in the metadata phase
+    MESSAGE_FORMAT = os.getenv("MESSAGE_FORMAT", "full") # "full": Gmail's parsed JSON payload; "raw": RFC 822 source parsed locally, skipping attachments (overridable per request)
+    ENABLE_INCREMENTAL_SYNC = True # Use users.history.list to fetch only messages changed since the last run
+    GMAIL_TRANSPORT_MODE = os.getenv("GMAIL_TRANSPORT_MODE", "live") # "live", "record" (save responses to the cassette) or "replay" (serve them offline)
+    GMAIL_CASSETTE_PATH = os.getenv("GMAIL_CASSETTE_PATH", os.path.join(BACKEND_DIR, "data", "gmail_cassette.jsonl.gz"))
+    GMAIL_REPLAY_LATENCY = float(os.getenv("GMAIL_REPLAY_LATENCY", "0")) # Seconds added to every replayed round trip
+    GMAIL_REPLAY_ERROR_RATE = float(os.getenv("GMAIL_REPLAY_ERROR_RATE", "0")) # Fraction of replayed calls that fail with a 503
+
+    # Local state
+    DATA_DIR = os.path.join(BACKEND_DIR, "data")
+    SYNC_STATE_FILE = os.path.join(DATA_DIR, "sync_state.json") # Last historyId per account
+    SYNC_STATE_MAX_DAYS = 31 # Messages older than this are dropped from the sync state unless a request's window reaches back further
+    THREAD_STATE_FILE = os.path.join(DATA_DIR, "thread_state.json") # Last seen historyId per thread
+    THREAD_STATE_MAX_ENTRIES = 5000 # Threads remembered per account
+    ENABLE_INCREMENTAL_ANALYSIS = True # Analyze only messages added since the last run and reuse the results of unchanged threads
+    THREAD_ANALYSIS_FILE = os.path.join(DATA_DIR, "thread_analysis.json") # Per-thread analysis state and last result
+    ENABLE_MESSAGE_STORE = True # Keep downloaded messages on disk (an in-memory store is used otherwise)
+    MESSAGE_STORE_PATH = os.path.join(DATA_DIR, "messages.sqlite3")
+    MESSAGE_STORE_MAX_BYTES = 512 * 1024 * 1024 # Evict least recently used messages above this size
+    MESSAGE_STORE_LOW_WATERMARK = 0.8 # Evict down to this fraction of the cap
+    MESSAGE_STORE_WRITE_BATCH = 100 # Parses of decoded bodies written to the message store per transaction
+    ENABLE_RESPONSE_CACHE = True # Reuse Gemini summaries and reply drafts for thread content seen before
+    RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, "responses.sqlite3")
+    RESPONSE_CACHE_MEMORY_ENTRIES = 512 # Responses kept in the in-memory LRU tier
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Evict least recently used responses from disk above this size
+    RESPONSE_CACHE_LOW_WATERMARK = 0.8 # Evict down to this fraction of the cap
+    RESPONSE_CACHE_TTL = 30 * 86400 # Seconds a cached response stays valid
+    RESPONSE_CACHE_PURGE_INTERVAL = 60 * 60 # Seconds between sweeps that delete expired responses from disk
 
     # Processing
-    MAX_EMAILS_PER_BATCH = 50
+    MAX_EMAILS_PER_BATCH = 50 # Messages fetched per request; the rest is left for a continuation cursor
+    MAX_THREADS_PER_REQUEST = 50 # Threads fetched per request
+    MAX_QUOTA_UNITS_PER_REQUEST = 2500 # Gmail API quota units one request may spend
     DAYS_TO_PROCESS = 7
     ENABLE_REPLY_GENERATION = True
+    ENABLE_COMBINED_ANALYSIS = True # One JSON Gemini call for the summary and reply of threads that need a reply (two calls if it fails)
+    USE_SUGGESTED_PRIORITY = False # Let the priority suggested by the combined call replace the keyword/model priority
+    PIPELINE_PAGE_QUEUE_SIZE = 2 # Fetched thread pages buffered ahead of parsing
+    PIPELINE_THREAD_QUEUE_SIZE = 50 # Parsed threads buffered ahead of analysis and summarization
+    THREAD_CONCURRENCY = 4 # Threads summarized and replied to at the same time (keep at most GEMINI_MAX_WORKERS)
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) # Processes that decode message bodies in parallel (0: parse in-process; -1: one per available core)
+    PARSE_BATCH_SIZE = 32 # Messages sent to a parse worker at a time
+    PARSE_POOL_MIN_MESSAGES = 16 # Fewer messages are parsed in-process; shipping them to the pool costs more than it saves
+    HTML_TEXT_ENGINE = "auto" # "auto": lxml when installed, else the stdlib html.parser; "html.parser" forces the fallback
+    HTML_MAX_INPUT_CHARS = 100_000 # HTML beyond this many characters is not converted to text
+    CLEAN_PROMPT_BODIES = True # Strip quoted replies, signatures and legal footers from bodies sent to Gemini
+    SUMMARIZE_PRIORITIES = ("High", "Medium") # With TWO_PHASE_FETCH, other threads that need no reply are not summarized
+    SKIP_BULK_MAIL_REPLIES = False # Never draft replies to newsletters and notifications (Gmail category labels, no-reply senders)
+    ENABLE_INCREMENTAL_SUMMARY = True # Update the previous summary of a grown thread from its new messages only (needs ENABLE_INCREMENTAL_ANALYSIS)
+    INCREMENTAL_SUMMARY_MIN_MESSAGES = 5 # Shorter threads are always summarized in full
+    SUMMARY_DRIFT_LIMIT = 5 # Incremental updates in a row before the whole thread is summarized again
+    PRIORITY_KEYWORDS = { # Whole-word, case-insensitive keywords per priority tier (list plurals separately), highest tier first; other threads are "Low"
+        "High": ['urgent', 'action required', 'important', 'deadline', 'deadlines', 'asap'],
+        "Medium": ['follow up', 'request', 'requests', 'question', 'questions', 'meeting', 'meetings']
+    }
+    PRIORITY_KEYWORDS_BY_ACCOUNT = {} # Gmail address -> keyword tiers used instead of PRIORITY_KEYWORDS for that account
+    PRIORITY_MODEL_ENABLED = True # Score priorities with the account's trained local model (needs numpy); keyword rules otherwise
+    PRIORITY_MODEL_DIR = DATA_DIR
+    PRIORITY_MODEL_FEATURES = 2 ** 18 # Hashed feature columns
+    PRIORITY_MODEL_EPOCHS = 100
+    PRIORITY_MODEL_THRESHOLDS = {"High": 0.75, "Medium": 0.5} # Minimum predicted reply probability per tier, highest tier first
+    PRIORITY_MODEL_TRAINING_DAYS = 90 # History used by /priority_model/train
+    PRIORITY_MODEL_MIN_EXAMPLES = 50 # Fewer labeled messages are not enough to train on
+    PRIORITY_MODEL_MIN_AGE_DAYS = 3 # Unanswered messages younger than this are not used as "not replied" examples
+
+    # Startup
+    WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true" # Load credentials, build clients and import heavy modules before the first request
+
+    # Logging
+    LOG_DIR = os.path.join(BACKEND_DIR, "logs")
+    LOG_FILE_NAME = "app.log"
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text") # "text" or "json" (one JSON object per line)
+    LOG_TO_CONSOLE = True # Also write application log lines to stderr
+    LOG_MAX_BYTES = 10 * 1024 * 1024 # Roll the log over at this size...
+    LOG_ROTATE_INTERVAL = 24 * 60 * 60 # ...or this many seconds after its first record (0: size only)
+    LOG_BACKUP_COUNT = 7 # Rolled-over files kept (app.log.1 is the newest)
+    LOG_MAX_FIELD_CHARS = 200 # Subjects, snippets, bodies and responses are cut to this length in log lines (0: no limit)
+    LOG_SAMPLE_RATES = { # Fraction of each per-message event that is logged
+        "EMAIL_RECEIVED": 1.0,
+        "EMAIL_BODY": 1.0,
+        "EMAIL_RESPONSE_SENT": 1.0
+    }
 
     # Export
     CSV_OUTPUT_PATH = "output/emails_{timestamp}.csv"
@@ -43,6 +139,36 @@ class Settings:
     {email_thread}
     """
 
+    INCREMENTAL_SUMMARY_PROMPT = """
+    You are an AI assistant specialized in summarizing email threads.
+    Below is the summary of an email thread so far, followed by the messages added to the thread since.
+    Update the summary so that it covers the whole thread: keep what is still relevant, add the new
+    topics, decisions, action items and important details, and drop what the new messages make obsolete.
+    Keep the summary under 200 words.
+
+    Summary so far:
+    {previous_summary}
+
+    New messages:
+    {new_messages}
+    """
+
+    COMBINED_ANALYSIS_PROMPT = """
+    You are an AI assistant specialized in triaging email threads.
+    For the email thread below, respond with a JSON object with these fields:
+    "summary": a concise and informative summary of the thread under 200 words, focusing on the main
+    topic, key decisions, action items and important details;
+    "priority": "High", "Medium" or "Low", how urgently the thread needs the user's attention;
+    "reply": a concise and appropriate reply to the last email, following the user's instructions and
+    keeping a professional tone.
+
+    Email Thread:
+    {email_thread}
+
+    User Instructions:
+    {instructions}
+    """
+
     REPLY_PROMPT = """
     You are an AI assistant specialized in generating email replies.
     Your goal is to craft a concise and appropriate reply based on the given email thread and the user's instructions.
@@ -0,0 +1,216 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from ..auth.gmail_auth import GmailAuth
+from ..config.settings import Settings
+from ..utils.logger import logger
+from .gmail_client import build_window_query, start_of_day
+
+class AsyncGmailClient:
+    """
+    Asyncio-native wrapper for Gmail API interactions.
+    Talks to the Gmail REST API over a pooled keep-alive httpx session so that
+    awaiting a large fetch never blocks the event loop. Mirrors the public
+    methods of GmailClient.
+    """
+    RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_concurrency: int = None):
+        self.auth = GmailAuth()
+        self.base_url = Settings.GMAIL_API_BASE_URL
+        self.max_concurrency = max_concurrency or Settings.GMAIL_MAX_CONCURRENCY
+        self._session = None # Created lazily inside the running event loop
+        self._semaphore = None
+        self._creds = None
+        self._creds_lock = None
+
+    def _get_session(self):
+        """Gets or creates the shared httpx session and the concurrency semaphore."""
+        if self._session is None or self._session.is_closed:
+            import httpx # Imported on first use to keep startup fast
+            limits = httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=Settings.GMAIL_KEEPALIVE_EXPIRY
+            )
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=limits,
+                timeout=Settings.GMAIL_HTTP_TIMEOUT
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._creds_lock = asyncio.Lock()
+        return self._session
+
+    async def _get_access_token(self, force_refresh: bool = False):
+        """
+        Returns a valid OAuth access token. Loading and refreshing the token touches
+        the disk and the network, so it runs in a worker thread.
+        """
+        async with self._creds_lock:
+            if force_refresh and self._creds is not None and self._creds.refresh_token:
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self._creds.refresh, Request())
+            if self._creds is None or not self._creds.valid:
+                try:
+                    self._creds = await asyncio.to_thread(self.auth.authenticate)
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        detail=f"Google authentication failed: {e}. Please ensure your credentials.json is correct and you have authenticated."
+                    )
+            return self._creds.token
+
+    async def _request(self, method: str, path: str, params=None, json=None, error_detail: str = "Gmail API request failed"):
+        """
+        Sends one authorized request, bounded by the concurrency cap.
+        Retries throttled and transient failures with exponential backoff and
+        refreshes the access token once on a 401.
+        """
+        import httpx
+        session = self._get_session()
+        refreshed = False
+        for attempt in range(Settings.GMAIL_MAX_RETRIES + 1):
+            token = await self._get_access_token()
+            async with self._semaphore:
+                try:
+                    response = await session.request(
+                        method, path, params=params, json=json,
+                        headers={'Authorization': f'Bearer {token}'}
+                    )
+                except httpx.TransportError as e:
+                    if attempt < Settings.GMAIL_MAX_RETRIES:
+                        await asyncio.sleep(Settings.GMAIL_RETRY_DELAY * (2 ** attempt))
+                        continue
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail=f"{error_detail}: {e}"
+                    )
+            if response.status_code == 401 and not refreshed:
+                refreshed = True
+                await self._get_access_token(force_refresh=True)
+                continue
+            if response.status_code in self.RETRYABLE_STATUS_CODES and attempt < Settings.GMAIL_MAX_RETRIES:
+                delay = Settings.GMAIL_RETRY_DELAY * (2 ** attempt) + random.uniform(0, 0.5)
+                logger.info(f"Gmail returned {response.status_code} for {path}; retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            if response.is_error:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"{error_detail}: {response.status_code} {response.text}"
+                )
+            return response.json()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{error_detail}: retries exhausted"
+        )
+
+    async def get_user_profile(self):
+        """Fetches the user's Gmail profile."""
+        return await self._request(
+            'GET', '/users/me/profile',
+            error_detail="Failed to retrieve user profile from Gmail API"
+        )
+
+    async def list_messages(self, query=''):
+        """Lists messages from the user's inbox."""
+        return [stub async for _, page in self.iter_message_pages(query) for stub in page]
+
+    async def iter_message_pages(self, query='', page_token=None, budget=None):
+        """
+        Yields (page_token, messages) for each users.messages.list page, newest first.
+        Honors a FetchBudget the same way as GmailClient.iter_message_pages.
+        """
+        while True:
+            if budget is not None and budget.truncated:
+                return
+            if budget is not None and (budget.exhausted or not budget.can_afford('messages.list')):
+                budget.truncate(query, page_token)
+                return
+            params = {'q': query}
+            if page_token:
+                params['pageToken'] = page_token
+            response = await self._request(
+                'GET', '/users/me/messages', params=params,
+                error_detail="Failed to list messages from Gmail API"
+            )
+            if budget is not None:
+                budget.charge('messages.list')
+            yield page_token, response.get('messages', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def get_message(self, msg_id, msg_format='full'):
+        """Retrieves a specific message by ID."""
+        return await self._request(
+            'GET', f'/users/me/messages/{msg_id}', params={'format': msg_format},
+            error_detail=f"Failed to retrieve message {msg_id} from Gmail API"
+        )
+
+    async def get_messages(self, message_ids, msg_format='full'):
+        """
+        Retrieves several messages concurrently (up to max_concurrency in flight),
+        keeping the order of `message_ids`. Failed messages are logged and skipped.
+        """
+        results = await asyncio.gather(
+            *(self.get_message(msg_id, msg_format) for msg_id in message_ids),
+            return_exceptions=True
+        )
+        emails = []
+        for msg_id, result in zip(message_ids, results):
+            if isinstance(result, Exception):
+                logger.warning("Async fetch of message %s failed: %s", msg_id, getattr(result, 'detail', result))
+            elif result:
+                emails.append(result)
+        return emails
+
+    async def get_messages_from_last_n_days(self, days=Settings.DAYS_TO_PROCESS):
+        """Fetches emails from the last N days."""
+        return await self.get_messages_in_window(start_of_day(datetime.now() - timedelta(days=days)))
+
+    async def get_messages_for_today(self):
+        """Fetches emails received on the current date."""
+        today = start_of_day(datetime.now())
+        return await self.get_messages_in_window(today, today + timedelta(days=1))
+
+    async def get_messages_in_window(self, after: datetime, before: datetime = None, budget=None, page_token=None, offset=0, msg_format='full'):
+        """
+        Lists and fetches the messages received in [after, before), newest first.
+        Honors a FetchBudget, resume position and msg_format like GmailClient.get_messages_in_window.
+        """
+        query = build_window_query(after, before)
+        message_ids = []
+        async for token, stubs in self.iter_message_pages(query, page_token, budget):
+            skip, offset = offset, 0 # The resume offset only applies to the first page
+            stubs = stubs[skip:]
+            allowed = budget.take_messages(len(stubs)) if budget is not None else len(stubs)
+            message_ids.extend(stub['id'] for stub in stubs[:allowed])
+            if allowed < len(stubs):
+                budget.truncate(query, token, skip + allowed)
+                break
+        return await self.get_messages(message_ids, msg_format)
+
+    async def get_thread(self, thread_id):
+        """Retrieves a specific thread by ID."""
+        return await self._request(
+            'GET', f'/users/me/threads/{thread_id}',
+            error_detail=f"Failed to retrieve thread {thread_id} from Gmail API"
+        )
+
+    async def send_message(self, message):
+        """Sends an email message."""
+        return await self._request(
+            'POST', '/users/me/messages/send', json=message,
+            error_detail="Failed to send message via Gmail API"
+        )
+
+    async def aclose(self):
+        """Closes the pooled HTTP session."""
+        if self._session is not None and not self._session.is_closed:
+            await self._session.aclose()
+        self._session = None
@@ -0,0 +1,113 @@
+import re
+
+# "On Tue, 3 Jun 2025 at 10:00, Jane Doe <jane@example.com> wrote:" (clients may wrap it over two lines)
+_REPLY_HEADER = re.compile(r'^\s*(On|Le|Am|El)\b.{0,300}\b(wrote|a écrit|schrieb|escribió)\s*:\s*$', re.IGNORECASE)
+_ORIGINAL_MESSAGE = re.compile(r'^\s*-{2,}\s*Original Message\s*-{2,}\s*$', re.IGNORECASE)
+_FORWARDED = re.compile(r'^\s*(-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)\s*$', re.IGNORECASE)
+# Outlook quotes the previous message under a From:/Sent:/To:/Subject: header block instead of ">" prefixes
+_HEADER_FROM = re.compile(r'^\s*\*?From:\*?\s+\S', re.IGNORECASE)
+_HEADER_FIELD = re.compile(r'^\s*\*?(Sent|Date|To|Cc|Subject):\*?\s', re.IGNORECASE)
+_RULE = re.compile(r'^\s*_{10,}\s*$')
+_QUOTED = re.compile(r'^\s*>')
+_SIGNATURE_DELIMITER = re.compile(r'^-- $') # RFC 3676
+_BARE_SIGNATURE_DELIMITER = re.compile(r'^--$') # Clients that strip trailing spaces
+_MOBILE_SIGNATURE = re.compile(r'^\s*(Sent from my \S+|Sent from (Mail|Outlook|Yahoo Mail) for \S+|Get Outlook for \S+)', re.IGNORECASE)
+_LEGAL_FOOTER = re.compile(
+    r'confidential|privileged|intended (solely )?(only )?for the (use of the )?(individual|named )?\s*(addressee|recipient)'
+    r'|if you (are not|have received this)|disclaimer|unsubscribe|do not reply to this (e-?mail|message)',
+    re.IGNORECASE
+)
+
+FOOTER_MIN_CHARS = 120 # Shorter trailing paragraphs are only dropped for unsubscribe links
+SIGNATURE_MAX_LINES = 6 # A bare "--" line only starts a signature this close to the end
+CHARS_PER_TOKEN = 4 # Rough average for English text with Gemini's tokenizer
+
+def estimate_tokens(chars: int) -> int:
+    """Cheap token estimate for `chars` characters, used for prompt-size reporting."""
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clean_email_body(text: str) -> str:
+    """
+    Removes what an email repeats or does not need in an LLM prompt: the quoted
+    history of earlier messages ("On ... wrote:" blocks, ">" lines and Outlook
+    "From:/Sent:" header blocks), the signature after a "-- " delimiter, mobile
+    "Sent from my ..." lines and trailing legal or unsubscribe footers.
+    In inline replies the quoted lines stay, since the answers between them refer
+    to them; only the quotes after the last answer are dropped. A bare "--" line
+    (no trailing space) only counts as a signature delimiter after a blank line and
+    within SIGNATURE_MAX_LINES of the end, so "--" rules inside a message are kept.
+    Forwarded messages are kept. If nothing would be left, the text is returned
+    unchanged.
+    """
+    if not text:
+        return ""
+    lines = text.splitlines()
+    lines = lines[:_find_cut(lines)]
+    last_answer = max((i for i, line in enumerate(lines) if line.strip() and not _QUOTED.match(line)), default=-1)
+    lines = [line for i, line in enumerate(lines)
+             if not (i > last_answer and _QUOTED.match(line)) and not _MOBILE_SIGNATURE.match(line)]
+    paragraphs = _paragraphs(lines)
+    while len(paragraphs) > 1 and _is_footer(paragraphs[-1]):
+        paragraphs.pop()
+    cleaned = '\n\n'.join(paragraphs)
+    return cleaned if cleaned else text.strip()
+
+def _find_cut(lines) -> int:
+    """Index of the first line of quoted history or signature, or len(lines)."""
+    has_content = False
+    for i, line in enumerate(lines):
+        if _FORWARDED.match(line):
+            break # Everything below is the forwarded message, which is new to the thread
+        if has_content:
+            if _ORIGINAL_MESSAGE.match(line) or _is_signature_delimiter(lines, i):
+                return i
+            header_lines = _reply_header_lines(lines, i)
+            if header_lines and _only_quotes_follow(lines, i + header_lines):
+                return i
+            if _HEADER_FROM.match(line) and sum(1 for following in lines[i + 1:i + 5] if _HEADER_FIELD.match(following)) >= 2:
+                return i - 1 if i and _RULE.match(lines[i - 1]) else i
+        if line.strip() and not _QUOTED.match(line):
+            has_content = True
+    return len(lines)
+
+def _is_signature_delimiter(lines, i) -> bool:
+    """True if lines[i] starts the signature: "-- ", or a bare "--" after a blank line near the end."""
+    line = lines[i].rstrip('\r')
+    if _SIGNATURE_DELIMITER.match(line):
+        return True
+    if not _BARE_SIGNATURE_DELIMITER.match(line) or (i and lines[i - 1].strip()):
+        return False
+    return sum(1 for following in lines[i + 1:] if following.strip()) <= SIGNATURE_MAX_LINES
+
+def _reply_header_lines(lines, i) -> int:
+    """Number of lines (1 or 2) of the reply header starting at lines[i], 0 if there is none."""
+    if _REPLY_HEADER.match(lines[i]):
+        return 1
+    if i + 1 < len(lines) and _REPLY_HEADER.match(f"{lines[i]} {lines[i + 1]}"):
+        return 2
+    return 0
+
+def _only_quotes_follow(lines, start) -> bool:
+    """False for inline (interleaved) replies, whose answers sit between the quoted lines."""
+    for line in lines[start:]:
+        if _SIGNATURE_DELIMITER.match(line) or _BARE_SIGNATURE_DELIMITER.match(line):
+            return True
+        if line.strip() and not _QUOTED.match(line):
+            return False
+    return True
+
+def _is_footer(paragraph) -> bool:
+    # Short closing lines such as "Please keep this confidential." are part of the message
+    return bool(_LEGAL_FOOTER.search(paragraph)) and (len(paragraph) >= FOOTER_MIN_CHARS or 'unsubscribe' in paragraph.lower())
+
+def _paragraphs(lines):
+    paragraphs, current = [], []
+    for line in lines:
+        if line.strip():
+            current.append(line.rstrip())
+        elif current:
+            paragraphs.append('\n'.join(current))
+            current = []
+    if current:
+        paragraphs.append('\n'.join(current))
+    return paragraphs
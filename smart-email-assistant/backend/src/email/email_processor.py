@@ -1,36 +1,164 @@
 import base64
 import email
-from bs4 import BeautifulSoup
+import re
+import threading
 from datetime import datetime
+from .body_cleaner import clean_email_body
+from .email_record import EmailRecord
+from .html_text import html_to_text
+from .raw_message import decode_transfer_encoding, find_text_part, header_value
 from ..utils.logger import logger
 
 class EmailProcessor:
     """
     Parses raw email data fetched from Gmail API.
     """
-    def __init__(self):
-        pass
+    # Bump whenever parse_message output changes so stored parses are recomputed.
+    PARSER_VERSION = 5
+    _CHARSET = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
 
-    def parse_message(self, msg):
+    def __init__(self, message_store=None):
+        self.message_store = message_store
+        self._pending_parses = [] # (msg_id, parse) decoded since the last flush_parsed
+        self._pending_lock = threading.Lock()
+
+    def parse_message(self, msg, use_store=True):
         """
-        Parses a raw Gmail message object into a structured dictionary.
+        Parses a raw Gmail message object into an EmailRecord, a dict-compatible
+        record whose body is decoded from the payload on first access.
+        Accepts format='full' and 'metadata' messages as well as format='raw' ones,
+        which are parsed locally (see _parse_raw_message); both give the same record.
+        When a message store is configured, a previous parse of the same message is
+        reused and only its label-derived fields are refreshed; use_store=False skips
+        that lookup (ParsePool looks up a whole page with parse_cached_many first).
         """
+        cached = self.parse_cached(msg) if use_store else None
+        if cached is not None:
+            return cached
+        if 'raw' in msg:
+            return self._parse_raw_message(msg)
+
         headers = {header['name']: header['value'] for header in msg['payload']['headers']}
-        
-        email_data = {
-            'id': msg['id'],
-            'threadId': msg['threadId'],
-            'snippet': msg.get('snippet', ''),
-            'sender': self._get_header_value(headers, 'From'),
-            'subject': self._get_header_value(headers, 'Subject'),
-            'date': self._get_header_value(headers, 'Date'),
-            'body': self._get_email_body(msg['payload']),
-            'is_read': 'UNREAD' not in msg['labelIds'],
-            'labels': msg['labelIds']
-        }
+        full_payload = self._is_full_payload(msg['payload'])
+
+        email_data = EmailRecord(
+            msg['id'],
+            msg['threadId'],
+            msg.get('snippet', ''),
+            self._get_header_value(headers, 'From'),
+            self._get_header_value(headers, 'Subject'),
+            self._get_header_value(headers, 'Date'),
+            'UNREAD' not in msg['labelIds'],
+            msg['labelIds'],
+            body=None if full_payload else "",
+            body_source=self._find_body_part(msg['payload']) if full_payload else None,
+            processor=self if full_payload else None,
+            internal_date=msg.get('internalDate')
+        )
         logger.log_email(email_data)
         return email_data
 
+    def _parse_raw_message(self, msg):
+        """
+        Parses a format='raw' message. The RFC 822 source is read only as far as the
+        first text part (see raw_message.find_text_part); attachments are skipped
+        without being decoded and only that part's bytes are kept for the lazy body.
+        """
+        headers, part = find_text_part(msg['raw'])
+        email_data = EmailRecord(
+            msg['id'],
+            msg['threadId'],
+            msg.get('snippet', ''),
+            header_value(headers, 'From'),
+            header_value(headers, 'Subject'),
+            header_value(headers, 'Date'),
+            'UNREAD' not in msg['labelIds'],
+            msg['labelIds'],
+            body=None if part else "",
+            body_source=part,
+            processor=self if part else None,
+            internal_date=msg.get('internalDate')
+        )
+        logger.log_email(email_data)
+        return email_data
+
+    def has_body(self, msg):
+        """True if `msg` carries a body to decode (format='full' or 'raw')."""
+        return 'raw' in msg or self._is_full_payload(msg['payload'])
+
+    def parse_cached(self, msg):
+        """Returns the stored parse of `msg` with refreshed labels, or None if there is none."""
+        return self.parse_cached_many([msg]).get(msg['id'])
+
+    def parse_cached_many(self, msgs):
+        """
+        Returns msg_id -> EmailRecord for the messages whose parse is stored, with refreshed
+        labels, using one store query. Blocking; run it in a worker thread.
+        """
+        if self.message_store is None or not msgs:
+            return {}
+        stored = self.message_store.get_parsed_many([msg['id'] for msg in msgs if 'id' in msg], self.PARSER_VERSION)
+        records = {}
+        for msg in msgs:
+            cached = stored.get(msg.get('id'))
+            if cached is not None and 'labelIds' in msg: # Malformed messages fail in parse_message instead
+                cached['is_read'] = 'UNREAD' not in msg['labelIds']
+                cached['labels'] = msg['labelIds']
+                records[msg['id']] = EmailRecord.from_dict(cached)
+        return records
+
+    def decode_body(self, data, is_html, charset=None, transfer_encoding=None):
+        """
+        Decodes the body part chosen by _find_body_part (base64url data) or by
+        raw_message.find_text_part (bytes with a Content-Transfer-Encoding).
+        Called by EmailRecord on first access.
+        """
+        if transfer_encoding is None:
+            body = self._decode_body_data(data, charset)
+        else:
+            try:
+                body = self._decode_text(decode_transfer_encoding(data, transfer_encoding), charset)
+            except Exception as e:
+                logger.warning("Error decoding email body: %s", e)
+                body = ""
+        return self._html_to_plain_text(body) if is_html else body
+
+    def body_decoded(self, email_data):
+        """
+        Queues a parse for the message store once its body has been decoded, so later runs
+        skip the decoding. Bodies are decoded on the event loop, so nothing is written here;
+        flush_parsed writes the queued parses in one transaction.
+        """
+        if self.message_store is not None:
+            with self._pending_lock:
+                self._pending_parses.append((email_data['id'], email_data.to_dict()))
+
+    @property
+    def pending_parses(self) -> int:
+        """Decoded parses waiting for flush_parsed."""
+        return len(self._pending_parses)
+
+    def flush_parsed(self):
+        """Writes the parses queued by body_decoded to the message store. Blocking; run it in a worker thread."""
+        with self._pending_lock:
+            pending, self._pending_parses = self._pending_parses, []
+        if pending:
+            self.message_store.put_parsed_many(pending, self.PARSER_VERSION)
+
+    @staticmethod
+    def clean_body(email_data) -> str:
+        """
+        Body normalization for LLM prompts: returns the body without quoted replies,
+        signatures and legal footers. Cached on EmailRecords.
+        """
+        if isinstance(email_data, EmailRecord):
+            return email_data.clean_body
+        return clean_email_body(email_data.get('body', ''))
+
+    def _is_full_payload(self, payload):
+        """True for format='full' payloads; metadata payloads carry headers only."""
+        return 'body' in payload or 'parts' in payload
+
     def _get_header_value(self, headers, name):
         """Helper to get a header value by name."""
         return headers.get(name, 'N/A')
@@ -40,40 +168,87 @@ class EmailProcessor:
         Extracts the email body from the message payload, handling different MIME types.
         Prioritizes plain text, then HTML.
         """
+        part = self._find_body_part(payload)
+        return self.decode_body(*part) if part else ""
+
+    def _find_body_part(self, payload):
+        """
+        Picks the MIME part the body is read from, without decoding it: the first
+        text/plain or text/html part that is not an attachment.
+        Returns (base64 data, is_html, charset) or None if the payload has no body.
+        """
         if 'parts' in payload:
             for part in payload['parts']:
                 mime_type = part.get('mimeType')
-                if mime_type == 'text/plain':
-                    return self._decode_body_data(part.get('body', {}).get('data', ''))
-                elif mime_type == 'text/html':
-                    html_body = self._decode_body_data(part.get('body', {}).get('data', ''))
-                    return self._html_to_plain_text(html_body)
+                if self._is_attachment(part):
+                    continue
+                if mime_type in ('text/plain', 'text/html'):
+                    return part.get('body', {}).get('data', ''), mime_type == 'text/html', self._part_charset(part)
                 elif 'parts' in part: # Handle nested parts
-                    nested_body = self._get_email_body(part)
-                    if nested_body:
-                        return nested_body
+                    nested_part = self._find_body_part(part)
+                    if nested_part and nested_part[0]:
+                        return nested_part
         elif 'body' in payload and 'data' in payload['body']:
-            return self._decode_body_data(payload['body']['data'])
-        return ""
+            return payload['body']['data'], payload.get('mimeType') == 'text/html', self._part_charset(payload)
+        return None
+
+    @staticmethod
+    def _is_attachment(part):
+        """
+        True if a payload part has a filename or an attachment disposition
+        (raw_message.is_attachment applies the same rule to format='raw' messages).
+        """
+        if part.get('filename'):
+            return True
+        for header in part.get('headers') or ():
+            if header['name'].lower() == 'content-disposition':
+                return header['value'].strip().lower().startswith('attachment')
+        return False
+
+    def _part_charset(self, part):
+        """The charset parameter of a payload part's Content-Type header, if any."""
+        for header in part.get('headers') or ():
+            if header['name'].lower() == 'content-type':
+                match = self._CHARSET.search(header['value'])
+                return match.group(1).lower() if match else None
+        return None
 
-    def _decode_body_data(self, data):
+    def _decode_body_data(self, data, charset=None):
         """Decodes base64 web-safe encoded data."""
         if not data:
             return ""
         try:
             decoded_bytes = base64.urlsafe_b64decode(data)
-            return decoded_bytes.decode('utf-8')
+            return self._decode_text(decoded_bytes, charset)
         except Exception as e:
             print(f"Error decoding email body: {e}")
             return ""
 
+    def _decode_text(self, raw_bytes, charset=None):
+        """
+        Decodes body bytes with the part's declared charset and normalizes CRLF line
+        endings. Mislabelled text (often UTF-8 declared as us-ascii) is retried as
+        UTF-8, and undecodable bytes are replaced rather than losing the whole body.
+        """
+        for candidate in (charset, 'utf-8'):
+            if not candidate:
+                continue
+            try:
+                return raw_bytes.decode(candidate).replace('\r\n', '\n')
+            except (LookupError, UnicodeDecodeError):
+                continue
+        try:
+            text = raw_bytes.decode(charset or 'utf-8', errors='replace')
+        except LookupError: # Unknown charset name
+            text = raw_bytes.decode('utf-8', errors='replace')
+        return text.replace('\r\n', '\n')
+
     def _html_to_plain_text(self, html_content):
-        """Converts HTML content to plain text using BeautifulSoup."""
+        """Converts HTML content to plain text (lxml when installed, the stdlib html.parser otherwise)."""
         if not html_content:
             return ""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            return soup.get_text(separator='\n')
+            return html_to_text(html_content)
         except Exception as e:
             print(f"Error converting HTML to plain text: {e}")
             return html_content # Return original HTML if conversion fails
@@ -0,0 +1,166 @@
+import sys
+from collections.abc import MutableMapping
+from .body_cleaner import clean_email_body
+from ..utils.date_utils import timestamp_ms
+
+# Interned label tuples: most messages share one of a handful of label combinations.
+_LABEL_TUPLES = {}
+_MAX_LABEL_TUPLES = 4096
+
+def intern_labels(label_ids) -> tuple:
+    """Returns a shared tuple for a label list, so equal label sets are stored once."""
+    key = tuple(label_ids or ())
+    labels = _LABEL_TUPLES.get(key)
+    if labels is None:
+        if len(_LABEL_TUPLES) >= _MAX_LABEL_TUPLES:
+            _LABEL_TUPLES.clear()
+        labels = _LABEL_TUPLES[key] = key
+    return labels
+
+def intern_text(value):
+    """Interns short repeated strings such as sender addresses and thread ids."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+class EmailRecord(MutableMapping):
+    """
+    Compact parsed email, as returned by EmailProcessor.parse_message.
+    Fields live in __slots__ instead of a per-message dict, senders, thread ids and
+    label lists are interned, and the body is kept as the encoded data of the chosen
+    MIME part until it is first read. The record is a mutable mapping with the same keys
+    as the dict parse_message used to return, so callers can keep using
+    record['body'], record.get('labels') and record['summary'] = ...; keys outside
+    FIELDS are kept in a small side dict.
+    """
+    __slots__ = ('id', 'threadId', 'snippet', 'sender', 'subject', 'date', 'internalDate', 'is_read', 'labels',
+                 '_body', '_body_source', '_processor', '_clean_body', '_timestamp_ms', '_extra')
+    FIELDS = ('id', 'threadId', 'snippet', 'sender', 'subject', 'date', 'internalDate', 'body', 'is_read', 'labels')
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, id, threadId, snippet, sender, subject, date, is_read, labels,
+                 body=None, body_source=None, processor=None, internal_date=None):
+        self.id = id
+        self.threadId = intern_text(threadId)
+        self.snippet = snippet
+        self.sender = intern_text(sender)
+        self.subject = subject
+        self.date = date
+        self.internalDate = int(internal_date) if internal_date else None # Gmail's receive time (epoch ms)
+        self.is_read = is_read
+        self.labels = intern_labels(labels)
+        self._body = body
+        self._body_source = body_source # Arguments for processor.decode_body until the body is decoded
+        self._processor = processor # Decodes the body and stores the finished parse
+        self._clean_body = None
+        self._timestamp_ms = None
+        self._extra = None
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Builds a record from a parse_message dict, e.g. one loaded from the message store."""
+        record = cls(data['id'], data['threadId'], data.get('snippet', ''), data.get('sender', 'N/A'),
+                     data.get('subject', 'N/A'), data.get('date', 'N/A'), data.get('is_read', True),
+                     data.get('labels'), body=data.get('body', ''), internal_date=data.get('internalDate'))
+        for key, value in data.items():
+            if key not in cls._FIELD_SET:
+                record[key] = value
+        return record
+
+    @property
+    def body(self) -> str:
+        """The plain-text body, decoded from the base64 payload on first access."""
+        if self._body is None:
+            source, self._body_source = self._body_source, None
+            processor, self._processor = self._processor, None
+            if processor is None or source is None:
+                self._body = ''
+            else:
+                self._body = processor.decode_body(*source)
+                processor.body_decoded(self)
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+        self._body_source = None
+        self._clean_body = None
+
+    @property
+    def clean_body(self) -> str:
+        """The body without quoted history, signature and footers (see body_cleaner), computed once."""
+        if self._clean_body is None:
+            self._clean_body = clean_email_body(self.body)
+        return self._clean_body
+
+    @property
+    def timestamp_ms(self) -> int:
+        """Epoch milliseconds used to order the thread (see date_utils.timestamp_ms), computed once."""
+        if self._timestamp_ms is None:
+            self._timestamp_ms = timestamp_ms(self.internalDate, self.date)
+        return self._timestamp_ms
+
+    def release_body(self):
+        """
+        Drops the body text and its undecoded source once only the headers are still needed,
+        e.g. after the thread has been summarized. Reading the body afterwards returns ''.
+        """
+        self._body = ''
+        self._body_source = None
+        self._processor = None
+        self._clean_body = None
+
+    @property
+    def body_loaded(self) -> bool:
+        """True once the body has been decoded (reading it never triggers a decode)."""
+        return self._body is not None
+
+    def __getitem__(self, key):
+        if key == 'body':
+            return self.body
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'labels':
+            self.labels = intern_labels(value)
+        elif key in ('date', 'internalDate'):
+            setattr(self, key, int(value) if key == 'internalDate' and value else value)
+            self._timestamp_ms = None
+        elif key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELD_SET or self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return len(self.FIELDS) + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key):
+        return key in self._FIELD_SET or (self._extra is not None and key in self._extra)
+
+    def to_dict(self) -> dict:
+        """Returns a plain dict copy (decoding the body), e.g. for JSON serialization."""
+        data = {key: getattr(self, key) for key in self.FIELDS}
+        data['labels'] = list(self.labels)
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def copy(self) -> dict:
+        return self.to_dict()
+
+    def __repr__(self):
+        return f"EmailRecord(id={self.id!r}, threadId={self.threadId!r}, sender={self.sender!r}, subject={self.subject!r})"
@@ -0,0 +1,140 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException, status
+from ..config.settings import Settings
+
+# Gmail API quota units charged per call (https://developers.google.com/gmail/api/reference/quota).
+QUOTA_COST = {
+    'getProfile': 1,
+    'history.list': 2,
+    'messages.list': 5,
+    'messages.get': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+}
+
+def encode_cursor(query: str, page_token: str = None, offset: int = 0) -> str:
+    """Encodes where a truncated fetch stopped: the window query, the list page and the position inside it."""
+    payload = json.dumps({'q': query, 't': page_token, 'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> dict:
+    """Decodes a continuation cursor into {'query', 'page_token', 'offset'}."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {'query': payload['q'], 'page_token': payload.get('t'), 'offset': int(payload.get('o', 0))}
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid continuation cursor."
+        )
+
+def resume_point(cursor: str, query: str):
+    """
+    Returns the (page_token, offset) a continuation cursor resumes from, or (None, 0)
+    without a cursor. A cursor only continues the window it was issued for.
+    """
+    if not cursor:
+        return None, 0
+    resume = decode_cursor(cursor)
+    if resume['query'] != query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Continuation cursor does not match the requested window."
+        )
+    return resume['page_token'], resume['offset']
+
+class FetchBudget:
+    """
+    Per-request limits on the messages, threads and Gmail API quota units a fetch
+    may consume. GmailClient fills the budget newest-first (the order Gmail lists
+    results in) and stops paginating once it is spent; if anything was left out,
+    `truncated` is set and `cursor` tells the next request where to continue.
+    """
+    def __init__(self, max_messages: int = None, max_threads: int = None, max_quota_units: int = None):
+        self.max_messages = max_messages
+        self.max_threads = max_threads
+        self.max_quota_units = max_quota_units
+        self.messages_used = 0
+        self.threads_used = 0
+        self.quota_used = 0
+        self.truncated = False
+        self.cursor = None
+
+    @classmethod
+    def from_settings(cls, max_messages: int = None, max_threads: int = None):
+        """Builds the default per-request budget, optionally overriding the item limits."""
+        return cls(
+            max_messages=max_messages or Settings.MAX_EMAILS_PER_BATCH,
+            max_threads=max_threads or Settings.MAX_THREADS_PER_REQUEST,
+            max_quota_units=Settings.MAX_QUOTA_UNITS_PER_REQUEST
+        )
+
+    def charge(self, method: str, count: int = 1):
+        """Records `count` calls of a Gmail API method against the quota budget."""
+        self.quota_used += QUOTA_COST[method] * count
+
+    def can_afford(self, method: str, count: int = 1) -> bool:
+        """True if `count` more calls of `method` fit in the remaining quota units."""
+        if self.max_quota_units is None:
+            return True
+        return self.quota_used + QUOTA_COST[method] * count <= self.max_quota_units
+
+    def affordable(self, method: str, count: int) -> int:
+        """How many of `count` calls of `method` fit in the remaining quota units."""
+        if self.max_quota_units is None:
+            return count
+        return max(0, min(count, (self.max_quota_units - self.quota_used) // QUOTA_COST[method]))
+
+    def remaining_threads(self):
+        return None if self.max_threads is None else max(0, self.max_threads - self.threads_used)
+
+    def remaining_messages(self):
+        return None if self.max_messages is None else max(0, self.max_messages - self.messages_used)
+
+    @property
+    def exhausted(self) -> bool:
+        """True once no further thread or message may be fetched."""
+        return self.remaining_threads() == 0 or self.remaining_messages() == 0
+
+    def take_messages(self, count: int, method: str = 'messages.get') -> int:
+        """
+        Admits up to `count` messages in list order, charging one `method` call each
+        (None for messages served locally). Returns how many fit.
+        """
+        allowed = count
+        remaining = self.remaining_messages()
+        if remaining is not None:
+            allowed = min(allowed, remaining)
+        if method:
+            allowed = self.affordable(method, allowed)
+            self.charge(method, allowed)
+        self.messages_used += allowed
+        return allowed
+
+    def admit_thread(self, message_count: int) -> bool:
+        """
+        Counts a fetched thread and its messages against the budget. Returns False if
+        its messages no longer fit; the first thread is always admitted so that every
+        request makes progress.
+        """
+        remaining = self.remaining_messages()
+        if remaining is not None and message_count > remaining and self.threads_used:
+            return False
+        self.threads_used += 1
+        self.messages_used += message_count
+        return True
+
+    def truncate(self, query: str, page_token: str = None, offset: int = 0):
+        """Marks the fetch as truncated and records where the next request should resume."""
+        self.truncated = True
+        self.cursor = encode_cursor(query, page_token, offset)
+
+    def summary(self) -> dict:
+        return {
+            'messages': self.messages_used,
+            'threads': self.threads_used,
+            'quota_units': self.quota_used,
+            'truncated': self.truncated
+        }
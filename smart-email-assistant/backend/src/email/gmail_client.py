@@ -1,27 +1,75 @@
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from ..auth.gmail_auth import GmailAuth
+from .message_store import MessageStore
 from ..config.settings import Settings
 import base64
 import email
+import time
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status # Import HTTPException and status
 from ..utils.logger import logger
 
+def start_of_day(moment: datetime) -> datetime:
+    """Truncates a datetime to local midnight, matching Gmail's after:/before: date queries."""
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def build_window_query(after: datetime, before: datetime = None) -> str:
+    """Builds the Gmail search query for messages received in [after, before)."""
+    query = f"after:{after.strftime('%Y/%m/%d')}"
+    if before:
+        query += f" before:{before.strftime('%Y/%m/%d')}"
+    return query
+
+# Message formats kept in the message store (EmailProcessor parses either).
+STORED_FORMATS = ('full', 'raw')
+
+class HistoryExpiredError(Exception):
+    """Raised when a stored historyId is too old for users.history.list (HTTP 404)."""
+    pass
+
 class GmailClient:
     """
     Wrapper for Gmail API interactions.
     """
-    def __init__(self):
+    # Gmail rejects batch requests with more than 100 calls.
+    MAX_BATCH_SIZE = 100
+    # Per-item errors inside a batch that are worth retrying in a follow-up batch.
+    RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, http=None):
         self.auth = GmailAuth()
+        self.http = http # Optional httplib2-compatible transport, e.g. a gmail_transport.ReplayTransport
         self._service = None # Defer service building
+        self.last_fetch_stats = self._new_fetch_stats()
+        # Full messages are immutable, so they are kept on disk (or in memory when the store is disabled)
+        self.message_store = MessageStore(Settings.MESSAGE_STORE_PATH if Settings.ENABLE_MESSAGE_STORE else ':memory:')
+
+    def reset_fetch_stats(self, mode='full'):
+        """Starts a fresh set of fetch counters for a new bulk fetch."""
+        self.last_fetch_stats = self._new_fetch_stats()
+        self.last_fetch_stats['mode'] = mode
+
+    def _new_fetch_stats(self):
+        """Counters describing the API traffic of the most recent bulk fetch."""
+        return {
+            'mode': 'full', 'list_pages': 0, 'history_pages': 0, 'batches': 0, 'round_trips': 0,
+            'messages': 0, 'threads': 0, 'threads_unchanged': 0, 'threads_hydrated': 0, 'store_hits': 0, 'failed': 0
+        }
 
     def _get_service(self):
         """Gets or builds the Gmail API service, authenticating if necessary."""
         if self._service is None:
             try:
-                creds = self.auth.authenticate() # This is where authentication is triggered
-                self._service = build('gmail', 'v1', credentials=creds)
+                from googleapiclient.discovery import build # Heavy; imported on first use
+                if self.http is None and Settings.GMAIL_TRANSPORT_MODE != 'live':
+                    from .gmail_transport import build_transport
+                    self.http = build_transport(self.auth)
+                # Use the discovery document bundled with google-api-python-client instead of fetching it
+                if self.http is not None:
+                    self._service = build('gmail', 'v1', http=self.http, static_discovery=True, cache_discovery=False)
+                else:
+                    creds = self.auth.authenticate() # This is where authentication is triggered
+                    self._service = build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
             except Exception as e:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -33,7 +81,7 @@ class GmailClient:
         """Fetches the user's Gmail profile."""
         service = self._get_service()
         try:
-            profile = service.users().getProfile(userId='me').execute()
+            profile = service.users().getProfile(userId='me').execute(num_retries=Settings.GMAIL_MAX_RETRIES)
             return profile
         except HttpError as error:
             raise HTTPException(
@@ -43,28 +91,57 @@ class GmailClient:
 
     def list_messages(self, query=''):
         """Lists messages from the user's inbox."""
+        return [stub for _, page in self.iter_message_pages(query) for stub in page]
+
+    def iter_message_pages(self, query='', page_token=None, budget=None):
+        """
+        Yields (page_token, messages) for each users.messages.list page, newest first,
+        where page_token is the token that requested the page (None for the first one).
+        With a FetchBudget, listing stops once the budget is spent or cannot pay for
+        another page, and the budget records where to continue.
+        """
         service = self._get_service()
-        try:
-            response = service.users().messages().list(userId='me', q=query).execute()
-            messages = []
-            if 'messages' in response:
-                messages.extend(response['messages'])
-            while 'nextPageToken' in response:
-                page_token = response['nextPageToken']
-                response = service.users().messages().list(userId='me', q=query, pageToken=page_token).execute()
-                messages.extend(response['messages'])
-            return messages
-        except HttpError as error:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to list messages from Gmail API: {error}"
-            )
+        params = {'userId': 'me', 'q': query}
+        while True:
+            if budget is not None and budget.truncated:
+                return
+            if budget is not None and (budget.exhausted or not budget.can_afford('messages.list')):
+                budget.truncate(query, page_token)
+                return
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                response = service.users().messages().list(**params).execute(num_retries=Settings.GMAIL_MAX_RETRIES)
+            except HttpError as error:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to list messages from Gmail API: {error}"
+                )
+            self.last_fetch_stats['list_pages'] += 1
+            self.last_fetch_stats['round_trips'] += 1
+            if budget is not None:
+                budget.charge('messages.list')
+            yield page_token, response.get('messages', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
 
-    def get_message(self, msg_id):
-        """Retrieves a specific message by ID."""
+    def get_message(self, msg_id, msg_format='full'):
+        """Retrieves a specific message by ID, serving full messages from the message store when possible."""
+        if msg_format in STORED_FORMATS:
+            stored = self.message_store.get(msg_id)
+            if stored:
+                return stored
+        message = self._fetch_message(msg_id, msg_format)
+        if message and msg_format in STORED_FORMATS:
+            self.message_store.put_many([message])
+        return message
+
+    def _fetch_message(self, msg_id, msg_format='full'):
+        """Downloads a single message from the Gmail API."""
         service = self._get_service()
         try:
-            message = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
+            message = service.users().messages().get(userId='me', id=msg_id, format=msg_format).execute(num_retries=Settings.GMAIL_MAX_RETRIES)
             return message
         except HttpError as error:
             raise HTTPException(
@@ -72,47 +149,506 @@ class GmailClient:
                 detail=f"Failed to retrieve message {msg_id} from Gmail API: {error}"
             )
 
-    def get_messages_from_last_n_days(self, days=Settings.DAYS_TO_PROCESS):
-        """Fetches emails from the last N days."""
-        date_cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y/%m/%d')
-        query = f'after:{date_cutoff}'
-        try:
-            message_ids = self.list_messages(query=query)
+    def get_messages(self, message_ids, msg_format='full'):
+        """
+        Retrieves several messages, keeping the order of `message_ids`.
+        Full messages already in the message store are served from disk; the rest are
+        downloaded and stored. Messages that could not be fetched are logged and left
+        out of the result. msg_format='raw' downloads the RFC 822 source instead of the
+        parsed payload; stored messages of either format are served as they are, since
+        EmailProcessor.parse_message reads both.
+        """
+        if msg_format not in STORED_FORMATS:
+            return self._download_messages(message_ids, msg_format)
+        stored = self.message_store.get_many(message_ids)
+        self.last_fetch_stats['store_hits'] += len(stored)
+        missing = [msg_id for msg_id in message_ids if msg_id not in stored]
+        downloaded = self._download_messages(missing, msg_format) if missing else []
+        self.message_store.put_many(downloaded)
+        stored.update((message['id'], message) for message in downloaded)
+        return [stored[msg_id] for msg_id in message_ids if msg_id in stored]
+
+    def refresh_labels(self, message_ids):
+        """
+        Re-reads labels for stored messages with a cheap format='minimal' request
+        (no headers or payload) and updates the message store.
+        Returns the minimal message resources.
+        """
+        if not message_ids:
+            return []
+        minimal = self._download_messages(message_ids, 'minimal')
+        self.message_store.update_labels(minimal)
+        return minimal
+
+    def _download_messages(self, message_ids, msg_format='full'):
+        """
+        Downloads messages from the Gmail API, keeping the order of `message_ids`.
+        Uses Gmail batch requests when Settings.USE_BATCH_FETCH is enabled,
+        otherwise falls back to one request per ID.
+        """
+        if not message_ids:
+            return []
+        if not Settings.USE_BATCH_FETCH:
             emails = []
             for msg_id in message_ids:
-                email_data = self.get_message(msg_id['id'])
+                try:
+                    email_data = self._fetch_message(msg_id, msg_format)
+                except HTTPException as e:
+                    logger.warning("Fetch of message %s failed: %s", msg_id, e.detail)
+                    self.last_fetch_stats['failed'] += 1
+                    continue
+                finally:
+                    self.last_fetch_stats['round_trips'] += 1
                 if email_data:
                     emails.append(email_data)
+            self.last_fetch_stats['messages'] += len(emails)
             return emails
+        return self._get_messages_batched(message_ids, msg_format)
+
+    def _get_messages_batched(self, message_ids, msg_format='full'):
+        """Fetches messages through the Gmail HTTP batch endpoint."""
+        service = self._get_service()
+        emails = self._execute_batched(
+            message_ids,
+            lambda msg_id: service.users().messages().get(userId='me', id=msg_id, format=msg_format),
+            Settings.GMAIL_BATCH_SIZE,
+            kind='message'
+        )
+        self.last_fetch_stats['messages'] += len(emails)
+        return emails
+
+    def _execute_batched(self, item_ids, build_request, batch_size, kind='message'):
+        """
+        Runs one API request per ID through the Gmail HTTP batch endpoint in groups of
+        at most MAX_BATCH_SIZE, returning the responses in the order of `item_ids`.
+        Items that fail with a retryable status are re-queued into follow-up batches;
+        other per-item failures are logged and skipped.
+        """
+        service = self._get_service()
+        batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        results = {}
+        pending = list(dict.fromkeys(item_ids)) # De-duplicate while keeping order
+        failed = {}
+        batches = 0
+
+        for attempt in range(Settings.GMAIL_MAX_RETRIES + 1):
+            if not pending:
+                break
+            retry = []
+
+            def _callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                    failed.pop(request_id, None)
+                    return
+                failed[request_id] = exception
+                status_code = getattr(getattr(exception, 'resp', None), 'status', None)
+                if status_code in self.RETRYABLE_STATUS_CODES:
+                    retry.append(request_id)
+                else:
+                    logger.warning("Batch fetch of %s %s failed: %s", kind, request_id, exception)
+
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                batch = service.new_batch_http_request(callback=_callback)
+                for item_id in chunk:
+                    batch.add(build_request(item_id), request_id=item_id)
+                batch.execute()
+                batches += 1
+                self.last_fetch_stats['batches'] += 1
+                self.last_fetch_stats['round_trips'] += 1
+
+            pending = retry
+            if pending and attempt < Settings.GMAIL_MAX_RETRIES:
+                delay = Settings.GMAIL_RETRY_DELAY * (2 ** attempt)
+                logger.info(f"Retrying {len(pending)} throttled {kind}s in {delay:.1f}s (attempt {attempt + 2}).")
+                time.sleep(delay)
+
+        for item_id in pending:
+            logger.warning(f"Giving up on {kind} {item_id} after {Settings.GMAIL_MAX_RETRIES + 1} batch attempts: {failed.get(item_id)}")
+
+        responses = [results[item_id] for item_id in item_ids if item_id in results]
+        self.last_fetch_stats['failed'] += len(failed)
+        logger.info(f"Batched fetch: {len(responses)} {kind}s in {batches} batches, {len(failed)} failed.")
+        return responses
+
+    def get_messages_from_last_n_days(self, days=Settings.DAYS_TO_PROCESS):
+        """Fetches emails from the last N days."""
+        after = start_of_day(datetime.now() - timedelta(days=days))
+        return self.get_messages_in_window(after)
+
+    def get_messages_for_today(self):
+        """Fetches emails received on the current date."""
+        today = start_of_day(datetime.now())
+        return self.get_messages_in_window(today, today + timedelta(days=1))
+
+    def get_messages_in_window(self, after: datetime, before: datetime = None, budget=None, page_token=None, offset=0, msg_format='full'):
+        """
+        Lists and fetches the messages received in [after, before), newest first.
+        With a FetchBudget, listing stops as soon as the budget is full and the budget
+        records the continuation cursor; `page_token` and `offset` resume a previous,
+        truncated fetch. `msg_format` is 'full' or 'raw'.
+        """
+        self.reset_fetch_stats()
+        query = build_window_query(after, before)
+        try:
+            message_ids = []
+            for token, stubs in self.iter_message_pages(query, page_token, budget):
+                skip, offset = offset, 0 # The resume offset only applies to the first page
+                stubs = stubs[skip:]
+                allowed = budget.take_messages(len(stubs)) if budget is not None else len(stubs)
+                message_ids.extend(stub['id'] for stub in stubs[:allowed])
+                if allowed < len(stubs):
+                    budget.truncate(query, token, skip + allowed)
+                    break
+            return self.get_messages(message_ids, msg_format)
         except HttpError as error:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to fetch messages from last {days} days from Gmail API: {error}"
+                detail=f"Failed to fetch messages since {after:%Y/%m/%d} from Gmail API: {error}"
             )
 
-    def get_messages_for_today(self):
-        """Fetches emails received on the current date."""
-        today = datetime.now().strftime('%Y/%m/%d')
-        query = f'after:{today} before:{(datetime.now() + timedelta(days=1)).strftime("%Y/%m/%d")}'
+    def list_history(self, start_history_id):
+        """
+        Lists mailbox changes since `start_history_id` via users.history.list.
+        Returns the IDs of added, deleted and relabelled messages plus the newest historyId.
+        Raises HistoryExpiredError when Gmail no longer has history for that ID.
+        """
+        service = self._get_service()
+        changes = {'added': [], 'deleted': [], 'labels_changed': [], 'history_id': start_history_id}
+        params = {
+            'userId': 'me',
+            'startHistoryId': start_history_id,
+            'historyTypes': ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+        }
         try:
-            message_ids = self.list_messages(query=query)
-            emails = []
-            for msg_id in message_ids:
-                email_data = self.get_message(msg_id['id'])
-                if email_data:
-                    emails.append(email_data)
-            return emails
+            while True:
+                response = service.users().history().list(**params).execute(num_retries=Settings.GMAIL_MAX_RETRIES)
+                self.last_fetch_stats['history_pages'] += 1
+                self.last_fetch_stats['round_trips'] += 1
+                for record in response.get('history', []):
+                    changes['added'].extend(item['message']['id'] for item in record.get('messagesAdded', []))
+                    changes['deleted'].extend(item['message']['id'] for item in record.get('messagesDeleted', []))
+                    changes['labels_changed'].extend(item['message']['id'] for item in record.get('labelsAdded', []))
+                    changes['labels_changed'].extend(item['message']['id'] for item in record.get('labelsRemoved', []))
+                changes['history_id'] = response.get('historyId', changes['history_id'])
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    return changes
+                params['pageToken'] = page_token
         except HttpError as error:
+            if error.resp.status == 404:
+                raise HistoryExpiredError(f"History ID {start_history_id} has expired.")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to fetch messages for today from Gmail API: {error}"
+                detail=f"Failed to list mailbox history from Gmail API: {error}"
+            )
+
+    def sync_messages(self, after: datetime, before: datetime = None, sync_state: dict = None, budget=None, offset=0, msg_format='full'):
+        """
+        Incrementally fetches the messages received in [after, before).
+        `sync_state` is the value returned by a previous call (or None). When it holds a
+        historyId whose window covers `after`, only messages added or relabelled since
+        then are downloaded; otherwise, or when the historyId has expired, the whole
+        window is listed again. Returns (emails, new_sync_state).
+        With a FetchBudget only the newest messages of the window that fit are returned,
+        starting at `offset`; the changes themselves are always applied in full so the
+        sync state stays consistent. Unknown messages are downloaded in `msg_format`.
+        """
+        self.reset_fetch_stats()
+        sync_state = sync_state or {}
+        after_ms = int(after.timestamp() * 1000)
+        before_ms = int(before.timestamp() * 1000) if before else None
+        known = dict(sync_state.get('messages', {})) # msg_id -> internalDate (ms)
+        changed_ids = [] # Messages that are new or whose labels may have changed
+        new_ids = set() # Changed messages that are new, so most likely inside the window
+        history_id = sync_state.get('history_id')
+        window_start_ms = sync_state.get('window_start_ms')
+
+        incremental = bool(history_id) and window_start_ms is not None and window_start_ms <= after_ms
+        if incremental:
+            try:
+                changes = self.list_history(history_id)
+                for msg_id in changes['deleted']:
+                    known.pop(msg_id, None)
+                self.message_store.delete(changes['deleted'])
+                changed_ids = list(dict.fromkeys(changes['added'] + changes['labels_changed']))
+                new_ids = set(changes['added'])
+                history_id = changes['history_id']
+                self.last_fetch_stats['mode'] = 'incremental'
+            except HistoryExpiredError as e:
+                logger.info(f"{e} Falling back to a full window scan.")
+                incremental = False
+
+        if not incremental:
+            # Read the historyId before listing so nothing that arrives mid-scan is missed next time
+            history_id = self.get_user_profile().get('historyId')
+            self.last_fetch_stats['round_trips'] += 1
+            known = {}
+            changed_ids = [msg['id'] for msg in self.list_messages(query=build_window_query(after, before))]
+            new_ids = set(changed_ids) # Listed by the window query
+            window_start_ms = after_ms
+
+        # Stored messages only need their labels refreshed and new ones are downloaded in full.
+        # Relabelled messages that are not stored may be old mail: only their date and labels
+        # are read here, and get_messages below downloads the ones that fall inside the window.
+        stored_ids = self.message_store.known_ids(changed_ids)
+        unstored_ids = [msg_id for msg_id in changed_ids if msg_id not in stored_ids]
+        updated = self.refresh_labels([msg_id for msg_id in changed_ids if msg_id in stored_ids])
+        updated += self._download_messages([msg_id for msg_id in unstored_ids if msg_id not in new_ids], 'minimal')
+        updated += self.get_messages([msg_id for msg_id in unstored_ids if msg_id in new_ids], msg_format)
+        for message in updated:
+            labels = message.get('labelIds', [])
+            if 'SPAM' in labels or 'TRASH' in labels:
+                known.pop(message['id'], None)
+                continue
+            known[message['id']] = int(message.get('internalDate', 0))
+
+        def in_window(date_ms):
+            return date_ms >= after_ms and (before_ms is None or date_ms < before_ms)
+
+        window_ids = [msg_id for msg_id, date_ms in sorted(known.items(), key=lambda item: item[1], reverse=True) if in_window(date_ms)]
+        if offset or budget is not None:
+            window_ids = window_ids[offset:]
+            allowed = budget.take_messages(len(window_ids), method=None) if budget is not None else len(window_ids)
+            if allowed < len(window_ids):
+                budget.truncate(build_window_query(after, before), None, offset + allowed)
+            window_ids = window_ids[:allowed]
+        emails = self.get_messages(window_ids, msg_format) # Served from the store; evicted messages are re-downloaded
+
+        # Keep covering earlier windows, so alternating between them stays incremental, but
+        # only back to SYNC_STATE_MAX_DAYS ago: the state must not grow with the mailbox
+        oldest_ms = int((datetime.now() - timedelta(days=Settings.SYNC_STATE_MAX_DAYS)).timestamp() * 1000)
+        window_start_ms = max(window_start_ms, min(after_ms, oldest_ms))
+        new_state = {
+            'history_id': history_id,
+            'window_start_ms': window_start_ms,
+            'messages': {msg_id: date_ms for msg_id, date_ms in known.items() if date_ms >= window_start_ms}
+        }
+        logger.info(
+            f"Sync ({self.last_fetch_stats['mode']}): {len(changed_ids)} changed messages, "
+            f"{len(emails)} in window, {self.last_fetch_stats['store_hits']} served from the message store, "
+            f"{self.last_fetch_stats['round_trips']} round trips."
+        )
+        return emails, new_state
+
+    def list_threads(self, query=''):
+        """Lists threads (id, snippet, historyId) matching a query via users.threads.list."""
+        return [stub for _, page in self.iter_thread_pages(query) for stub in page]
+
+    def iter_thread_pages(self, query='', page_token=None, budget=None):
+        """
+        Yields (page_token, threads) for each users.threads.list page, where page_token is
+        the token that requested the page (None for the first one), so callers can start
+        working on the first threads before the rest of the window has been listed.
+        With a FetchBudget, listing stops once the budget is spent or cannot pay for
+        another page, and the budget records where to continue.
+        """
+        service = self._get_service()
+        params = {'userId': 'me', 'q': query}
+        while True:
+            if budget is not None and budget.truncated:
+                return
+            if budget is not None and (budget.exhausted or not budget.can_afford('threads.list')):
+                budget.truncate(query, page_token)
+                return
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                response = service.users().threads().list(**params).execute(num_retries=Settings.GMAIL_MAX_RETRIES)
+            except HttpError as error:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to list threads from Gmail API: {error}"
+                )
+            self.last_fetch_stats['list_pages'] += 1
+            self.last_fetch_stats['round_trips'] += 1
+            if budget is not None:
+                budget.charge('threads.list')
+            yield page_token, response.get('threads', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    def get_threads(self, thread_ids, thread_format='full'):
+        """
+        Retrieves several threads through batch requests, keeping the order of
+        `thread_ids`. With thread_format='metadata' only Settings.METADATA_HEADERS,
+        labelIds, snippet and internalDate are returned for each message.
+        Messages of full threads are added to the message store.
+        """
+        if not thread_ids:
+            return []
+        if not Settings.USE_BATCH_FETCH:
+            threads = []
+            for thread_id in thread_ids:
+                try:
+                    threads.append(self.get_thread(thread_id, thread_format))
+                except HTTPException as e:
+                    logger.warning("Fetch of thread %s failed: %s", thread_id, e.detail)
+                    self.last_fetch_stats['failed'] += 1
+                self.last_fetch_stats['round_trips'] += 1
+            self.last_fetch_stats['threads'] += len(threads)
+            return threads
+        service = self._get_service()
+        threads = self._execute_batched(
+            thread_ids,
+            lambda thread_id: self._thread_request(service, thread_id, thread_format),
+            Settings.GMAIL_THREAD_BATCH_SIZE,
+            kind='thread'
+        )
+        if thread_format == 'full':
+            for thread in threads:
+                self.message_store.put_many(thread.get('messages', []))
+        self.last_fetch_stats['threads'] += len(threads)
+        return threads
+
+    def _thread_request(self, service, thread_id, thread_format='full'):
+        """Builds a users.threads.get request for the given format."""
+        if thread_format == 'metadata':
+            return service.users().threads().get(
+                userId='me', id=thread_id, format='metadata', metadataHeaders=Settings.METADATA_HEADERS
             )
+        return service.users().threads().get(userId='me', id=thread_id, format=thread_format)
+
+    def hydrate_threads(self, thread_message_ids, msg_format='full'):
+        """
+        Second phase of a metadata-first fetch: returns full threads for the given
+        {thread_id: [message IDs]} mapping. Threads whose messages are all in the
+        message store are rebuilt locally; the rest are downloaded with format='full'.
+        With msg_format='raw' the missing messages are downloaded one by one (in
+        batches of GMAIL_BATCH_SIZE) as RFC 822 source instead, since users.threads.get
+        has no raw format.
+        """
+        if msg_format == 'raw':
+            messages = {message['id']: message for message in self.get_messages(
+                [msg_id for msg_ids in thread_message_ids.values() for msg_id in msg_ids], 'raw'
+            )}
+            threads = {
+                thread_id: {'id': thread_id, 'messages': [messages[msg_id] for msg_id in msg_ids if msg_id in messages]}
+                for thread_id, msg_ids in thread_message_ids.items()
+            }
+            self.last_fetch_stats['threads_hydrated'] = len(threads)
+            logger.info(f"Hydrated {len(threads)} threads from raw messages.")
+            return threads
+        all_ids = [msg_id for msg_ids in thread_message_ids.values() for msg_id in msg_ids]
+        stored = self.message_store.get_many(all_ids)
+        self.last_fetch_stats['store_hits'] += len(stored)
+        threads = {}
+        missing = []
+        for thread_id, msg_ids in thread_message_ids.items():
+            if all(msg_id in stored for msg_id in msg_ids):
+                threads[thread_id] = {'id': thread_id, 'messages': [stored[msg_id] for msg_id in msg_ids]}
+            else:
+                missing.append(thread_id)
+        for thread in self.get_threads(missing, 'full'):
+            threads[thread['id']] = thread
+        self.last_fetch_stats['threads_hydrated'] = len(threads)
+        logger.info(f"Hydrated {len(threads)} threads, {len(missing)} downloaded in full.")
+        return threads
+
+    def get_threads_in_window(self, after: datetime, before: datetime = None, thread_state: dict = None, thread_format='full', budget=None):
+        """
+        Fetches every conversation with a message received in [after, before), once per
+        thread and with its earlier messages included, in the order Gmail lists them
+        (most recently active first). See fetch_thread_page for how `thread_state` is
+        used to skip unchanged threads. Returns (threads, new_thread_state).
+        """
+        self.reset_fetch_stats('threads')
+        thread_state = dict(thread_state or {})
+        threads = []
+        for page in self.iter_window_threads(build_window_query(after, before), thread_state, thread_format, budget):
+            threads.extend(page)
+        logger.info(
+            f"Thread fetch: {len(threads)} threads, {self.last_fetch_stats['threads']} downloaded, "
+            f"{self.last_fetch_stats['threads_unchanged']} unchanged, {self.last_fetch_stats['round_trips']} round trips."
+        )
+        return threads, thread_state
+
+    def iter_window_threads(self, query, thread_state: dict, thread_format='full', budget=None, page_token=None, offset=0):
+        """
+        Yields the fetched threads matching `query` one list page at a time.
+        With a FetchBudget, fetching stops as soon as the budget is spent and the budget
+        records the continuation cursor; `page_token` and `offset` resume a previous,
+        truncated fetch.
+        """
+        for token, stubs in self.iter_thread_pages(query, page_token, budget):
+            skip, offset = offset, 0 # The resume offset only applies to the first page
+            threads, consumed = self.fetch_thread_page(stubs[skip:], thread_state, thread_format, budget)
+            if skip + consumed < len(stubs):
+                budget.truncate(query, token, skip + consumed)
+            yield threads
+            if budget is not None and budget.truncated:
+                return
+
+    def fetch_thread_page(self, stubs, thread_state: dict, thread_format='full', budget=None):
+        """
+        Fetches the threads of one users.threads.list page, keeping their order.
+        `thread_state` maps thread IDs to the historyId and message IDs seen on a previous
+        run and is updated in place; threads whose historyId is unchanged are rebuilt
+        from the message store instead of being downloaded again (those may come back
+        in full format even when `thread_format` is 'metadata').
+        With a FetchBudget, threads are taken in list order until the thread, message or
+        quota limit is reached; metadata fetches are charged up front for their possible
+        full-format hydration. Returns (threads, consumed), where consumed is how many
+        of `stubs` were taken.
+        """
+        threads = {}
+        to_fetch = []
+        calls_per_thread = 2 if thread_format == 'metadata' else 1
+        thread_limit = budget.remaining_threads() if budget is not None else None
+        consumed = 0
+        for stub in stubs:
+            if thread_limit is not None and consumed >= thread_limit:
+                break
+            previous = thread_state.get(stub['id'])
+            if previous and previous.get('history_id') == stub.get('historyId'):
+                stored = self.message_store.get_many(previous['message_ids'])
+                if len(stored) == len(previous['message_ids']):
+                    threads[stub['id']] = {
+                        'id': stub['id'],
+                        'historyId': stub.get('historyId'),
+                        'messages': [stored[msg_id] for msg_id in previous['message_ids']]
+                    }
+                    self.last_fetch_stats['threads_unchanged'] += 1
+                    self.last_fetch_stats['store_hits'] += len(stored)
+                    consumed += 1
+                    continue
+            if budget is not None and not budget.can_afford('threads.get', calls_per_thread * (len(to_fetch) + 1)):
+                break
+            to_fetch.append(stub['id'])
+            consumed += 1
+
+        if budget is not None:
+            budget.charge('threads.get', calls_per_thread * len(to_fetch))
+        for thread in self.get_threads(to_fetch, thread_format):
+            threads[thread['id']] = thread
+
+        ordered = []
+        for index, stub in enumerate(stubs[:consumed]):
+            thread = threads.get(stub['id'])
+            if thread is None:
+                continue
+            if budget is not None and not budget.admit_thread(len(thread.get('messages', []))):
+                consumed = index
+                break
+            ordered.append(thread)
+            thread_state.pop(stub['id'], None) # Re-insert so recently seen threads are trimmed last
+            thread_state[stub['id']] = {
+                'history_id': thread.get('historyId'),
+                'message_ids': [message['id'] for message in thread.get('messages', [])]
+            }
+        while len(thread_state) > Settings.THREAD_STATE_MAX_ENTRIES:
+            thread_state.pop(next(iter(thread_state)))
+        return ordered, consumed
 
-    def get_thread(self, thread_id):
+    def get_thread(self, thread_id, thread_format='full'):
         """Retrieves a specific thread by ID."""
         service = self._get_service()
         try:
-            thread = service.users().threads().get(userId='me', id=thread_id).execute()
+            thread = self._thread_request(service, thread_id, thread_format).execute(num_retries=Settings.GMAIL_MAX_RETRIES)
+            if thread_format == 'full':
+                self.message_store.put_many(thread.get('messages', []))
             return thread
         except HttpError as error:
             raise HTTPException(
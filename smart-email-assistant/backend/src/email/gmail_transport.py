@@ -0,0 +1,374 @@
+import base64
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.parser import Parser
+from email.utils import format_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+# Query parameters that never identify a recorded response.
+VOLATILE_PARAMS = ('access_token', 'key', 'quotaUser')
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 429: 'Too Many Requests',
+                500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+def request_key(method: str, uri: str, ignore_params=()) -> str:
+    """
+    Normalizes a request to 'METHOD /path?sorted&query', so the same call matches
+    whether it was sent on its own or inside a batch.
+    """
+    parts = urlsplit(uri)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                    if k not in VOLATILE_PARAMS and k not in ignore_params)
+    return f"{method.upper()} {parts.path}?{urlencode(params)}"
+
+def _http_response(status: int, content_type: str = 'application/json; charset=UTF-8'):
+    """Builds the httplib2.Response googleapiclient expects from a transport."""
+    import httplib2
+    response = httplib2.Response({'status': str(status), 'content-type': content_type})
+    response.reason = HTTP_REASONS.get(status, '')
+    return response
+
+def _error_body(status: int, message: str) -> str:
+    return json.dumps({'error': {'code': status, 'message': message, 'errors': [{'message': message}]}})
+
+def _parse_multipart(content_type: str, body: str):
+    """Splits a multipart/mixed batch body into its parts."""
+    return Parser().parsestr(f"content-type: {content_type}\r\n\r\n{body}").get_payload()
+
+def _split_http_message(payload: str):
+    """Returns (first line, body) of an HTTP message embedded in a batch part."""
+    head, _, rest = payload.partition('\n')
+    for separator in ('\r\n\r\n', '\n\n'):
+        if separator in rest:
+            return head.strip(), rest.split(separator, 1)[1]
+    return head.strip(), ''
+
+class Cassette:
+    """
+    Recorded Gmail API responses in a gzip-compressed JSON-lines file, one
+    {"method", "url", "status", "body"} object per line. Batch requests are stored
+    as their individual calls, so a cassette can be replayed with any batch size.
+    Lines are appended as separate gzip members, which keeps recording crash-safe.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def entries(self):
+        """Yields every recorded entry in recording order."""
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def append(self, entries):
+        """Appends entries to the cassette file."""
+        if not entries:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries)
+        with self._lock:
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(lines)
+
+class RecordingTransport:
+    """
+    httplib2-compatible transport that forwards every request to a real (authorized)
+    Http object and records the responses into a Cassette.
+    """
+    def __init__(self, http, cassette: Cassette):
+        self.http = http
+        self.cassette = cassette
+
+    @property
+    def credentials(self):
+        # Lets googleapiclient authorize the calls inside batch requests
+        return getattr(self.http, 'credentials', None)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        response, content = self.http.request(uri, method=method, body=body, headers=headers,
+                                              redirections=redirections, connection_type=connection_type)
+        try:
+            self.cassette.append(self._entries(uri, method, body, headers or {}, response, content))
+        except Exception as e: # Recording must never break the live request
+            logger.warning(f"Could not record Gmail response for {method} {uri}: {e}")
+        return response, content
+
+    def _entries(self, uri, method, body, headers, response, content):
+        text = content.decode('utf-8') if isinstance(content, bytes) else content
+        if not urlsplit(uri).path.startswith('/batch') or response.status >= 300:
+            return [{'method': method, 'url': uri, 'status': response.status, 'body': text}]
+        content_type = {k.lower(): v for k, v in headers.items()}.get('content-type', '')
+        calls = {}
+        for part in _parse_multipart(content_type, body.decode('utf-8') if isinstance(body, bytes) else body):
+            request_line, _ = _split_http_message(part.get_payload())
+            call_method, path = request_line.split(' ')[:2]
+            calls[part['Content-ID'].strip('<>')] = (call_method, path)
+        entries = []
+        for part in _parse_multipart(response['content-type'], text):
+            status_line, part_body = _split_http_message(part.get_payload())
+            call = calls.get(part['Content-ID'].strip('<>').replace('response-', '', 1))
+            if call:
+                entries.append({'method': call[0], 'url': call[1], 'status': int(status_line.split(' ')[1]), 'body': part_body})
+        return entries
+
+class ReplayTransport:
+    """
+    httplib2-compatible transport that serves Gmail API calls from a Cassette, with
+    optional injected latency (per round trip and per call) and errors. Batch
+    requests are answered call by call, so injected errors hit individual items the
+    way Gmail's per-item 429s do. Calls missing from the cassette get a 404.
+    """
+    def __init__(self, cassette: Cassette, latency: float = 0.0, item_latency: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, match_query: bool = False, seed: int = None):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Search queries contain dates, so they are ignored by default to keep cassettes reusable
+        self.ignore_params = () if match_query else ('q',)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._served = {}
+        self.stats = {'round_trips': 0, 'calls': 0, 'misses': 0, 'injected_errors': 0}
+        for entry in cassette.entries():
+            key = request_key(entry['method'], entry['url'], self.ignore_params)
+            self._responses.setdefault(key, []).append((entry['status'], entry['body']))
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            Cassette(Settings.GMAIL_CASSETTE_PATH),
+            latency=Settings.GMAIL_REPLAY_LATENCY,
+            error_rate=Settings.GMAIL_REPLAY_ERROR_RATE
+        )
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        with self._lock:
+            self.stats['round_trips'] += 1
+        if not urlsplit(uri).path.startswith('/batch'):
+            status, content = self._serve(method, uri)
+            time.sleep(self.latency + self.item_latency)
+            return _http_response(status), content.encode('utf-8')
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = _parse_multipart(headers.get('content-type', ''), body.decode('utf-8') if isinstance(body, bytes) else body)
+        chunks = []
+        for part in parts:
+            request_line, _ = _split_http_message(part.get_payload())
+            call_method, path = request_line.split(' ')[:2]
+            status, content = self._serve(call_method, path)
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        time.sleep(self.latency + self.item_latency * len(parts))
+        return _http_response(200, f"multipart/mixed; boundary={boundary}"), ''.join(chunks).encode('utf-8')
+
+    def _serve(self, method, uri):
+        """Returns (status, body) for one call: an injected error, the recorded response or a 404."""
+        key = request_key(method, uri, self.ignore_params)
+        with self._lock:
+            self.stats['calls'] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats['injected_errors'] += 1
+                return self.error_status, _error_body(self.error_status, "Injected replay error")
+            recorded = self._responses.get(key)
+            if not recorded:
+                self.stats['misses'] += 1
+                logger.warning(f"Replay cassette has no response for {key}")
+                return 404, _error_body(404, f"Not recorded: {key}")
+            # Repeated calls walk through the recorded responses and then keep returning the last one
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            return recorded[min(index, len(recorded) - 1)]
+
+def build_transport(auth=None):
+    """
+    Returns the HTTP transport for Settings.GMAIL_TRANSPORT_MODE: a ReplayTransport
+    for 'replay', a RecordingTransport around an authorized Http for 'record'.
+    """
+    mode = Settings.GMAIL_TRANSPORT_MODE
+    if mode == 'replay':
+        return ReplayTransport.from_settings()
+    if mode == 'record':
+        import google_auth_httplib2
+        import httplib2
+        creds = auth.authenticate()
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=Settings.GMAIL_HTTP_TIMEOUT))
+        return RecordingTransport(http, Cassette(Settings.GMAIL_CASSETTE_PATH))
+    raise ValueError(f"Unknown GMAIL_TRANSPORT_MODE {mode!r}; expected 'live', 'record' or 'replay'.")
+
+class SyntheticMailbox:
+    """
+    Generates a deterministic fake mailbox and writes it as a replay cassette, so the
+    fetch paths can be benchmarked offline at any mailbox size. The cassette answers
+    users.getProfile, threads/messages list pages and threads.get / messages.get in
+    the formats GmailClient uses (including messages.get format='raw'). History is not recorded, so incremental sync falls
+    back to a full window scan.
+    """
+    SENDERS = [
+        'Alice Martin <alice@example.com>', 'Bob Chen <bob@example.org>', 'Carol Diaz <carol@example.net>',
+        'Deploy Bot <noreply@ci.example.com>', 'Weekly Digest <newsletter@news.example.com>',
+        'Dan Okafor <dan@example.com>', 'Billing <billing@vendor.example>'
+    ]
+    SUBJECTS = [
+        'Urgent: production outage follow-up', 'Meeting notes and next steps', 'Invoice {n} is due',
+        'Your weekly digest', 'Quick question about the roadmap', 'Action required: review the proposal',
+        'Lunch on Friday?', 'Build {n} passed'
+    ]
+    WORDS = ('the team will review the proposal before the deadline please confirm budget meeting '
+             'schedule update customer release notes feedback agenda priority invoice contract '
+             'timeline design document access request thanks regards').split()
+
+    def __init__(self, thread_count: int = 200, max_messages_per_thread: int = 4, days: int = None,
+                 body_words: int = 150, html_ratio: float = 0.3, page_size: int = 100,
+                 user_email: str = 'me@example.com', seed: int = 0):
+        self.thread_count = thread_count
+        self.max_messages_per_thread = max_messages_per_thread
+        self.days = days or Settings.DAYS_TO_PROCESS
+        self.body_words = body_words
+        self.html_ratio = html_ratio
+        self.page_size = page_size
+        self.user_email = user_email
+        self._random = random.Random(seed)
+
+    def write_cassette(self, path: str) -> dict:
+        """Generates the mailbox, replaces the cassette at `path` and returns its size."""
+        threads = self._threads()
+        messages = [message for thread in threads for message in thread['messages']]
+        if os.path.exists(path):
+            os.remove(path)
+        cassette = Cassette(path)
+        base = '/gmail/v1/users/me'
+        cassette.append([self._entry(f"{base}/profile?alt=json", {
+            'emailAddress': self.user_email, 'messagesTotal': len(messages),
+            'threadsTotal': len(threads), 'historyId': str(10 ** 6)
+        })])
+        cassette.append(self._list_pages(f"{base}/threads", 'threads', [
+            {'id': t['id'], 'snippet': t['messages'][-1]['snippet'], 'historyId': t['historyId']} for t in threads
+        ]))
+        newest_first = sorted(messages, key=lambda m: int(m['internalDate']), reverse=True)
+        cassette.append(self._list_pages(f"{base}/messages", 'messages', [
+            {'id': m['id'], 'threadId': m['threadId']} for m in newest_first
+        ]))
+        metadata_params = '&'.join(f"metadataHeaders={name}" for name in Settings.METADATA_HEADERS)
+        for thread in threads:
+            cassette.append([
+                self._entry(f"{base}/threads/{thread['id']}?format=full&alt=json", thread),
+                self._entry(f"{base}/threads/{thread['id']}?format=metadata&{metadata_params}&alt=json",
+                            {**thread, 'messages': [self._metadata(m) for m in thread['messages']]}),
+                self._entry(f"{base}/threads/{thread['id']}?format=minimal&alt=json",
+                            {**thread, 'messages': [self._minimal(m) for m in thread['messages']]}),
+            ])
+            for message in thread['messages']:
+                cassette.append([
+                    self._entry(f"{base}/messages/{message['id']}?format=full&alt=json", message),
+                    self._entry(f"{base}/messages/{message['id']}?format=metadata&alt=json", self._metadata(message)),
+                    self._entry(f"{base}/messages/{message['id']}?format=minimal&alt=json", self._minimal(message)),
+                    self._entry(f"{base}/messages/{message['id']}?format=raw&alt=json", self._raw(message)),
+                ])
+        size = {'threads': len(threads), 'messages': len(messages), 'bytes': os.path.getsize(path)}
+        logger.info(f"Wrote synthetic mailbox cassette {path}: {size}")
+        return size
+
+    def _threads(self):
+        """Builds the mailbox, most recently active thread first."""
+        now = datetime.now().astimezone()
+        threads = []
+        for t in range(self.thread_count):
+            thread_id = f"{t:016x}"
+            # Spread thread activity over the window, newest first
+            last_activity = now - timedelta(seconds=(t + 1) * self.days * 86400 / (self.thread_count + 1))
+            count = self._random.randint(1, self.max_messages_per_thread)
+            subject = self._random.choice(self.SUBJECTS).format(n=t)
+            messages = []
+            for m in range(count):
+                sent = last_activity - timedelta(minutes=(count - 1 - m) * self._random.randint(5, 240))
+                sender = self.user_email if m % 2 and self._random.random() < 0.5 else self._random.choice(self.SENDERS)
+                messages.append(self._message(f"{thread_id}{m:04x}", thread_id, sender, subject, sent, t * 100 + m))
+            threads.append({'id': thread_id, 'historyId': str(10 ** 6 - t), 'messages': messages})
+        return threads
+
+    def _message(self, msg_id, thread_id, sender, subject, sent, history_id):
+        text = ' '.join(self._random.choice(self.WORDS) for _ in range(self.body_words))
+        headers = [
+            {'name': 'From', 'value': sender}, {'name': 'To', 'value': self.user_email},
+            {'name': 'Subject', 'value': subject if history_id % 100 == 0 else f"Re: {subject}"},
+            {'name': 'Date', 'value': format_datetime(sent)}, {'name': 'Message-ID', 'value': f"<{msg_id}@example.com>"}
+        ]
+        if self._random.random() < self.html_ratio:
+            html = f"<html><body><p>{text}</p><table><tr><td>{sender}</td></tr></table></body></html>"
+            payload = {'mimeType': 'multipart/alternative', 'headers': headers, 'body': {'size': 0}, 'parts': [
+                {'partId': '0', 'mimeType': 'text/plain', 'headers': [], 'body': self._body(text)},
+                {'partId': '1', 'mimeType': 'text/html', 'headers': [], 'body': self._body(html)}
+            ]}
+        else:
+            payload = {'mimeType': 'text/plain', 'headers': headers, 'body': self._body(text)}
+        labels = ['INBOX'] + (['UNREAD'] if self._random.random() < 0.4 else [])
+        if 'noreply' in sender or 'newsletter' in sender:
+            labels.append('CATEGORY_UPDATES')
+        return {
+            'id': msg_id, 'threadId': thread_id, 'labelIds': labels, 'snippet': text[:100],
+            'historyId': str(history_id), 'internalDate': str(int(sent.timestamp() * 1000)),
+            'sizeEstimate': len(text) * 2, 'payload': payload
+        }
+
+    def _body(self, text):
+        data = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+        return {'size': len(text), 'data': data}
+
+    def _metadata(self, message):
+        headers = [h for h in message['payload']['headers'] if h['name'] in Settings.METADATA_HEADERS]
+        return {**message, 'payload': {'mimeType': message['payload']['mimeType'], 'headers': headers}}
+
+    def _minimal(self, message):
+        return {key: value for key, value in message.items() if key != 'payload'}
+
+    def _raw(self, message):
+        """The message as a format='raw' resource (base64url RFC 822 source)."""
+        payload = message['payload']
+        lines = [f"{header['name']}: {header['value']}" for header in payload['headers']] + ['MIME-Version: 1.0']
+        parts = payload.get('parts')
+        if parts:
+            boundary = f"=_{message['id']}"
+            lines += [f'Content-Type: multipart/alternative; boundary="{boundary}"', '']
+            for part in parts:
+                lines += [f"--{boundary}", *self._raw_part(part)]
+            lines.append(f"--{boundary}--")
+        else:
+            lines += self._raw_part(payload)
+        source = ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+        return {**self._minimal(message), 'raw': base64.urlsafe_b64encode(source).decode('ascii')}
+
+    def _raw_part(self, part):
+        data = base64.b64encode(base64.urlsafe_b64decode(part['body']['data'])).decode('ascii')
+        return [f"Content-Type: {part['mimeType']}; charset=utf-8", 'Content-Transfer-Encoding: base64', '',
+                *(data[i:i + 76] for i in range(0, len(data), 76))]
+
+    def _list_pages(self, path, field, items):
+        entries = []
+        for start in range(0, max(len(items), 1), self.page_size):
+            page = {field: items[start:start + self.page_size], 'resultSizeEstimate': len(items)}
+            if start + self.page_size < len(items):
+                page['nextPageToken'] = f"page-{start + self.page_size}"
+            token = f"&pageToken=page-{start}" if start else ''
+            entries.append(self._entry(f"{path}?alt=json{token}", page))
+        return entries
+
+    def _entry(self, url, body):
+        return {'method': 'GET', 'url': url, 'status': 200, 'body': json.dumps(body, separators=(',', ':'))}
@@ -0,0 +1,119 @@
+from html.parser import HTMLParser
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+# Elements whose content is never visible text.
+SKIP_TAGS = ('style', 'script', 'title', 'noscript', 'template', 'svg', 'xml')
+# Elements that start and end a paragraph of text.
+BLOCK_TAGS = frozenset((
+    'p', 'div', 'table', 'ul', 'ol', 'dl', 'blockquote', 'pre', 'hr',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'header', 'footer', 'center', 'form'
+))
+# Elements that end a line, so consecutive rows and list items are not separated by blank lines.
+LINE_TAGS = frozenset(('tr', 'li', 'dt', 'dd'))
+# Table cells: cells of a row stay on one line, so layout tables collapse into plain lines.
+CELL_TAGS = frozenset(('td', 'th'))
+# Invisible characters that marketing emails use as preheader padding.
+_INVISIBLE = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff\u034f\u00ad'), None)
+
+_etree = None # lxml.etree once loaded; False when it is not installed
+
+def load_html_engine():
+    """
+    Imports the HTML parser html_to_text will use and returns its name. Called on
+    first use (or by the startup warm-up) rather than at import to keep startup fast.
+    """
+    global _etree
+    if _etree is None:
+        try:
+            from lxml import etree
+            _etree = etree
+        except ImportError: # lxml is optional; the standard library's html.parser is used instead
+            _etree = False
+    if _etree and Settings.HTML_TEXT_ENGINE != "html.parser":
+        return "lxml"
+    return "html.parser"
+
+def html_to_text(html: str, max_chars: int = None) -> str:
+    """
+    Converts an HTML email body to plain text.
+    Input beyond `max_chars` (Settings.HTML_MAX_INPUT_CHARS) is ignored, <style>,
+    <script> and other invisible elements are skipped, and table cells are joined
+    row by row so nested layout tables collapse into ordinary lines. Uses lxml's
+    C parser when it is installed and the pure-Python html.parser (the parser the
+    BeautifulSoup conversion used) otherwise; both produce the same text layout.
+    """
+    if not html:
+        return ""
+    max_chars = max_chars or Settings.HTML_MAX_INPUT_CHARS
+    if len(html) > max_chars:
+        html = html[:max_chars]
+    if load_html_engine() == "lxml":
+        try:
+            return _lxml_to_text(html)
+        except Exception as e: # Malformed markup lxml refuses to parse
+            logger.debug("lxml could not convert HTML body, falling back to html.parser: %s", e)
+    return _htmlparser_to_text(html)
+
+def _lxml_to_text(html: str) -> str:
+    parser = _etree.HTMLParser(remove_comments=True, remove_pis=True, no_network=True)
+    root = _etree.fromstring(html, parser)
+    if root is None:
+        return ""
+    _etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+    parts = []
+    for event, element in _etree.iterwalk(root, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag in BLOCK_TAGS or tag == 'br':
+                parts.append('\n')
+            if element.text:
+                parts.append(element.text)
+        else:
+            if tag in BLOCK_TAGS or tag in LINE_TAGS:
+                parts.append('\n')
+            elif tag in CELL_TAGS:
+                parts.append(' ')
+            if element.tail:
+                parts.append(element.tail)
+    return _normalize(''.join(parts))
+
+class _TextExtractor(HTMLParser):
+    """Streams text out of html.parser events without building a document tree."""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS or tag == 'br':
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS or tag in LINE_TAGS:
+            self.parts.append('\n')
+        elif tag in CELL_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+def _htmlparser_to_text(html: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return _normalize(''.join(extractor.parts))
+
+def _normalize(text: str) -> str:
+    """Collapses whitespace inside lines and runs of blank lines."""
+    lines = []
+    for line in text.translate(_INVISIBLE).splitlines():
+        line = ' '.join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return '\n'.join(lines).strip()
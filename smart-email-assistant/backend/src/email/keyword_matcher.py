@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+class KeywordMatch(NamedTuple):
+    tier: str # Highest tier with a match, or the default tier
+    terms: tuple # Keywords of that tier found in the text, in order of first appearance
+
+class KeywordMatcher:
+    """
+    Matches tiered keyword lists ({"High": [...], "Medium": [...]}, highest tier first)
+    against text in a single scan. All keywords are compiled into one regex whose
+    alternatives are factored into a prefix trie, so the cost of a scan grows with the
+    text rather than with the number of keywords. Matching is case-insensitive, keywords
+    only match whole words ("important" does not match "unimportant") and spaces inside
+    a keyword match any run of whitespace. Build matchers with get_keyword_matcher so
+    each configuration is compiled once.
+    With few keywords, str.find locates the places where a keyword's first word occurs
+    and the regex only confirms the word boundaries there, instead of being tried at
+    every character of the text.
+    """
+    PREFILTER_MAX_KEYWORDS = 32 # Larger configurations are scanned with the regex alone
+    def __init__(self, tiers: dict, default_tier: str = "Low"):
+        self.tiers = tuple(tiers)
+        self.default_tier = default_tier
+        self._rank = {} # Normalized keyword -> index of its (highest) tier
+        for rank, tier in enumerate(self.tiers):
+            for keyword in tiers[tier]:
+                key = self._normalize(keyword)
+                if key:
+                    self._rank.setdefault(key, rank)
+        self._pattern = self._compile(self._rank) if self._rank else None
+        self._literals = self._first_words(self._rank) if len(self._rank) <= self.PREFILTER_MAX_KEYWORDS else None
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return ' '.join(text.lower().split())
+
+    @staticmethod
+    def _first_words(keywords) -> tuple:
+        """
+        Substrings every match starts with: the first word of each keyword, without the
+        words that start with another one (each occurrence of "requests" is found as
+        "request"; "report" is kept next to "port", which only finds it one character in).
+        """
+        words = sorted({keyword.split(' ')[0] for keyword in keywords}, key=len)
+        literals = []
+        for word in words:
+            if not any(word.startswith(literal) for literal in literals):
+                literals.append(word)
+        return tuple(literals)
+
+    @classmethod
+    def _compile(cls, keywords):
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True # End of a keyword
+        # Texts are lowercased before the scan, which is faster than re.IGNORECASE
+        return re.compile(rf"(?<!\w)(?:{cls._trie_pattern(trie)})(?!\w)")
+
+    @classmethod
+    def _trie_pattern(cls, node) -> str:
+        """Regex for a trie node; alternatives share their common prefixes."""
+        branches = []
+        for char in sorted(key for key in node if key):
+            atom = r'\s+' if char == ' ' else re.escape(char)
+            branches.append(atom + cls._trie_pattern(node[char]))
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if '' in node: # A keyword ends here and longer ones continue
+            # Longer keywords are tried first; the bare prefix is the fallback
+            return f"(?:{pattern})?" if len(branches) == 1 else f"{pattern[:-1]}|)"
+        return pattern
+
+    def match(self, *texts) -> KeywordMatch:
+        """Scans each text once and returns the highest matching tier with its terms."""
+        best = len(self.tiers)
+        found = {}
+        if self._pattern is not None:
+            for text in texts:
+                if not text:
+                    continue
+                for match in self._scan(text.lower()):
+                    key = self._normalize(match.group())
+                    rank = self._rank[key]
+                    if rank <= best:
+                        best = rank
+                        found.setdefault(key, rank)
+        if best == len(self.tiers):
+            return KeywordMatch(self.default_tier, ())
+        return KeywordMatch(self.tiers[best], tuple(term for term, rank in found.items() if rank == best))
+
+    def _scan(self, text):
+        """The keyword matches in a lowercased text, like self._pattern.finditer(text)."""
+        if self._literals is None:
+            yield from self._pattern.finditer(text)
+            return
+        starts = set()
+        for literal in self._literals:
+            start = text.find(literal)
+            while start != -1:
+                starts.add(start)
+                start = text.find(literal, start + 1)
+        end = 0
+        for start in sorted(starts):
+            if start < end:
+                continue # Inside the previous match, which finditer would not report either
+            match = self._pattern.match(text, start) # The lookbehind still sees the text before `start`
+            if match:
+                end = match.end()
+                yield match
+
+@lru_cache(maxsize=64)
+def _cached_matcher(tiers, default_tier):
+    return KeywordMatcher({tier: keywords for tier, keywords in tiers}, default_tier)
+
+def get_keyword_matcher(tiers: dict, default_tier: str = "Low") -> KeywordMatcher:
+    """Returns the compiled matcher for a keyword configuration, building it on first use."""
+    return _cached_matcher(tuple((tier, tuple(keywords)) for tier, keywords in tiers.items()), default_tier)
@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+class MessageStore:
+    """
+    On-disk SQLite store of Gmail messages keyed by message ID.
+    Delivered messages never change apart from their labels, so a message is
+    downloaded in full once and afterwards served from disk. Each row keeps the
+    zlib-compressed raw API payload and, optionally, the parsed output of
+    EmailProcessor.parse_message. The store is capped in size: least recently
+    used rows are evicted and the freed pages are returned to the filesystem.
+    Access times are only used to pick those rows, so reads record them in memory
+    and they are written in bulk (with the next write, before an eviction or once
+    TOUCH_FLUSH_SIZE messages have been read) instead of committing on every read.
+    """
+    TOUCH_FLUSH_SIZE = 1000 # Unwritten access times that trigger a write
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            thread_id TEXT,
+            internal_date INTEGER,
+            history_id TEXT,
+            label_ids TEXT,
+            raw BLOB,
+            parsed TEXT,
+            parser_version INTEGER,
+            size INTEGER,
+            last_access REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_last_access ON messages(last_access);
+        CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id);
+    """
+
+    def __init__(self, db_path: str = None, max_bytes: int = None):
+        self.db_path = db_path or Settings.MESSAGE_STORE_PATH
+        self.max_bytes = max_bytes or Settings.MESSAGE_STORE_MAX_BYTES
+        self._lock = threading.Lock()
+        if self.db_path != ':memory:':
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        # The store is shared by the event loop and worker threads; access is serialized by _lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL") # Must be set before the first table exists
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+        self._touched = {} # msg_id -> access time not yet written to last_access
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def known_ids(self, message_ids):
+        """Returns the subset of `message_ids` that is present in the store."""
+        known = set()
+        with self._lock:
+            for start in range(0, len(message_ids), 500): # Stay below SQLite's variable limit
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(f"SELECT id FROM messages WHERE id IN ({placeholders})", chunk)
+                known.update(row[0] for row in rows)
+        return known
+
+    def get(self, msg_id):
+        """Returns the stored raw message, or None if it has never been fetched."""
+        return self.get_many([msg_id]).get(msg_id)
+
+    def get_many(self, message_ids):
+        """Returns a dict of msg_id -> raw message for the IDs present in the store."""
+        found = {}
+        if not message_ids:
+            return found
+        with self._lock:
+            for start in range(0, len(message_ids), 500): # Stay below SQLite's variable limit
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, raw, label_ids FROM messages WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                for msg_id, raw, label_ids in rows:
+                    message = json.loads(zlib.decompress(raw))
+                    message['labelIds'] = json.loads(label_ids) # Labels may have been refreshed since
+                    found[msg_id] = message
+            self._touch(list(found))
+        self.stats['hits'] += len(found)
+        self.stats['misses'] += len(message_ids) - len(found)
+        return found
+
+    def put_many(self, messages):
+        """Stores freshly downloaded full or raw messages, replacing older copies."""
+        if not messages:
+            return
+        now = time.time()
+        rows = []
+        for message in messages:
+            raw = zlib.compress(json.dumps(message, separators=(',', ':')).encode('utf-8'))
+            rows.append((
+                message['id'], message.get('threadId'), int(message.get('internalDate', 0)),
+                message.get('historyId'), json.dumps(message.get('labelIds', [])),
+                raw, None, None, len(raw), now
+            ))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._write_touches()
+            self._conn.commit()
+        self.enforce_size_cap()
+
+    def update_labels(self, messages):
+        """
+        Applies label changes from minimal/metadata responses (id, labelIds, historyId)
+        without touching the stored payload.
+        """
+        rows = [(json.dumps(m.get('labelIds', [])), m.get('historyId'), m['id']) for m in messages]
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE messages SET label_ids = ?, history_id = COALESCE(?, history_id) WHERE id = ?", rows
+            )
+            self._conn.commit()
+
+    def get_parsed(self, msg_id, parser_version: int):
+        """Returns the stored parse_message output if it was produced by `parser_version`."""
+        return self.get_parsed_many([msg_id], parser_version).get(msg_id)
+
+    def get_parsed_many(self, message_ids, parser_version: int):
+        """Returns a dict of msg_id -> stored parse_message output for the IDs parsed by `parser_version`."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(message_ids), 500): # Stay below SQLite's variable limit
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, parsed FROM messages WHERE id IN ({placeholders}) AND parser_version = ?",
+                    (*chunk, parser_version)
+                ).fetchall()
+                found.update((msg_id, parsed) for msg_id, parsed in rows if parsed is not None)
+        return {msg_id: json.loads(parsed) for msg_id, parsed in found.items()}
+
+    def put_parsed(self, msg_id, parsed: dict, parser_version: int):
+        """Stores the parse_message output next to the raw payload of an existing row."""
+        self.put_parsed_many([(msg_id, parsed)], parser_version)
+
+    def put_parsed_many(self, items, parser_version: int):
+        """Stores (msg_id, parse_message output) pairs next to the raw payloads in one transaction."""
+        if not items:
+            return
+        rows = []
+        for msg_id, parsed in items:
+            encoded = json.dumps(parsed, separators=(',', ':'))
+            rows.append((encoded, parser_version, len(encoded), msg_id))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE messages SET parsed = ?, parser_version = ?, size = LENGTH(raw) + ? WHERE id = ?", rows
+            )
+            self._write_touches()
+            self._conn.commit()
+
+    def delete(self, message_ids):
+        """Removes messages that were deleted from the mailbox."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(msg_id,) for msg_id in message_ids])
+            self._conn.commit()
+
+    def total_bytes(self):
+        """Approximate payload bytes held by the store."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+
+    def enforce_size_cap(self):
+        """
+        Evicts least recently used messages once the store exceeds max_bytes,
+        down to MESSAGE_STORE_LOW_WATERMARK of the cap, then compacts the file.
+        """
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * Settings.MESSAGE_STORE_LOW_WATERMARK)
+        evicted = 0
+        with self._lock:
+            self._write_touches() # Evict by up-to-date access times
+            rows = self._conn.execute("SELECT id, size FROM messages ORDER BY last_access ASC").fetchall()
+            victims = []
+            for msg_id, size in rows:
+                if total <= target:
+                    break
+                victims.append((msg_id,))
+                total -= size or 0
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", victims)
+            self._conn.commit()
+            evicted = len(victims)
+            self._conn.execute("PRAGMA incremental_vacuum").fetchall()
+        self.stats['evictions'] += evicted
+        logger.info(f"Message store over {self.max_bytes} bytes: evicted {evicted} messages.")
+
+    def compact(self):
+        """Rebuilds the database file to reclaim all free space."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def _touch(self, message_ids):
+        """Marks messages as recently used. Caller must hold the lock."""
+        now = time.time()
+        self._touched.update((msg_id, now) for msg_id in message_ids)
+        if len(self._touched) >= self.TOUCH_FLUSH_SIZE:
+            self._write_touches()
+            self._conn.commit()
+
+    def _write_touches(self):
+        """Writes the pending access times; the caller commits. Caller must hold the lock."""
+        if self._touched:
+            self._conn.executemany("UPDATE messages SET last_access = ? WHERE id = ?",
+                                   [(now, msg_id) for msg_id, now in self._touched.items()])
+            self._touched.clear()
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._conn.commit()
+            self._conn.close()
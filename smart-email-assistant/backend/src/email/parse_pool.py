@@ -0,0 +1,159 @@
+import asyncio
+import os
+import pickle
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+_worker_processor = None # EmailProcessor of a pool worker process
+
+class RemoteTraceback(Exception):
+    """Carries the formatted traceback of an error raised in a parse worker."""
+    def __init__(self, tb: str):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+def _init_worker(log_queue):
+    global _worker_processor
+    logger.forward_to(log_queue) # Only the API process writes the log file
+    from .email_processor import EmailProcessor
+    from .html_text import load_html_engine
+    _worker_processor = EmailProcessor() # Workers never touch the message store
+    load_html_engine()
+
+def _parse_batch(raw_messages):
+    """
+    Runs in a worker process: parses each message and decodes its body, so the
+    CPU-bound work happens here rather than in the API process. Returns one
+    EmailRecord or exception per message, in order.
+    """
+    results = []
+    for raw_message in raw_messages:
+        try:
+            record = _worker_processor.parse_message(raw_message)
+            record.body # Decode now, in the worker
+            results.append(record)
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception: # The error has to travel back to the API process
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            e.remote_traceback = traceback.format_exc()
+            results.append(e)
+    return results
+
+def available_cores() -> int:
+    """CPU cores this process may run on (respects affinity masks and container cpusets)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class ParsePool:
+    """
+    Optional process pool for the CPU-bound part of parsing: base64 and UTF-8
+    decoding and HTML-to-text conversion. Full- and raw-format messages are sent
+    to the workers in batches. Metadata-only messages and messages whose parse is already
+    in the message store stay in-process, because they need no decoding.
+    Enabled by Settings.PARSE_WORKERS.
+    """
+    def __init__(self, workers: int = None, batch_size: int = None, min_messages: int = None):
+        workers = Settings.PARSE_WORKERS if workers is None else workers
+        self.workers = available_cores() if workers < 0 else workers
+        self.batch_size = batch_size or Settings.PARSE_BATCH_SIZE
+        self.min_messages = Settings.PARSE_POOL_MIN_MESSAGES if min_messages is None else min_messages
+        self._executor = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Spawned rather than forked: the API process runs threads (uvicorn, asyncio.to_thread)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                initargs=(logger.worker_queue(),)
+            )
+            logger.info(f"Started parse pool with {self.workers} worker processes.")
+        return self._executor
+
+    async def start(self):
+        """Starts the worker processes ahead of the first request (used by the warm-up)."""
+        if self.enabled:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            await asyncio.gather(*(loop.run_in_executor(executor, _parse_batch, []) for _ in range(self.workers)))
+
+    async def parse_messages(self, raw_messages, email_processor):
+        """
+        Parses `raw_messages` and returns one EmailRecord or exception per message,
+        in input order. The caller decides how to report the exceptions.
+        Small inputs and messages that need no decoding are parsed in-process.
+        Stored parses are looked up, and parses decoded by the workers written back,
+        in one message store transaction each, off the event loop.
+        """
+        if not raw_messages:
+            return []
+        cached = await asyncio.to_thread(email_processor.parse_cached_many, raw_messages)
+        results = [None] * len(raw_messages)
+        pending = []
+        for index, raw_message in enumerate(raw_messages):
+            record = cached.get(raw_message.get('id'))
+            if record is not None:
+                results[index] = record
+            elif self.enabled and self._has_body(email_processor, raw_message):
+                pending.append(index)
+            else:
+                results[index] = self._parse_locally(email_processor, raw_message)
+        if not pending:
+            return results
+        if len(pending) < self.min_messages:
+            for index in pending:
+                results[index] = self._parse_locally(email_processor, raw_messages[index])
+            return results
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        try:
+            batch_results = await asyncio.gather(*(
+                loop.run_in_executor(executor, _parse_batch, [raw_messages[index] for index in batch]) for batch in batches
+            ))
+        except BrokenProcessPool as e: # A worker died; parse in-process and start a new pool next time
+            logger.warning(f"Parse pool failed ({e}); parsing {len(pending)} messages in-process.")
+            self.shutdown()
+            batch_results = [[self._parse_locally(email_processor, raw_messages[index]) for index in batch] for batch in batches]
+        for batch, parsed in zip(batches, batch_results):
+            for index, result in zip(batch, parsed):
+                if isinstance(result, BaseException):
+                    if hasattr(result, 'remote_traceback'):
+                        result.__cause__ = RemoteTraceback(result.remote_traceback)
+                elif result.body_loaded:
+                    email_processor.body_decoded(result)
+                results[index] = result
+        await asyncio.to_thread(email_processor.flush_parsed)
+        return results
+
+    @staticmethod
+    def _has_body(email_processor, raw_message):
+        try:
+            return email_processor.has_body(raw_message)
+        except Exception: # Malformed; parsed in-process so the error is reported for this message
+            return False
+
+    def _parse_locally(self, email_processor, raw_message):
+        try:
+            return email_processor.parse_message(raw_message, use_store=False)
+        except Exception as e:
+            return e
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+import zlib
+from ..config.settings import Settings
+from ..utils.date_utils import message_timestamp_ms
+from ..utils.logger import logger
+
+_np = None # numpy once loaded; False when it is not installed
+_TOKEN = re.compile(r'\w+')
+_MAX_TOKENS = 200 # Words of subject + snippet used per message
+# Feature kinds, hashed into separate namespaces
+_ADDRESS, _DOMAIN, _SUBJECT_WORD, _SNIPPET_WORD, _SNIPPET_PAIR = range(5)
+
+class _HashCache(dict):
+    """Word -> crc32, computed once per distinct word; stable across processes, unlike hash()."""
+    MAX_ENTRIES = 500_000
+
+    def __missing__(self, word):
+        if len(self) >= self.MAX_ENTRIES:
+            self.clear()
+        value = self[word] = zlib.crc32(word.encode())
+        return value
+
+_word_hashes = _HashCache()
+
+def load_numpy():
+    """Imports numpy on first use; returns None when it is not installed (priorities then come from the keyword rules)."""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError: # numpy is optional (pip install smart_email_assistant[ml])
+            _np = False
+    return _np or None
+
+def model_path(account: str) -> str:
+    """Where the model trained on `account`'s mail is saved."""
+    digest = hashlib.sha1((account or '').encode()).hexdigest()[:12]
+    return os.path.join(Settings.PRIORITY_MODEL_DIR, f"priority_model_{digest}.npz")
+
+def featurize(emails, n_features: int):
+    """
+    Hashes a batch of messages into a sparse matrix in coordinate form: (rows, columns,
+    values, scored). The features of a message are its sender address and domain, its
+    subject words and its snippet words and word pairs; each row is binary and
+    L2-normalized. scored[i] is False for messages with no subject or snippet words
+    (those are left to the keyword rules). Only the word lookups run per message in
+    Python; the feature columns are computed for the whole batch with NumPy.
+    """
+    np = load_numpy()
+    hashes, kinds, rows = [], [], []
+    scored = np.zeros(len(emails), dtype=bool)
+    for row, email_data in enumerate(emails):
+        subject = _TOKEN.findall((email_data.get('subject') or '').lower())[:_MAX_TOKENS]
+        words = _TOKEN.findall((email_data.get('snippet') or '').lower())[:_MAX_TOKENS]
+        if not subject and not words:
+            continue
+        scored[row] = True
+        sender = (email_data.get('sender') or '').lower()
+        address = sender[sender.rfind('<') + 1:].rstrip('>').strip()
+        hashes += (_word_hashes[address], _word_hashes[address.rpartition('@')[2]])
+        hashes += map(_word_hashes.__getitem__, subject)
+        hashes += map(_word_hashes.__getitem__, words)
+        kinds += (_ADDRESS, _DOMAIN)
+        kinds += [_SUBJECT_WORD] * len(subject)
+        kinds += [_SNIPPET_WORD] * len(words)
+        rows += [row] * (2 + len(subject) + len(words))
+
+    if not scored.any(): # Nothing to hash; the indexing below needs at least one feature
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32), scored
+    hashes = np.asarray(hashes, dtype=np.int64)
+    kinds = np.asarray(kinds, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    keys = hashes * 8 + kinds
+    # Word pairs: consecutive snippet words of the same message
+    pairs = (kinds[:-1] == _SNIPPET_WORD) & (kinds[1:] == _SNIPPET_WORD) & (rows[:-1] == rows[1:])
+    pair_keys = ((hashes[:-1][pairs] * 1_000_003 + hashes[1:][pairs]) % (1 << 56)) * 8 + _SNIPPET_PAIR
+    cells = np.concatenate((rows, rows[:-1][pairs])) * n_features + np.concatenate((keys, pair_keys)) % n_features
+    cells.sort() # Binary features: duplicates within a message count once
+    cells = cells[np.concatenate(([True], cells[1:] != cells[:-1]))]
+    rows, columns = cells // n_features, cells % n_features
+    counts = np.bincount(rows, minlength=len(emails))
+    values = (1.0 / np.sqrt(np.maximum(counts, 1)))[rows].astype(np.float32)
+    return rows, columns, values, scored
+
+def training_examples(email_threads, user_email_address: str, now_ms: int, min_age_ms: int):
+    """
+    Labels the user's history: each message the user received is positive if the user
+    wrote later in the same thread and negative otherwise. Unanswered messages younger
+    than `min_age_ms` are skipped, since they may still get a reply.
+    Returns (emails, labels).
+    """
+    emails, labels = [], []
+    for thread_emails in email_threads:
+        replied_later = False
+        for email_data in sorted(thread_emails, key=message_timestamp_ms, reverse=True):
+            if user_email_address in (email_data.get('sender') or ''):
+                replied_later = True
+                continue
+            if not replied_later and now_ms - message_timestamp_ms(email_data) < min_age_ms:
+                continue
+            emails.append(email_data)
+            labels.append(replied_later)
+    return emails, labels
+
+class PriorityClassifier:
+    """
+    Local priority model: a logistic regression over hashed word and word-pair features
+    of a message's subject, snippet and sender, trained on the user's own history of
+    replied and unanswered mail. A whole batch of messages is scored with a few
+    vectorized NumPy operations and no network calls; the predicted reply probability
+    is mapped to a tier by Settings.PRIORITY_MODEL_THRESHOLDS.
+    Only the subject and snippet are used, so metadata-only messages can be triaged
+    before their bodies are downloaded.
+    """
+    def __init__(self, weights, bias: float, thresholds: dict = None):
+        self.weights = weights
+        self.bias = float(bias)
+        self.n_features = len(weights)
+        self.thresholds = thresholds or Settings.PRIORITY_MODEL_THRESHOLDS
+
+    @classmethod
+    def train(cls, emails, labels, n_features: int = None, epochs: int = None, learning_rate: float = 0.5, l2: float = 1e-4):
+        """
+        Fits the model with full-batch AdaGrad, weighting both classes equally.
+        Returns (classifier, stats); stats reports the example counts and the
+        training accuracy.
+        """
+        np = load_numpy()
+        n_features = n_features or Settings.PRIORITY_MODEL_FEATURES
+        epochs = epochs or Settings.PRIORITY_MODEL_EPOCHS
+        rows, columns, values, scored = featurize(emails, n_features)
+        targets = np.asarray(labels, dtype=np.float32)
+        positives = float(targets[scored].sum())
+        negatives = float(scored.sum()) - positives
+        # Balanced sample weights: people answer a small fraction of their mail
+        sample_weights = np.where(targets > 0, 0.5 / max(positives, 1.0), 0.5 / max(negatives, 1.0)) * scored
+        weights = np.zeros(n_features, dtype=np.float32)
+        bias = 0.0
+        weight_history = np.full(n_features, 1e-8, dtype=np.float32)
+        bias_history = 1e-8
+        for _ in range(epochs):
+            logits = np.bincount(rows, weights=weights[columns] * values, minlength=len(emails)) + bias
+            errors = (1.0 / (1.0 + np.exp(-logits)) - targets) * sample_weights
+            gradient = np.bincount(columns, weights=errors[rows] * values, minlength=n_features).astype(np.float32) + l2 * weights
+            bias_gradient = float(errors.sum())
+            weight_history += gradient * gradient
+            bias_history += bias_gradient * bias_gradient
+            weights -= learning_rate * gradient / np.sqrt(weight_history)
+            bias -= learning_rate * bias_gradient / bias_history ** 0.5
+        classifier = cls(weights, bias)
+        predicted = classifier._probabilities(rows, columns, values, len(emails)) >= 0.5
+        stats = {
+            'examples': int(scored.sum()),
+            'replied': int(positives),
+            'not_replied': int(negatives),
+            'training_accuracy': round(float((predicted == (targets > 0))[scored].mean()), 3) if scored.any() else None
+        }
+        return classifier, stats
+
+    def _probabilities(self, rows, columns, values, count):
+        np = load_numpy()
+        logits = np.bincount(rows, weights=self.weights[columns] * values, minlength=count) + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def predict_proba(self, emails):
+        """Reply probabilities for a batch of messages, and the mask of messages that could be scored."""
+        rows, columns, values, scored = featurize(emails, self.n_features)
+        return self._probabilities(rows, columns, values, len(emails)), scored
+
+    def predict_tiers(self, emails) -> list:
+        """One priority tier per message, or None for messages the model cannot score."""
+        probabilities, scored = self.predict_proba(emails)
+        tiers = []
+        for probability, ok in zip(probabilities.tolist(), scored.tolist()):
+            tier = None
+            if ok:
+                tier = next((name for name, threshold in self.thresholds.items() if probability >= threshold), "Low")
+            tiers.append(tier)
+        return tiers
+
+    def save(self, path: str):
+        np = load_numpy()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_file, weights=self.weights, bias=np.float32(self.bias))
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a saved model, or returns None if there is none or numpy is not installed."""
+        np = load_numpy()
+        if np is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data['weights'], float(data['bias']))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable priority model %s: %s", path, e)
+            return None
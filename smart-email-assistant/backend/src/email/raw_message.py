@@ -0,0 +1,164 @@
+import base64
+import quopri
+import re
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+
+DECODE_CHUNK_CHARS = 16 * 1024 # base64url characters decoded at a time (a multiple of 4)
+
+# compat32 keeps header values as they appear in the message (as Gmail reports them in
+# format='full' payloads) and is several times faster than the structured default policy.
+_header_parser = BytesParser(policy=policy.compat32)
+_FOLD = re.compile(r'\r?\n(?=[ \t])')
+
+def iter_raw_lines(raw: str):
+    """
+    Yields the lines (with line endings) of a Gmail format='raw' message,
+    decoding the base64url source one chunk at a time. A caller that stops
+    iterating never decodes the rest of the message.
+    """
+    pending = b''
+    for start in range(0, len(raw), DECODE_CHUNK_CHARS):
+        chunk = raw[start:start + DECODE_CHUNK_CHARS]
+        pending += base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(b'\n') else b''
+        yield from lines
+    if pending:
+        yield pending
+
+class _LineReader:
+    """Line iterator that can put back the boundary line that ended a part."""
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._pushed = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pushed is not None:
+            line, self._pushed = self._pushed, None
+            return line
+        return next(self._lines)
+
+    def push_back(self, line):
+        self._pushed = line
+
+def read_headers(lines):
+    """Reads a header block up to the blank line and parses it with the stdlib BytesParser."""
+    block = []
+    for line in lines:
+        if not line.strip():
+            break
+        block.append(line)
+    return _header_parser.parsebytes(b''.join(block), headersonly=True)
+
+def is_attachment(headers) -> bool:
+    """
+    True if a part is an attachment: it has a filename (Gmail reports one in format='full'
+    payloads) or an attachment disposition. EmailProcessor applies the same rule to
+    format='full' parts.
+    """
+    return bool(headers.get_filename()) or headers.get_content_disposition() == 'attachment'
+
+def find_text_part(raw: str):
+    """
+    Parses a Gmail format='raw' message as far as its first inline text/plain or
+    text/html part (the part _find_body_part picks from a format='full' payload).
+    Returns (headers, part), where headers is an email.message.Message holding
+    only the top-level headers and part is (content, is_html, charset,
+    transfer_encoding) or None. Attachments and images before the text part are
+    skipped line by line without being stored or decoded, and nothing after it is
+    decoded at all.
+    Only header blocks go through the stdlib parser. Its FeedParser would build the
+    whole MIME tree, holding every attachment in memory, before the first part could
+    be read, so MIME boundaries are followed here one line at a time instead.
+    """
+    lines = _LineReader(iter_raw_lines(raw))
+    headers = read_headers(lines)
+    return headers, _walk(headers, lines, ())
+
+def _boundary_kind(line, boundaries):
+    """Returns (index, closing) if `line` is a delimiter of one of `boundaries`, else None."""
+    if not line.startswith(b'--'):
+        return None
+    stripped = line.rstrip()
+    for index in range(len(boundaries) - 1, -1, -1):
+        delimiter = b'--' + boundaries[index]
+        if stripped == delimiter:
+            return index, False
+        if stripped == delimiter + b'--':
+            return index, True
+    return None
+
+def _skip_to_boundary(lines, boundaries):
+    """Consumes lines up to the next delimiter, which is put back for the enclosing multipart."""
+    for line in lines:
+        if _boundary_kind(line, boundaries) is not None:
+            lines.push_back(line)
+            return
+
+def _walk(headers, lines, boundaries):
+    if headers.get_content_maintype() == 'multipart':
+        boundary = headers.get_param('boundary')
+        if not boundary:
+            return None
+        boundaries = boundaries + (str(boundary).encode('ascii', 'replace'),)
+        own = len(boundaries) - 1
+        for line in lines:
+            kind = _boundary_kind(line, boundaries)
+            if kind is None:
+                continue # Preamble, epilogue or the tail of a skipped part
+            index, closing = kind
+            if index != own:
+                lines.push_back(line) # An enclosing multipart ended without closing this one
+                return None
+            if closing:
+                return None
+            part_headers = read_headers(lines)
+            found = _walk(part_headers, lines, boundaries)
+            # Like _find_body_part, an empty text part inside a nested multipart does not end the search
+            if found is not None and (found[0] or part_headers.get_content_maintype() != 'multipart'):
+                return found
+        return None
+
+    content_type = headers.get_content_type()
+    if content_type not in ('text/plain', 'text/html') or (boundaries and is_attachment(headers)):
+        _skip_to_boundary(lines, boundaries)
+        return None
+    body = []
+    for line in lines:
+        if boundaries and _boundary_kind(line, boundaries) is not None:
+            lines.push_back(line)
+            break
+        body.append(line)
+    content = b''.join(body)
+    if boundaries:
+        # The line break before a delimiter belongs to the delimiter
+        content = content[:-2] if content.endswith(b'\r\n') else content[:-1] if content.endswith(b'\n') else content
+    encoding = str(headers.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+    return content, content_type == 'text/html', headers.get_content_charset(), encoding
+
+def decode_transfer_encoding(content: bytes, encoding: str) -> bytes:
+    """Undoes a part's Content-Transfer-Encoding (base64, quoted-printable or none)."""
+    if encoding == 'base64':
+        data = b''.join(content.split())
+        return base64.b64decode(data + b'=' * (-len(data) % 4))
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(content)
+    return content
+
+def header_value(headers, name: str, default: str = 'N/A') -> str:
+    """An unfolded header value with RFC 2047 encoded words decoded, as Gmail reports it in format='full' payloads."""
+    value = headers.get(name)
+    if value is None:
+        return default
+    value = _FOLD.sub('', str(value))
+    if '=?' not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception: # Malformed encoded words are left as they are
+        return value
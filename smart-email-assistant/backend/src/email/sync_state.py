@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+class SyncStateStore:
+    """
+    Persists per-account mailbox sync state (last Gmail historyId and the
+    messages already known inside the synced window) in a small JSON file.
+    """
+    def __init__(self, state_file: str = None):
+        self.state_file = state_file or Settings.SYNC_STATE_FILE
+        self._lock = threading.Lock()
+        self._states = self._load()
+
+    def _load(self):
+        """Loads all account states from disk, starting empty if the file is missing or corrupt."""
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync state file {self.state_file}: {e}")
+            return {}
+
+    def get(self, account: str) -> dict:
+        """Returns a copy of the stored state for an account (empty if never synced)."""
+        with self._lock:
+            return dict(self._states.get(account, {}))
+
+    def save(self, account: str, state: dict):
+        """Stores the state for an account and writes the file."""
+        with self._lock:
+            self._states[account] = state
+            self._write()
+
+    def clear(self, account: str):
+        """Forgets an account so its next sync is a full window scan."""
+        with self._lock:
+            if self._states.pop(account, None) is not None:
+                self._write()
+
+    def _write(self):
+        """Writes every account state to disk atomically. Caller must hold the lock."""
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._states, f)
+        os.replace(tmp_file, self.state_file)
@@ -1,21 +1,59 @@
-from datetime import datetime
-import re
+import hashlib
+import json
+from .keyword_matcher import get_keyword_matcher
+from ..config.settings import Settings
+from ..utils.date_utils import message_timestamp_ms
 from ..utils.logger import logger
 
 class ThreadAnalyzer:
     """
     Analyzes email threads to determine reply status and priority.
     """
-    def __init__(self, user_email_address: str):
+    # Gmail category labels given to newsletters, notifications and other bulk mail.
+    BULK_MAIL_LABELS = {'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS'}
+    NO_REPLY_SENDER_MARKERS = ('noreply', 'no-reply', 'donotreply', 'do-not-reply')
+    # Persisted per-thread analysis state (see analyze_thread)
+    STATE_KEYS = ('config', 'message_count', 'last_message_id', 'last_timestamp_ms', 'last_email_from_user',
+                  'replied', 'fingerprint', 'is_bulk', 'priority', 'priority_terms')
+
+    def __init__(self, user_email_address: str, priority_keywords: dict = None, priority_classifier=None):
         self.user_email_address = user_email_address
+        self.priority_classifier = priority_classifier # Optional PriorityClassifier; keyword rules otherwise
+        if priority_keywords is None:
+            priority_keywords = Settings.PRIORITY_KEYWORDS_BY_ACCOUNT.get(user_email_address, Settings.PRIORITY_KEYWORDS)
+        self.priority_matcher = get_keyword_matcher(priority_keywords)
+        self.skip_bulk_replies = Settings.SKIP_BULK_MAIL_REPLIES
+        # States saved under another address, keyword configuration or bulk mail setting are not resumed
+        config = [user_email_address, priority_keywords, self.skip_bulk_replies]
+        self.config_key = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+    def score_threads(self, email_threads: dict) -> dict:
+        """
+        Scores the latest message of every thread with the priority classifier in one
+        batch. Returns {thread_id: tier} for the threads the model could score; the others
+        (all of them without a trained model) are left to the keyword rules.
+        """
+        if self.priority_classifier is None or not email_threads:
+            return {}
+        thread_ids = [thread_id for thread_id, emails in email_threads.items() if emails]
+        latest = [max(email_threads[thread_id], key=message_timestamp_ms) for thread_id in thread_ids]
+        tiers = self.priority_classifier.predict_tiers(latest)
+        return {thread_id: tier for thread_id, tier in zip(thread_ids, tiers) if tier is not None}
 
-    def analyze_thread(self, thread_emails: list):
+    def analyze_thread(self, thread_emails: list, state: dict = None, priority: str = None):
         """
         Analyzes a list of emails within a thread to determine reply status and priority.
         Args:
             thread_emails: A list of parsed email dictionaries belonging to the same thread.
+            state: The analysis['state'] of a previous call for the same thread, if any.
+                When the thread only gained messages since then, only those are scanned
+                and the earlier ones are not sorted again.
+            priority: The tier score_threads gave the thread, if any; the keyword rules
+                are used otherwise.
         Returns:
-            A dictionary containing analysis results for the thread.
+            A dictionary containing analysis results for the thread. analysis['state'] is a
+            JSON-serializable summary to persist and pass back next time, and
+            analysis['changed'] is False when the thread has no new messages since `state`.
         """
         if not thread_emails:
             return {
@@ -23,82 +61,107 @@ class ThreadAnalyzer:
                 "priority": "Low",
                 "draft_reply_needed": False,
                 "last_email_from_user": False,
-                "last_email_id": None
+                "last_email_id": None,
+                "is_bulk": False,
+                "priority_terms": [],
+                "changed": True,
+                "state": None
             }
 
-        # Sort emails by date to process chronologically
-        thread_emails.sort(key=lambda x: self._parse_date(x['date']))
+        previous = state if self._usable_state(state) else None
+        previous_fingerprint = previous['fingerprint'] if previous else None
+        start = self._resume_index(thread_emails, previous)
+        if start:
+            state = {key: previous[key] for key in self.STATE_KEYS}
+        else:
+            # Sort emails by date to process chronologically (internalDate, or the parsed Date header, in epoch ms).
+            # Lists that arrive in another order (newest first in message mode) get the same fingerprint.
+            thread_emails.sort(key=message_timestamp_ms)
+            state = {
+                "config": self.config_key,
+                "message_count": 0,
+                "last_message_id": None,
+                "last_timestamp_ms": 0,
+                "last_email_from_user": False,
+                "replied": False,
+                "fingerprint": ""
+            }
 
-        replied = False
-        last_email_from_user = False
-        last_email_id = None
-        
-        # Determine if the user has replied in the thread
-        for email_data in thread_emails:
-            if self.user_email_address in email_data['sender']:
-                replied = True
-                last_email_from_user = True
-            else:
-                last_email_from_user = False # Last email was not from user
+        # Determine if the user has replied in the thread, looking only at messages not seen before
+        for email_data in thread_emails[start:]:
+            state['last_email_from_user'] = self.user_email_address in email_data['sender']
+            state['replied'] = state['replied'] or state['last_email_from_user']
+            state['last_message_id'] = email_data['id'] # Keep track of the last email ID
+            state['last_timestamp_ms'] = message_timestamp_ms(email_data)
+            state['fingerprint'] = self._fingerprint(state['fingerprint'], email_data)
+        state['message_count'] = len(thread_emails)
+        changed = state['fingerprint'] != previous_fingerprint
 
-            last_email_id = email_data['id'] # Keep track of the last email ID
+        if not changed and not start:
+            # Rescanned in full but the same messages: keep the earlier classification
+            for key in ('is_bulk', 'priority', 'priority_terms'):
+                state[key] = previous[key]
+        elif changed:
+            # Newsletters and notifications need no reply when SKIP_BULK_MAIL_REPLIES is set
+            last_email = thread_emails[-1]
+            state['is_bulk'] = self._is_bulk_mail(last_email)
+            if priority is not None:
+                state['priority'] = priority
+                state['priority_terms'] = []
+            else:
+                # Keyword rules; emails parsed from metadata only have no body, so fall back to the snippet
+                priority_match = self.priority_matcher.match(last_email['subject'], last_email['body'] or last_email.get('snippet', ''))
+                state['priority'] = priority_match.tier
+                state['priority_terms'] = list(priority_match.terms)
 
-        # Determine if a draft reply is needed
         # A draft reply is needed if the user has not replied AND the last email was not from the user
-        draft_reply_needed = not replied and not last_email_from_user
-
-        # Determine priority (simple heuristic for now)
-        priority = self._determine_priority(thread_emails[-1]['subject'], thread_emails[-1]['body'])
-
+        draft_reply_needed = not state['replied'] and not state['last_email_from_user']
+        if self.skip_bulk_replies and state['is_bulk']:
+            draft_reply_needed = False
         return {
-            "replied": replied,
-            "priority": priority,
+            "replied": state['replied'],
+            "priority": state['priority'],
             "draft_reply_needed": draft_reply_needed,
-            "last_email_from_user": last_email_from_user,
-            "last_email_id": last_email_id
+            "last_email_from_user": state['last_email_from_user'],
+            "last_email_id": state['last_message_id'],
+            "is_bulk": state['is_bulk'],
+            "priority_terms": state['priority_terms'],
+            "changed": changed,
+            "state": state
         }
 
-    def _parse_date(self, date_str: str) -> datetime:
-        """Parses various date string formats into a datetime object."""
-        # Example formats: "Fri, 8 Aug 2025 03:58:49 +0530 (IST)", "8 Aug 2025 03:58:49 +0530"
-        try:
-            # Try parsing with timezone info
-            return datetime.strptime(date_str, '%a, %d %b %Y %H:%M:%S %z (%Z)')
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, '%a, %d %b %Y %H:%M:%S %z')
-            except ValueError:
-                try:
-                    # Try parsing without timezone info, assuming local timezone
-                    return datetime.strptime(date_str, '%a, %d %b %Y %H:%M:%S %Z')
-                except ValueError:
-                    try:
-                        return datetime.strptime(date_str, '%d %b %Y %H:%M:%S %z')
-                    except ValueError:
-                        # Fallback for simpler formats or if timezone is missing/malformed
-                        # This might lose timezone accuracy but ensures parsing
-                        date_str_no_tz = re.sub(r'\s+\(.*\)$', '', date_str) # Remove (IST) etc.
-                        date_str_no_tz = re.sub(r'(\s[+-]\d{4})', '', date_str_no_tz) # Remove +0530 etc.
-                        return datetime.strptime(date_str_no_tz, '%a, %d %b %Y %H:%M:%S')
-        except Exception as e:
-            print(f"Could not parse date: {date_str}. Error: {e}")
-            return datetime.min # Return a very old date on failure
-
-    def _determine_priority(self, subject: str, body: str) -> str:
+    def _resume_index(self, thread_emails: list, state: dict) -> int:
         """
-        Determines email priority based on keywords in subject and body.
+        Number of leading messages already covered by `state`, or 0 if the thread has to be
+        analyzed from scratch: no usable state, a message removed or reordered, or new
+        messages that are not newer than the ones already seen.
         """
-        subject_lower = subject.lower()
-        body_lower = body.lower()
+        if not self._usable_state(state):
+            return 0
+        count = state['message_count']
+        if not count or len(thread_emails) < count or thread_emails[count - 1]['id'] != state['last_message_id']:
+            return 0
+        last_timestamp = state['last_timestamp_ms']
+        for email_data in thread_emails[count:]:
+            timestamp = message_timestamp_ms(email_data)
+            if timestamp < last_timestamp:
+                return 0
+            last_timestamp = timestamp
+        return count
 
-        high_priority_keywords = ['urgent', 'action required', 'important', 'deadline', 'asap']
-        medium_priority_keywords = ['follow up', 'request', 'question', 'meeting']
+    def _usable_state(self, state: dict) -> bool:
+        """True for a complete state saved under the current configuration."""
+        return bool(state) and state.get('config') == self.config_key and all(key in state for key in self.STATE_KEYS)
 
-        if any(keyword in subject_lower for keyword in high_priority_keywords) or \
-           any(keyword in body_lower for keyword in high_priority_keywords):
-            return "High"
-        elif any(keyword in subject_lower for keyword in medium_priority_keywords) or \
-             any(keyword in body_lower for keyword in medium_priority_keywords):
-            return "Medium"
-        else:
-            return "Low"
+    @staticmethod
+    def _fingerprint(previous: str, email_data) -> str:
+        """Rolling hash over the thread's message IDs and receive times, extended one message at a time."""
+        digest = hashlib.sha1(f"{previous}:{email_data['id']}:{message_timestamp_ms(email_data)}".encode())
+        return digest.hexdigest()[:16]
+
+    def _is_bulk_mail(self, email_data: dict) -> bool:
+        """Detects newsletters and automated notifications from Gmail category labels and no-reply senders."""
+        if self.BULK_MAIL_LABELS.intersection(email_data.get('labels') or []):
+            return True
+        sender = (email_data.get('sender') or '').lower()
+        return any(marker in sender for marker in self.NO_REPLY_SENDER_MARKERS)
@@ -1,17 +1,31 @@
 import os
 from .config.settings import Settings
 from .auth.gmail_auth import GmailAuth
-from .email.gmail_client import GmailClient
+from .email.gmail_client import GmailClient, build_window_query, start_of_day
+from .email.async_gmail_client import AsyncGmailClient
+from .email.sync_state import SyncStateStore
+from .email.fetch_planner import resume_point
 from .email.email_processor import EmailProcessor
+from .email.email_record import EmailRecord
+from .email.parse_pool import ParsePool
+from .email.html_text import load_html_engine
 from .email.thread_analyzer import ThreadAnalyzer
+from .email.priority_classifier import PriorityClassifier, load_numpy, model_path, training_examples
 from .ai.summarizer import Summarizer
 from .ai.reply_generator import ReplyGenerator
+from .ai.combined_analyzer import CombinedAnalyzer
+from .ai.gemini_client import shutdown_executor
+from .ai.response_cache import ResponseCache
 from .utils.data_processor import DataProcessor
 from .utils.csv_exporter import CSVExporter
 from .utils.rate_limiter import RateLimiter
 from fastapi import HTTPException, status
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import collections
 import json
 import logging
+from datetime import datetime, timedelta
 from .utils.logger import logger as app_logger
 
 # Configure logging for extensive details
@@ -21,6 +35,8 @@ from .utils.logger import logger as app_logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG) # Set level for this specific logger if needed
 
+_PIPELINE_END = object() # Sentinel that closes a pipeline queue
+
 class SmartEmailAssistant:
     """
     Main application class for the Smart Email Assistant.
@@ -28,11 +44,22 @@ class SmartEmailAssistant:
     """
     def __init__(self):
         self.gmail_client = GmailClient()
-        self.email_processor = EmailProcessor()
-        self.summarizer = Summarizer()
-        self.reply_generator = ReplyGenerator()
+        # GmailClient shares one httplib2 connection and its fetch counters between calls, neither
+        # of which is thread-safe, so every blocking Gmail call runs on this single worker thread
+        self.gmail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gmail")
+        self.async_gmail_client = AsyncGmailClient()
+        self.email_processor = EmailProcessor(message_store=self.gmail_client.message_store)
+        self.parse_pool = ParsePool()
+        self.response_cache = ResponseCache() if Settings.ENABLE_RESPONSE_CACHE else None
+        self.summarizer = Summarizer(self.response_cache)
+        self.reply_generator = ReplyGenerator(self.response_cache)
+        self.combined_analyzer = CombinedAnalyzer(self.response_cache)
         self.data_processor = DataProcessor()
         self.csv_exporter = CSVExporter()
+        self.sync_state_store = SyncStateStore()
+        self.thread_state_store = SyncStateStore(Settings.THREAD_STATE_FILE)
+        self.thread_analysis_store = SyncStateStore(Settings.THREAD_ANALYSIS_FILE)
+        self.thread_analyses = {} # threadId -> analysis state and last result for the current account
         
         # Defer authentication and user profile retrieval
         self.user_email_address = None
@@ -40,155 +67,572 @@ class SmartEmailAssistant:
 
         self.rate_limiter = RateLimiter(rate_limit=10, interval=60) # 10 calls per minute example
 
-    async def process_emails(self):
+    async def process_emails(self, budget=None, cursor=None, message_format=None, bypass_cache=False):
         """
         Fetches, processes, summarizes, and generates replies for emails.
         """
         app_logger.debug("Starting email processing.")
-        # Ensure user_email_address and thread_analyzer are initialized
-        if not self.user_email_address or not self.thread_analyzer:
-            app_logger.info("User email address or thread analyzer not initialized. Attempting deferred initialization.")
-            try:
-                user_profile = self.gmail_client.get_user_profile()
-                self.user_email_address = user_profile['emailAddress'] if user_profile else None
-                if not self.user_email_address:
-                    app_logger.error("Could not retrieve user email address. Authentication required.")
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Authentication required: Could not retrieve user email address. Please ensure you have authenticated with Google."
-                    )
-                self.thread_analyzer = ThreadAnalyzer(self.user_email_address)
-                app_logger.info(f"SmartEmailAssistant initialized for user: {self.user_email_address}")
-            except HTTPException as e:
-                app_logger.error(f"HTTPException during deferred SmartEmailAssistant initialization: {e.detail}", exc_info=True)
-                raise e # Re-raise the HTTPException
-            except Exception as e:
-                app_logger.error(f"Unexpected error during deferred SmartEmailAssistant initialization: {e}", exc_info=True)
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Backend initialization failed during email processing: {e}. Please check your Google API credentials and authentication."
-                )
-
         app_logger.info(f"Fetching emails from the last {Settings.DAYS_TO_PROCESS} days...")
-        raw_emails = self.gmail_client.get_messages_from_last_n_days(Settings.DAYS_TO_PROCESS)
-        app_logger.info(f"Found {len(raw_emails)} raw emails.")
-        app_logger.debug(f"Raw emails fetched: {[e.get('id') for e in raw_emails]}")
+        after = start_of_day(datetime.now() - timedelta(days=Settings.DAYS_TO_PROCESS))
+        return [result async for result in self.stream_emails(after, budget=budget, cursor=cursor, message_format=message_format, bypass_cache=bypass_cache)]
 
-        processed_emails = []
-        email_threads = {} # Group emails by threadId
-
-    async def process_emails_for_today(self):
+    async def process_emails_for_today(self, budget=None, cursor=None, message_format=None, bypass_cache=False):
         """
         Fetches, processes, summarizes, and generates replies for emails received on the current date.
         """
         app_logger.debug("Starting email processing for today.")
-        # Ensure user_email_address and thread_analyzer are initialized
-        if not self.user_email_address or not self.thread_analyzer:
-            app_logger.info("User email address or thread analyzer not initialized. Attempting deferred initialization.")
-            try:
-                user_profile = self.gmail_client.get_user_profile()
-                self.user_email_address = user_profile['emailAddress'] if user_profile else None
-                if not self.user_email_address:
-                    app_logger.error("Could not retrieve user email address. Authentication required.")
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Authentication required: Could not retrieve user email address. Please ensure you have authenticated with Google."
-                    )
-                self.thread_analyzer = ThreadAnalyzer(self.user_email_address)
-                app_logger.info(f"SmartEmailAssistant initialized for user: {self.user_email_address}")
-            except HTTPException as e:
-                app_logger.error(f"HTTPException during deferred SmartEmailAssistant initialization: {e.detail}", exc_info=True)
-                raise e # Re-raise the HTTPException
-            except Exception as e:
-                app_logger.error(f"Unexpected error during deferred SmartEmailAssistant initialization: {e}", exc_info=True)
+        app_logger.info("Fetching emails for today...")
+        today = start_of_day(datetime.now())
+        return [result async for result in self.stream_emails(today, today + timedelta(days=1), budget, cursor, message_format, bypass_cache)]
+
+    async def stream_emails(self, after, before=None, budget=None, cursor=None, message_format=None, bypass_cache=False):
+        """
+        Async iterator over the processed results for the conversations active in
+        [after, before), yielded as soon as each thread is done.
+        In thread fetch mode, listing/fetching, parsing and analysis run as concurrent
+        stages connected by bounded queues: work on the first page starts before the
+        rest of the window has been listed, and peak memory depends on the queue sizes
+        rather than on the size of the window.
+        With a FetchBudget, fetching stops once the budget is spent and
+        `budget.truncated` / `budget.cursor` tell the caller how to fetch the rest;
+        `cursor` resumes a previous, truncated request for the same window.
+        `message_format` ('full' or 'raw', default Settings.MESSAGE_FORMAT) picks how
+        message bodies are downloaded and parsed. With `bypass_cache`, summaries and
+        replies are generated again instead of coming from the response cache or the
+        stored results of unchanged threads.
+        """
+        message_format = message_format or Settings.MESSAGE_FORMAT
+        if message_format not in ('full', 'raw'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported message format '{message_format}'; use 'full' or 'raw'."
+            )
+        query = build_window_query(after, before)
+        page_token, offset = resume_point(cursor, query)
+        await self._ensure_initialized()
+        if Settings.FETCH_MODE != "threads":
+            # Regrouping messages by threadId needs the whole window before any thread is complete
+            email_threads = await self._fetch_email_threads(after, before, budget, page_token, offset, message_format)
+            priorities = self.thread_analyzer.score_threads(email_threads)
+            threads = ((thread_id, emails_in_thread, priorities.get(thread_id)) for thread_id, emails_in_thread in email_threads.items())
+            async for result in self._process_threads(threads, bypass_cache):
+                yield result
+            await self._save_thread_analyses()
+            app_logger.info("Email processing complete.")
+            return
+
+        thread_state = self.thread_state_store.get(self.user_email_address).get('threads', {})
+        page_queue = asyncio.Queue(maxsize=Settings.PIPELINE_PAGE_QUEUE_SIZE)
+        thread_queue = asyncio.Queue(maxsize=Settings.PIPELINE_THREAD_QUEUE_SIZE)
+        stages = [
+            asyncio.create_task(self._fetch_stage(query, thread_state, page_queue, budget, page_token, offset, message_format)),
+            asyncio.create_task(self._parse_stage(page_queue, thread_queue, message_format, bypass_cache))
+        ]
+        try:
+            async for result in self._process_threads(self._drain(thread_queue), bypass_cache):
+                yield result
+        finally:
+            for stage in stages:
+                stage.cancel()
+
+        # Only a complete run may advance the per-thread history state
+        await asyncio.to_thread(self.thread_state_store.save, self.user_email_address, {'threads': thread_state})
+        await self._save_thread_analyses()
+        app_logger.info(f"Email processing complete. Fetch stats: {self.gmail_client.last_fetch_stats}")
+        if budget is not None:
+            app_logger.info(f"Fetch budget: {budget.summary()}")
+
+    async def _gmail_call(self, func, *args):
+        """
+        Runs a blocking GmailClient call on the Gmail worker thread. The fetch and parse
+        stages still overlap with parsing and analysis, but never use the client at once.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.gmail_executor, func, *args)
+
+    async def _drain(self, queue):
+        """Yields the items of a pipeline queue until its end marker, raising the error a stage put on it."""
+        while True:
+            item = await queue.get()
+            if item is _PIPELINE_END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    async def _process_threads(self, threads, bypass_cache=False):
+        """
+        Processing stage: runs _process_thread for up to Settings.THREAD_CONCURRENCY
+        threads at a time, so their Gemini calls overlap instead of adding up (the
+        clients' rate limiters still pace them). `threads` is an iterable or async
+        iterable of (thread_id, emails, priority); results are yielded in the same
+        order, and a thread that fails yields an error row without stopping the others.
+        """
+        if not hasattr(threads, '__aiter__'):
+            threads = self._aiter(threads)
+        pending = collections.deque()
+        try:
+            async for item in threads:
+                if len(pending) >= max(1, Settings.THREAD_CONCURRENCY):
+                    yield await pending.popleft()
+                    await self._flush_parsed()
+                pending.append(asyncio.create_task(self._process_thread_isolated(*item, bypass_cache=bypass_cache)))
+            while pending:
+                yield await pending.popleft()
+            await self._flush_parsed(force=True)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _flush_parsed(self, force=False):
+        """
+        Writes the parses of bodies decoded while threads were analyzed to the message
+        store in a worker thread, once Settings.MESSAGE_STORE_WRITE_BATCH have queued up.
+        """
+        queued = self.email_processor.pending_parses
+        if queued and (force or queued >= Settings.MESSAGE_STORE_WRITE_BATCH):
+            await asyncio.to_thread(self.email_processor.flush_parsed)
+
+    @staticmethod
+    async def _aiter(items):
+        for item in items:
+            yield item
+
+    async def _process_thread_isolated(self, thread_id, emails_in_thread, priority=None, bypass_cache=False):
+        """_process_thread, turning an unexpected error into an error row for that thread."""
+        try:
+            return await self._process_thread(thread_id, emails_in_thread, priority, bypass_cache)
+        except Exception as e:
+            app_logger.error("Error processing thread %s: %s", thread_id, e, exc_info=True)
+            last_email_in_thread = emails_in_thread[-1] if emails_in_thread else {}
+            return {
+                "id": last_email_in_thread.get('id', 'N/A'),
+                "sender": last_email_in_thread.get('sender', 'N/A'),
+                "subject": last_email_in_thread.get('subject', 'N/A'),
+                "date": last_email_in_thread.get('date', 'N/A'),
+                "summary": "Error processing thread.",
+                "replied": False,
+                "draftReply": "N/A",
+                "priority": priority or "Low",
+                "threadId": thread_id
+            }
+
+    async def _fetch_stage(self, query, thread_state, page_queue, budget=None, page_token=None, offset=0, message_format='full'):
+        """
+        Pipeline stage: lists the window one page at a time and fetches each page's
+        threads (metadata only when TWO_PHASE_FETCH is enabled or bodies are fetched
+        in raw format), stopping once the fetch budget is spent.
+        """
+        thread_format = 'metadata' if Settings.TWO_PHASE_FETCH or message_format == 'raw' else 'full'
+        try:
+            self.gmail_client.reset_fetch_stats('threads')
+            pages = self.gmail_client.iter_window_threads(query, thread_state, thread_format, budget, page_token, offset)
+            while True:
+                raw_threads = await self._gmail_call(next, pages, None)
+                if raw_threads is None:
+                    break
+                app_logger.debug("Fetched a page of %d threads.", len(raw_threads))
+                await page_queue.put(raw_threads)
+            await page_queue.put(_PIPELINE_END)
+        except Exception as e:
+            await page_queue.put(e)
+
+    async def _parse_stage(self, page_queue, thread_queue, message_format='full', bypass_cache=False):
+        """
+        Pipeline stage: parses each fetched page, downloads full bodies where the
+        two-phase triage asks for them, and hands the threads on one at a time.
+        """
+        try:
+            while True:
+                raw_threads = await page_queue.get()
+                if raw_threads is _PIPELINE_END or isinstance(raw_threads, BaseException):
+                    await thread_queue.put(raw_threads)
+                    return
+                email_threads = await self._parse_threads(raw_threads)
+                # The model only reads subjects and snippets, so metadata-only threads can be scored
+                priorities = self.thread_analyzer.score_threads(email_threads)
+                if Settings.TWO_PHASE_FETCH or message_format == 'raw':
+                    email_threads = await self._hydrate_threads(email_threads, message_format, priorities, bypass_cache)
+                for thread_id, emails_in_thread in email_threads.items():
+                    await thread_queue.put((thread_id, emails_in_thread, priorities.get(thread_id)))
+        except Exception as e:
+            await thread_queue.put(e)
+
+    async def _fetch_email_threads(self, after, before=None, budget=None, page_token=None, offset=0, message_format='full'):
+        """
+        Fetches the messages received in [after, before) and returns them parsed and
+        grouped by threadId (message fetch mode).
+        """
+        if Settings.ENABLE_INCREMENTAL_SYNC:
+            raw_emails = await self._gmail_call(self._sync_raw_emails, after, before, budget, offset, message_format)
+        elif Settings.USE_ASYNC_GMAIL_CLIENT:
+            raw_emails = await self.async_gmail_client.get_messages_in_window(after, before, budget, page_token, offset, message_format)
+        else:
+            # The blocking client runs in a worker thread so the event loop keeps serving requests
+            raw_emails = await self._gmail_call(self.gmail_client.get_messages_in_window, after, before, budget, page_token, offset, message_format)
+            app_logger.info(f"Fetch stats: {self.gmail_client.last_fetch_stats}")
+        app_logger.info(f"Found {len(raw_emails)} raw emails.")
+        if app_logger.debug_enabled:
+            app_logger.debug("Raw emails fetched: %s", [e.get('id') for e in raw_emails])
+        return self._group_raw_emails(raw_emails, await self.parse_pool.parse_messages(raw_emails, self.email_processor))
+
+    def _sync_raw_emails(self, after, before=None, budget=None, offset=0, message_format='full'):
+        """
+        Incrementally syncs the [after, before) window for the current account and
+        persists the new historyId. Blocking; run it in a worker thread.
+        """
+        sync_state = self.sync_state_store.get(self.user_email_address)
+        raw_emails, new_state = self.gmail_client.sync_messages(after, before, sync_state, budget, offset, message_format)
+        self.sync_state_store.save(self.user_email_address, new_state)
+        app_logger.info(f"Fetch stats: {self.gmail_client.last_fetch_stats}")
+        return raw_emails
+
+    async def _ensure_initialized(self):
+        """
+        Resolves the authenticated user's address and builds the ThreadAnalyzer on first use.
+        """
+        if self.user_email_address and self.thread_analyzer:
+            return
+        app_logger.info("User email address or thread analyzer not initialized. Attempting deferred initialization.")
+        try:
+            if Settings.USE_ASYNC_GMAIL_CLIENT:
+                user_profile = await self.async_gmail_client.get_user_profile()
+            else:
+                user_profile = await self._gmail_call(self.gmail_client.get_user_profile)
+            self.user_email_address = user_profile['emailAddress'] if user_profile else None
+            if not self.user_email_address:
+                app_logger.error("Could not retrieve user email address. Authentication required.")
                 raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Backend initialization failed during email processing: {e}. Please check your Google API credentials and authentication."
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Authentication required: Could not retrieve user email address. Please ensure you have authenticated with Google."
                 )
+            priority_classifier = None
+            if Settings.PRIORITY_MODEL_ENABLED:
+                priority_classifier = await asyncio.to_thread(PriorityClassifier.load, model_path(self.user_email_address))
+            self.thread_analyzer = ThreadAnalyzer(self.user_email_address, priority_classifier=priority_classifier)
+            if Settings.ENABLE_INCREMENTAL_ANALYSIS:
+                self.thread_analyses = self.thread_analysis_store.get(self.user_email_address).get('threads', {})
+            app_logger.info(f"SmartEmailAssistant initialized for user: {self.user_email_address}")
+        except HTTPException as e:
+            app_logger.error(f"HTTPException during deferred SmartEmailAssistant initialization: {e.detail}", exc_info=True)
+            raise e # Re-raise the HTTPException
+        except Exception as e:
+            app_logger.error(f"Unexpected error during deferred SmartEmailAssistant initialization: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Backend initialization failed during email processing: {e}. Please check your Google API credentials and authentication."
+            )
 
-        app_logger.info("Fetching emails for today...")
-        raw_emails = self.gmail_client.get_messages_for_today()
-        app_logger.info(f"Found {len(raw_emails)} raw emails for today.")
-        app_logger.debug(f"Raw emails fetched for today: {[e.get('id') for e in raw_emails]}")
+    async def warm_up(self):
+        """
+        Pays the one-off costs of the first request at startup (Settings.WARMUP_ON_STARTUP):
+        loads and validates the OAuth token, builds the Gmail service, resolves the
+        user's address, imports the HTML parser and the Gemini SDK and starts the
+        parse pool. Problems are logged rather than raised, so the API still starts
+        before the user has authenticated.
+        """
+        try:
+            await self._ensure_initialized()
+            await self._gmail_call(self.gmail_client._get_service) # Thread fetches always use the blocking client
+        except HTTPException as e:
+            app_logger.warning(f"Warm-up could not initialize Gmail access: {e.detail}")
+        try:
+            await asyncio.to_thread(load_html_engine)
+            await asyncio.to_thread(self.summarizer.gemini_client.get_model)
+            await asyncio.to_thread(self.reply_generator.gemini_client.get_model)
+            await self.parse_pool.start()
+        except Exception as e:
+            app_logger.warning(f"Warm-up could not load the parsing and Gemini modules: {e}")
+        app_logger.info("Warm-up complete.")
+
+    async def _parse_threads(self, raw_threads):
+        """
+        Parses the messages of whole Gmail threads, keeping Gmail's chronological order.
+        Bodies are decoded in the parse pool when Settings.PARSE_WORKERS enables it.
+        """
+        raw_threads = list(raw_threads)
+        raw_emails = [raw_email for raw_thread in raw_threads for raw_email in raw_thread.get('messages', [])]
+        results = iter(await self.parse_pool.parse_messages(raw_emails, self.email_processor))
+        email_threads = {}
+        for raw_thread in raw_threads:
+            parsed = []
+            for raw_email in raw_thread.get('messages', []):
+                try:
+                    parsed.append(self._parse_result(next(results)))
+                except Exception as e:
+                    app_logger.error("Error processing email %s: %s", raw_email.get('id', 'N/A'), e, exc_info=True)
+            if parsed:
+                email_threads[raw_thread['id']] = parsed
+        app_logger.info(f"Parsed {sum(len(emails) for emails in email_threads.values())} emails in {len(email_threads)} threads.")
+        return email_threads
+
+    async def _hydrate_threads(self, email_threads, message_format='full', priorities=None, bypass_cache=False):
+        """
+        Second phase of the metadata-first fetch: triages threads parsed from metadata
+        and downloads full bodies only for the ones that will be summarized or replied to
+        (all of them when TWO_PHASE_FETCH is off and bodies are fetched in raw format).
+        Unchanged threads whose previous result is reused need no bodies. `priorities`
+        holds the model's tiers from ThreadAnalyzer.score_threads.
+        """
+        needed = {}
+        priorities = priorities or {}
+        for thread_id, emails_in_thread in email_threads.items():
+            previous = self._previous_analysis(thread_id, bypass_cache)
+            thread_analysis = self.thread_analyzer.analyze_thread(emails_in_thread, previous, priorities.get(thread_id))
+            if self._reusable_result(thread_analysis, previous) is not None:
+                continue
+            if not Settings.TWO_PHASE_FETCH or self._needs_full_body(thread_analysis):
+                needed[thread_id] = [email_data['id'] for email_data in emails_in_thread]
+        app_logger.info(f"Triage: {len(needed)} of {len(email_threads)} threads need full bodies.")
+        full_threads = await self._gmail_call(self.gmail_client.hydrate_threads, needed, message_format)
+        for thread_id, emails in (await self._parse_threads(full_threads.values())).items():
+            email_threads[thread_id] = emails
+        return email_threads
+
+    def _needs_full_body(self, thread_analysis):
+        """
+        True if a thread will be summarized or replied to. Used to skip body downloads
+        and Gemini calls for low-priority bulk mail when TWO_PHASE_FETCH is enabled.
+        """
+        if thread_analysis['priority'] in Settings.SUMMARIZE_PRIORITIES:
+            return True
+        return Settings.ENABLE_REPLY_GENERATION and thread_analysis['draft_reply_needed']
 
+    def _group_raw_emails(self, raw_emails, results):
+        """
+        Groups parsed Gmail messages into threads by threadId. `results` holds the
+        ParsePool.parse_messages output for `raw_emails`, in the same order.
+        """
         processed_emails = []
         email_threads = {} # Group emails by threadId
 
-        for raw_email in raw_emails:
+        for raw_email, result in zip(raw_emails, results):
             email_id = raw_email.get('id', 'N/A')
-            app_logger.debug(f"Processing raw email ID: {email_id}")
+            app_logger.debug("Processing raw email ID: %s", email_id)
             try:
-                processed_email = self.email_processor.parse_message(raw_email)
+                processed_email = self._parse_result(result)
                 processed_emails.append(processed_email)
                 thread_id = processed_email['threadId']
                 if thread_id not in email_threads:
                     email_threads[thread_id] = []
-                    app_logger.debug(f"Created new thread: {thread_id}")
+                    app_logger.debug("Created new thread: %s", thread_id)
                 email_threads[thread_id].append(processed_email)
-                app_logger.debug(f"Email {email_id} added to thread {thread_id}.")
+                app_logger.debug("Email %s added to thread %s.", email_id, thread_id)
             except Exception as e:
-                app_logger.error(f"Error processing email {email_id}: {e}", exc_info=True)
+                app_logger.error("Error processing email %s: %s", email_id, e, exc_info=True)
                 continue
         
         app_logger.info(f"Processed {len(processed_emails)} emails. Grouped into {len(email_threads)} threads.")
-        
-        final_results = []
-        for thread_id, emails_in_thread in email_threads.items():
-            app_logger.info(f"Analyzing thread {thread_id} with {len(emails_in_thread)} emails.")
-            thread_analysis = self.thread_analyzer.analyze_thread(emails_in_thread)
-            app_logger.debug(f"Thread {thread_id} analysis results: Replied={thread_analysis['replied']}, Priority={thread_analysis['priority']}, DraftNeeded={thread_analysis['draft_reply_needed']}")
-            
-            # Get the last email in the thread for summarization and reply generation
-            last_email_in_thread = emails_in_thread[-1] 
-            app_logger.debug(f"Last email in thread {thread_id} for summarization/reply: {last_email_in_thread.get('id')}")
-
-            # Summarize the entire email thread
-            app_logger.info(f"Summarizing thread {thread_id}...")
+        return email_threads
+
+    def _parse_result(self, result):
+        """Unwraps one ParsePool result, raising the parse error it holds."""
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def _process_thread(self, thread_id, emails_in_thread, priority=None, bypass_cache=False):
+        """
+        Analyzes, summarizes and drafts a reply for one thread of parsed emails and
+        returns its result row. `priority` is the model's tier for the thread, if it
+        scored it; `bypass_cache` regenerates the summary and reply.
+        """
+        app_logger.info("Analyzing thread %s with %d emails.", thread_id, len(emails_in_thread))
+        previous = self._previous_analysis(thread_id, bypass_cache)
+        thread_analysis = self.thread_analyzer.analyze_thread(emails_in_thread, previous, priority)
+        result = self._reusable_result(thread_analysis, previous)
+        if result is not None:
+            app_logger.info("Thread %s is unchanged since the last run; reusing its summary and reply.", thread_id)
+            self._release_bodies(emails_in_thread)
+            return result
+        app_logger.debug("Thread %s analysis results: Replied=%s, Priority=%s, DraftNeeded=%s", thread_id,
+                         thread_analysis['replied'], thread_analysis['priority'], thread_analysis['draft_reply_needed'])
+
+        # Get the last email in the thread for summarization and reply generation
+        last_email_in_thread = emails_in_thread[-1] 
+        app_logger.debug("Last email in thread %s for summarization/reply: %s", thread_id, last_email_in_thread.get('id'))
+
+        failed = False # Results with errors are not reused on the next run
+        # What the previous summary covers; the summary of a grown thread is updated from its new messages
+        summary_state = previous.get('summary_state') if previous else None
+        combined = None
+        if Settings.ENABLE_COMBINED_ANALYSIS and Settings.ENABLE_REPLY_GENERATION and thread_analysis['draft_reply_needed']:
+            # Summary, priority and reply from one prompt; the separate prompts below are the fallback
+            app_logger.info("Summarizing and generating reply for thread %s in one call...", thread_id)
             try:
-                summary = await self.summarizer.summarize_email(emails_in_thread)
+                combined = await self.combined_analyzer.analyze(emails_in_thread, recipient=last_email_in_thread.get('sender', 'N/A'),
+                                                               use_cache=not bypass_cache)
+            except Exception as e:
+                app_logger.error("Error in combined analysis of thread %s: %s", thread_id, e, exc_info=True)
+            if combined is None:
+                app_logger.info("Falling back to separate summary and reply prompts for thread %s.", thread_id)
+            else:
+                summary_state = self.summarizer.summary_state(emails_in_thread, combined['summary'])
+                app_logger.debug("Suggested priority for thread %s: %s", thread_id, combined['priority'])
+                if Settings.USE_SUGGESTED_PRIORITY and combined['priority']:
+                    thread_analysis['priority'] = combined['priority']
+
+        # Summarize the entire email thread
+        if combined is not None:
+            last_email_in_thread['summary'] = combined['summary']
+        elif Settings.FETCH_MODE == "threads" and Settings.TWO_PHASE_FETCH and not self._needs_full_body(thread_analysis):
+            app_logger.info("Summary skipped for low-priority thread %s; using the snippet.", thread_id)
+            last_email_in_thread['summary'] = last_email_in_thread.get('snippet') or "No summary (low priority)."
+        else:
+            app_logger.info("Summarizing thread %s...", thread_id)
+            try:
+                summary, summary_state = await self.summarizer.summarize_thread(emails_in_thread, summary_state, use_cache=not bypass_cache)
                 last_email_in_thread['summary'] = summary
-                app_logger.debug(f"Summary for thread {thread_id}: {summary[:100]}...") # Log first 100 chars of summary
+                failed = failed or summary_state is None # Gemini timed out or gave up without raising
+                app_logger.debug("Summary for thread %s: %.100s...", thread_id, summary) # Log first 100 chars of summary
             except Exception as e:
-                app_logger.error(f"Error summarizing email thread {thread_id}: {e}", exc_info=True)
+                app_logger.error("Error summarizing email thread %s: %s", thread_id, e, exc_info=True)
                 last_email_in_thread['summary'] = "Error generating summary."
-            
-            draft_reply = "N/A"
-            if Settings.ENABLE_REPLY_GENERATION and thread_analysis['draft_reply_needed']:
-                app_logger.info(f"Generating reply for thread {thread_id}...")
-                try:
-                    # The recipient of the reply should be the sender of the last email in the thread
-                    recipient_email = last_email_in_thread.get('sender', 'N/A')
-                    draft_reply = await self.reply_generator.generate_reply(emails_in_thread, recipient=recipient_email)
-                    app_logger.debug(f"Draft reply for thread {thread_id}: {draft_reply[:100]}...") # Log first 100 chars of reply
-                except Exception as e:
-                    app_logger.error(f"Error generating reply for email thread {thread_id}: {e}", exc_info=True)
-                    draft_reply = "Error generating reply draft."
-            else:
-                app_logger.info(f"Reply generation skipped for thread {thread_id}. Enable_reply_generation: {Settings.ENABLE_REPLY_GENERATION}, Draft_reply_needed: {thread_analysis['draft_reply_needed']}")
-            last_email_in_thread['draftReply'] = draft_reply # Changed to draftReply
-            
-            # Update the last email in thread with analysis results
-            last_email_in_thread['replied'] = thread_analysis['replied']
-            last_email_in_thread['priority'] = thread_analysis['priority']
-            last_email_in_thread['threadId'] = thread_id # Ensure threadId is present
-
-            # Format for export (now directly matches Pydantic model)
-            # No need for data_processor.format_email_for_export if keys already match Pydantic model
-            final_results.append({
-                "id": last_email_in_thread.get('id', 'N/A'), # Add id field
-                "sender": last_email_in_thread.get('sender', 'N/A'),
-                "subject": last_email_in_thread.get('subject', 'N/A'),
-                "date": last_email_in_thread.get('date', 'N/A'),
-                "summary": last_email_in_thread.get('summary', 'N/A'),
-                "replied": last_email_in_thread.get('replied', False),
-                "draftReply": last_email_in_thread.get('draftReply', 'N/A'),
-                "priority": last_email_in_thread.get('priority', 'Low'),
-                "threadId": last_email_in_thread.get('threadId', 'N/A')
-            })
-            app_logger.debug(f"Formatted email {last_email_in_thread.get('id')} for final results. Current results count: {len(final_results)}")
-
-        app_logger.info("Email processing complete. Returning final results.")
-        return final_results
+                summary_state = None
+                failed = True
+
+        draft_reply = "N/A"
+        if combined is not None:
+            draft_reply = combined['reply']
+        elif Settings.ENABLE_REPLY_GENERATION and thread_analysis['draft_reply_needed']:
+            app_logger.info("Generating reply for thread %s...", thread_id)
+            try:
+                # The recipient of the reply should be the sender of the last email in the thread
+                recipient_email = last_email_in_thread.get('sender', 'N/A')
+                draft_reply = await self.reply_generator.generate_reply(emails_in_thread, recipient=recipient_email, use_cache=not bypass_cache)
+                failed = failed or draft_reply == self.reply_generator.FAILURE_MESSAGE
+                app_logger.debug("Draft reply for thread %s: %.100s...", thread_id, draft_reply) # Log first 100 chars of reply
+            except Exception as e:
+                app_logger.error("Error generating reply for email thread %s: %s", thread_id, e, exc_info=True)
+                draft_reply = "Error generating reply draft."
+                failed = True
+        else:
+            app_logger.info("Reply generation skipped for thread %s. Enable_reply_generation: %s, Draft_reply_needed: %s",
+                            thread_id, Settings.ENABLE_REPLY_GENERATION, thread_analysis['draft_reply_needed'])
+        last_email_in_thread['draftReply'] = draft_reply # Changed to draftReply
+
+        # Update the last email in thread with analysis results
+        last_email_in_thread['replied'] = thread_analysis['replied']
+        last_email_in_thread['priority'] = thread_analysis['priority']
+        last_email_in_thread['threadId'] = thread_id # Ensure threadId is present
+
+        # Format for export (now directly matches Pydantic model)
+        # No need for data_processor.format_email_for_export if keys already match Pydantic model
+        result = {
+            "id": last_email_in_thread.get('id', 'N/A'), # Add id field
+            "sender": last_email_in_thread.get('sender', 'N/A'),
+            "subject": last_email_in_thread.get('subject', 'N/A'),
+            "date": last_email_in_thread.get('date', 'N/A'),
+            "summary": last_email_in_thread.get('summary', 'N/A'),
+            "replied": last_email_in_thread.get('replied', False),
+            "draftReply": last_email_in_thread.get('draftReply', 'N/A'),
+            "priority": last_email_in_thread.get('priority', 'Low'),
+            "threadId": last_email_in_thread.get('threadId', 'N/A')
+        }
+        self._remember_analysis(thread_id, thread_analysis['state'], None if failed else result, summary_state)
+        self._release_bodies(emails_in_thread)
+        return result
+
+    @staticmethod
+    def _release_bodies(emails_in_thread):
+        """
+        Frees the bodies of a processed thread. In message fetch mode every thread of the
+        window is held until the run ends, and its result row only needs the headers.
+        """
+        for email_data in emails_in_thread:
+            if isinstance(email_data, EmailRecord):
+                email_data.release_body()
+
+    def _previous_analysis(self, thread_id, bypass_cache=False):
+        """
+        The analysis state kept for a thread by an earlier run, if incremental analysis is
+        enabled. None when the request bypasses cached results, so that the thread's result
+        and summary are not reused.
+        """
+        if not Settings.ENABLE_INCREMENTAL_ANALYSIS or bypass_cache:
+            return None
+        return self.thread_analyses.get(thread_id)
+
+    def _reusable_result(self, thread_analysis, previous):
+        """
+        The stored result of a thread that gained no messages since it was last processed
+        with the same reply setting, or None if the thread has to be processed again.
+        """
+        if not Settings.ENABLE_INCREMENTAL_ANALYSIS or not previous or thread_analysis['changed']:
+            return None
+        if previous.get('reply_generation') != Settings.ENABLE_REPLY_GENERATION:
+            return None
+        result = previous.get('result')
+        return dict(result) if result is not None else None
+
+    def _remember_analysis(self, thread_id, state, result, summary_state=None):
+        """
+        Keeps a thread's analysis state, result and summary state (see
+        Summarizer.summarize_thread) for the next run, dropping the least recently seen threads.
+        """
+        if not Settings.ENABLE_INCREMENTAL_ANALYSIS or state is None:
+            return
+        entry = dict(state)
+        if result is not None:
+            entry['result'] = result
+            entry['reply_generation'] = Settings.ENABLE_REPLY_GENERATION
+        if summary_state is not None:
+            entry['summary_state'] = summary_state
+        self.thread_analyses.pop(thread_id, None) # Re-insert so recently seen threads are trimmed last
+        self.thread_analyses[thread_id] = entry
+        while len(self.thread_analyses) > Settings.THREAD_STATE_MAX_ENTRIES:
+            self.thread_analyses.pop(next(iter(self.thread_analyses)))
+
+    async def _save_thread_analyses(self):
+        """Persists the per-thread analysis state of the current account."""
+        if Settings.ENABLE_INCREMENTAL_ANALYSIS:
+            # A copy: other requests may update the states while the file is written
+            await asyncio.to_thread(self.thread_analysis_store.save, self.user_email_address, {'threads': dict(self.thread_analyses)})
+
+    async def train_priority_model(self, days: int = None):
+        """
+        Trains the local priority model on the user's replied and unanswered mail of
+        the last `days` days (Settings.PRIORITY_MODEL_TRAINING_DAYS), saves it and uses
+        it for the following requests. Only thread metadata is downloaded. Threads whose
+        earlier result is reused because they have no new messages keep their priority.
+        Returns the training stats.
+        """
+        if load_numpy() is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="The priority model needs numpy; install it with pip install smart_email_assistant[ml]."
+            )
+        await self._ensure_initialized()
+        days = days or Settings.PRIORITY_MODEL_TRAINING_DAYS
+        after = start_of_day(datetime.now() - timedelta(days=days))
+        raw_threads, _ = await self._gmail_call(self.gmail_client.get_threads_in_window, after, None, None, 'metadata')
+        email_threads = await self._parse_threads(raw_threads)
+        now_ms = int(datetime.now().timestamp() * 1000)
+        emails, labels = training_examples(
+            email_threads.values(), self.user_email_address, now_ms, Settings.PRIORITY_MODEL_MIN_AGE_DAYS * 86_400_000
+        )
+        if len(emails) < Settings.PRIORITY_MODEL_MIN_EXAMPLES or all(labels) or not any(labels):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Not enough history to train on: {len(emails)} messages, {sum(labels)} replied. "
+                       f"At least {Settings.PRIORITY_MODEL_MIN_EXAMPLES} messages with both replied and unanswered ones are needed."
+            )
+        classifier, stats = await asyncio.to_thread(PriorityClassifier.train, emails, labels)
+        await asyncio.to_thread(classifier.save, model_path(self.user_email_address))
+        self.thread_analyzer.priority_classifier = classifier
+        stats['threads'] = len(email_threads)
+        app_logger.info(f"Trained priority model on {days} days of mail: {stats}")
+        return stats
+
+    async def aclose(self):
+        """
+        Releases pooled network resources held by the assistant.
+        """
+        await self.async_gmail_client.aclose()
+        self.gmail_executor.shutdown(wait=False, cancel_futures=True)
+        self.parse_pool.shutdown()
+        shutdown_executor()
+        if self.response_cache is not None:
+            self.response_cache.close()
 
     def export_results(self, data, filename=None):
         """
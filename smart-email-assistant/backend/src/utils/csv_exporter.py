@@ -1,4 +1,3 @@
-import pandas as pd
 import os
 from datetime import datetime
 from typing import List, Dict, Any
@@ -30,6 +29,7 @@ class CSVExporter:
             os.makedirs(output_dir)
 
         try:
+            import pandas as pd # Imported on first export to keep startup fast
             df = pd.DataFrame(data)
             df.to_csv(filename, index=False, encoding='utf-8')
             print(f"Data successfully exported to {filename}")
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+@lru_cache(maxsize=4096)
+def parse_date_header(date_str: str) -> Optional[datetime]:
+    """
+    Parses an RFC 2822 Date header ("Fri, 8 Aug 2025 03:58:49 +0530 (IST)") into an
+    aware datetime, or None if it cannot be parsed. Dates without a usable zone are
+    taken as UTC. Results are memoized, since every message of a thread is looked
+    up again each time the thread is sorted.
+    """
+    if not date_str or date_str == 'N/A':
+        return None
+    try:
+        parsed = parsedate_to_datetime(date_str)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def timestamp_ms(internal_date, date_str: str = None) -> int:
+    """
+    Epoch milliseconds of a message: Gmail's internalDate when present, otherwise the
+    parsed Date header, otherwise 0 (unparseable dates sort first).
+    """
+    if internal_date:
+        try:
+            return int(internal_date)
+        except (TypeError, ValueError):
+            pass
+    parsed = parse_date_header(date_str)
+    return int(parsed.timestamp() * 1000) if parsed else 0
+
+def message_timestamp_ms(email_data) -> int:
+    """
+    Sort key for a parsed email (EmailRecord or dict) in epoch milliseconds.
+    EmailRecords compute it once and keep it.
+    """
+    cached = getattr(email_data, 'timestamp_ms', None)
+    if cached is not None:
+        return cached
+    return timestamp_ms(email_data.get('internalDate'), email_data.get('date'))
+
+def message_datetime(email_data) -> Optional[datetime]:
+    """The time a parsed email was received, in local time, or None if it is unknown."""
+    millis = message_timestamp_ms(email_data)
+    return datetime.fromtimestamp(millis / 1000).astimezone() if millis else None
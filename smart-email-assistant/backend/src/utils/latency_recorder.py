@@ -0,0 +1,29 @@
+from collections import Counter, deque
+from ..config.settings import Settings
+
+class LatencyRecorder:
+    """
+    Keeps the latency of the most recent calls to an external service and reports
+    percentiles over them, along with how many calls ended in each outcome
+    ("ok", "error", "timeout", ...) since startup.
+    """
+    def __init__(self, window: int = None):
+        self.samples = deque(maxlen=window or Settings.LATENCY_WINDOW) # Milliseconds, most recent calls
+        self.outcomes = Counter()
+
+    def record(self, milliseconds: float, outcome: str = "ok"):
+        self.samples.append(milliseconds)
+        self.outcomes[outcome] += 1
+
+    def report(self) -> dict:
+        """Returns {calls, outcomes, p50_ms, p95_ms, max_ms}; the percentiles cover the recent window."""
+        report = {'calls': sum(self.outcomes.values()), 'outcomes': dict(self.outcomes)}
+        if self.samples:
+            ordered = sorted(self.samples)
+            report['p50_ms'] = round(ordered[len(ordered) // 2], 1)
+            report['p95_ms'] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+            report['max_ms'] = round(ordered[-1], 1)
+        return report
+
+# Latency of Gemini calls, shared by every GeminiClient
+gemini_latency = LatencyRecorder()
@@ -1,48 +1,188 @@
+import atexit
+import json
 import logging
 import os
-from datetime import datetime
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from ..config.settings import Settings
+
+class _Truncated:
+    """Log argument that is cut to `limit` characters when, and only if, the record is formatted."""
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        if self.limit and len(text) > self.limit:
+            return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+        return text
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are. The stock QueueHandler formats the
+    message in the calling thread so records can be pickled; this queue never
+    leaves the process, so formatting is left to the listener thread.
+    """
+    def prepare(self, record):
+        return record
+
+class _RotatingFileHandler(RotatingFileHandler):
+    """
+    Rolls the log over when it reaches `max_bytes` or `interval` seconds after the first
+    record written to it. The file is only opened by the first record.
+    """
+    def __init__(self, filename, max_bytes, backup_count, interval):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.interval = interval
+        self.rollover_at = None # Set by the first record
+
+    def shouldRollover(self, record):
+        if self.interval:
+            now = time.time()
+            if self.rollover_at is None:
+                self.rollover_at = now + self.interval
+            elif now >= self.rollover_at:
+                return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line (Settings.LOG_FORMAT = "json")."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
 class AppLogger:
-    def __init__(self, log_dir="logs"):
-        self.log_dir = log_dir
+    """
+    Application logger. Callers only put records on an in-process queue; a
+    QueueListener thread formats them and writes them to a file that is rotated
+    by size and age. Pass %-style arguments (logger.info("Fetched %d threads", n))
+    rather than f-strings on per-message paths, so lines below the log level are
+    never formatted. Per-message events can be sampled (Settings.LOG_SAMPLE_RATES)
+    and their text fields are truncated (Settings.LOG_MAX_FIELD_CHARS).
+    Worker processes (see ParsePool) do not write the file themselves: they call
+    forward_to with the queue from worker_queue(), and this process writes their records.
+    """
+    def __init__(self, log_dir=None):
+        self.log_dir = log_dir or Settings.LOG_DIR
         os.makedirs(self.log_dir, exist_ok=True)
+        self.sample_rates = Settings.LOG_SAMPLE_RATES
+        self.max_field_chars = Settings.LOG_MAX_FIELD_CHARS
+        self.listener = None
+        self._worker_queue = None
+        self._worker_listener = None
         self.logger = self._setup_logger()
+        atexit.register(self.shutdown)
 
     def _setup_logger(self):
         logger = logging.getLogger('SmartEmailAssistant')
-        logger.setLevel(logging.INFO)
+        logger.setLevel(getattr(logging, Settings.LOG_LEVEL.upper(), logging.INFO))
+        logger.propagate = False
 
-        # Create handlers
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        log_file = os.path.join(self.log_dir, f"app_{current_date}.log")
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        # The file handler runs on the listener thread
+        log_file = os.path.join(self.log_dir, Settings.LOG_FILE_NAME)
+        file_handler = _RotatingFileHandler(log_file, Settings.LOG_MAX_BYTES, Settings.LOG_BACKUP_COUNT, Settings.LOG_ROTATE_INTERVAL)
+        if Settings.LOG_FORMAT == "json":
+            file_handler.setFormatter(JsonLinesFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers = [file_handler]
+        if Settings.LOG_TO_CONSOLE: # Records no longer propagate to the root logger's console handler
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            handlers.append(console_handler)
 
-        # Create formatters and add it to handlers
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-
-        # Add handlers to the logger
-        logger.addHandler(file_handler)
+        log_queue = queue.SimpleQueue()
+        self.listener = QueueListener(log_queue, *handlers)
+        self.listener.start()
+        logger.handlers = [_DeferredQueueHandler(log_queue)]
         return logger
 
+    def worker_queue(self):
+        """Queue that worker processes send their records to, forwarded to this process's log."""
+        if self._worker_queue is None:
+            import multiprocessing
+            self._worker_queue = multiprocessing.get_context('spawn').Queue()
+            self._worker_listener = QueueListener(self._worker_queue, *self.logger.handlers)
+            self._worker_listener.start()
+        return self._worker_queue
+
+    def forward_to(self, worker_queue):
+        """
+        Called in a worker process: sends records to the parent's worker_queue() instead of
+        writing the log file, which is not safe to share between processes.
+        """
+        self.shutdown()
+        self.logger.handlers = [QueueHandler(worker_queue)] # Formats records so they can be pickled
+
+    def shutdown(self):
+        """Writes the queued records and stops the listener threads."""
+        if self._worker_listener is not None:
+            self._worker_listener.stop()
+            self._worker_listener = None
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    @property
+    def debug_enabled(self) -> bool:
+        """For debug lines whose arguments are expensive to build."""
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def _sampled(self, event) -> bool:
+        rate = self.sample_rates.get(event, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def _field(self, value):
+        return _Truncated(value, self.max_field_chars)
+
     def log_email(self, email_data):
-        self.logger.info(f"EMAIL_RECEIVED: ID={email_data.get('id')}, Subject='{email_data.get('subject')}', Sender='{email_data.get('sender')}', Date='{email_data.get('date')}', Snippet='{email_data.get('snippet')}'")
-        self.logger.debug(f"EMAIL_BODY: {email_data.get('body')}")
+        if self.logger.isEnabledFor(logging.INFO) and self._sampled('EMAIL_RECEIVED'):
+            self.logger.info(
+                "EMAIL_RECEIVED: ID=%s, Subject='%s', Sender='%s', Date='%s', Snippet='%s'",
+                email_data.get('id'), self._field(email_data.get('subject')), email_data.get('sender'),
+                email_data.get('date'), self._field(email_data.get('snippet')), extra={'event': 'EMAIL_RECEIVED'}
+            )
+        if self.logger.isEnabledFor(logging.DEBUG) and self._sampled('EMAIL_BODY'): # Avoid decoding the body just to drop the log line
+            self.logger.debug("EMAIL_BODY: %s", self._field(email_data.get('body')), extra={'event': 'EMAIL_BODY'})
 
     def log_response(self, original_email_id, response_text, recipient):
-        self.logger.info(f"EMAIL_RESPONSE_SENT: OriginalEmailID={original_email_id}, Recipient='{recipient}', Response='{response_text}'")
+        if self.logger.isEnabledFor(logging.INFO) and self._sampled('EMAIL_RESPONSE_SENT'):
+            self.logger.info(
+                "EMAIL_RESPONSE_SENT: OriginalEmailID=%s, Recipient='%s', Response='%s'",
+                original_email_id, recipient, self._field(response_text), extra={'event': 'EMAIL_RESPONSE_SENT'}
+            )
 
-    def info(self, message):
-        self.logger.info(message)
+    def info(self, message, *args, **kwargs):
+        self.logger.info(message, *args, **kwargs)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def warning(self, message, *args, **kwargs):
+        self.logger.warning(message, *args, **kwargs)
 
-    def error(self, message):
-        self.logger.error(message)
+    def error(self, message, *args, **kwargs):
+        self.logger.error(message, *args, **kwargs)
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, *args, **kwargs):
+        self.logger.debug(message, *args, **kwargs)
 
 # Global logger instance
 logger = AppLogger()
@@ -0,0 +1,32 @@
+import time
+from .logger import logger
+
+class StartupTimer:
+    """
+    Tracks cold-start latency: how long the API module takes to import, to finish
+    its startup hook (including the optional warm-up) and to serve its first
+    response. Phases are recorded in milliseconds since the import started.
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.marks = {}
+
+    def start(self, started_at: float = None):
+        """Resets the timer, optionally to a perf_counter() value taken earlier."""
+        self.started_at = started_at or time.perf_counter()
+        self.marks = {}
+
+    def mark(self, phase: str):
+        """Records that `phase` finished now. Only the first mark of a phase counts."""
+        if phase not in self.marks:
+            self.marks[phase] = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def report(self) -> dict:
+        """Returns {phase: milliseconds since import started}."""
+        return dict(self.marks)
+
+    def log_report(self):
+        logger.info(f"Startup timing (ms since import): {self.marks}")
+
+# Global startup timer instance
+startup_timer = StartupTimer()